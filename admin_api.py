@@ -3,12 +3,31 @@
 提供用户数据查看和统计分析功能
 """
 
-from fastapi import APIRouter, HTTPException, Query
-from typing import List, Optional, Dict, Any
+import asyncio
+import csv
+import os
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from typing import List, Optional, Dict, Any, get_args
 from datetime import date, datetime, timedelta
-from pydantic import BaseModel
-import pymysql
-from config import DB_CONFIG
+from pydantic import BaseModel, ConfigDict, Field
+from config import EVENT_CONFIG, JOB_CONFIG, RESCORE_CONFIG
+from models import (
+    FGRPredictionRequest, FGRNeonatalPredictionRequest,
+    MaternalCOXPredictionRequest, NeonatalCOXPredictionRequest,
+    PatientGeneralInfoRequest, PatientLabImagingRequest,
+    PatientHomeMonitoringRequest
+)
+from serialization import FastJSONResponse, dumps, patient_rows_response
+import event_bus
+import jobs
+import database
+from prediction_audit import RESCORED_TABLES, SOURCE_CLINICIAN, SOURCE_RESCORE, prediction_source
+import cohort_query
+from fan_out import Queries, fan_out
+import file_store
+from table_versions import check_conditional
+from utils import to_thread
 
 # 创建路由器
 admin_router = APIRouter(prefix="/admin", tags=["后台管理"])
@@ -24,36 +43,135 @@ class StatisticsResponse(BaseModel):
     total_predictions: int
     data_by_date: List[Dict[str, Any]]
     prediction_distribution: Dict[str, int]
+    # 超时或失败而缺失的查询（部分结果）
+    missing: List[str] = []
 
 class PatientDetailResponse(BaseModel):
     general_info: Optional[Dict[str, Any]]
     lab_imaging: List[Dict[str, Any]]
     home_monitoring: List[Dict[str, Any]]
     predictions: List[Dict[str, Any]]
+    missing: List[str] = []
+
+class RiskDistributionResponse(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+
+    model_type: str
+    total: int
+    min: Optional[float]
+    max: Optional[float]
+    mean: Optional[float]
+    histogram: List[Dict[str, Any]]
+    percentiles: Dict[str, Optional[float]]
+    threshold_counts: Dict[str, int]
+
+# 预测结果表映射
+PREDICTION_TABLES = {
+    'fgr': 'model_fgr_params',
+    'fgr_neonatal': 'model_fgr_neonatal_params',
+    'maternal_cox': 'model_maternal_cox_params',
+    'neonatal_cox': 'model_neonatal_cox_params'
+}
+
+# 患者数据表
+PATIENT_TABLES = [
+    'patient_general_info',
+    'patient_lab_imaging',
+    'patient_home_monitoring'
+]
+
+# 预测结果表对应的请求模型（用于字段白名单）
+PREDICTION_REQUEST_MODELS = {
+    'fgr': FGRPredictionRequest,
+    'fgr_neonatal': FGRNeonatalPredictionRequest,
+    'maternal_cox': MaternalCOXPredictionRequest,
+    'neonatal_cox': NeonatalCOXPredictionRequest
+}
+
+# 预测来源参数 -> prediction_source 的 source；默认只统计人工预测，批量重新评分的记录需显式指定
+PREDICTION_SOURCES = {'clinician': SOURCE_CLINICIAN, 'rescore': SOURCE_RESCORE, 'all': None}
+SOURCE_QUERY_DESCRIPTION = "预测来源: clinician（人工预测，默认）, rescore（批量重新评分）, all"
+
+def parse_source(source: str) -> Optional[str]:
+    if source not in PREDICTION_SOURCES:
+        raise HTTPException(status_code=400, detail="无效的预测来源（可选 clinician、rescore、all）")
+    return PREDICTION_SOURCES[source]
+
+# 风险分布的细粒度分桶数（预测值范围 0-100，分辨率 0.1）
+DISTRIBUTION_FINE_BUCKETS = 1000
 
 # 数据库连接函数
 def get_db_connection():
-    """获取数据库连接"""
-    try:
-        connection = pymysql.connect(**DB_CONFIG)
-        return connection
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"数据库连接失败: {str(e)}")
+    """从连接池获取数据库连接，用完后在 finally 中调用 database.close_db_connection() 归还"""
+    connection = database.get_db_connection()
+    if not connection:
+        raise HTTPException(status_code=500, detail="数据库连接失败")
+    return connection
+
+# 字段投影（稀疏字段集）
+def _projection_columns(model: type, table_alias: str = "") -> Dict[str, str]:
+    """
+    由请求模型生成“字段名 -> SELECT表达式”白名单，文件字段只返回是否存在
+    （文件保存在 BLOB 列或文件存储中，后者记录在 {字段}_sha256 列）
+    """
+    prefix = f"{table_alias}." if table_alias else ""
+    columns = {}
+    for name, field in model.model_fields.items():
+        if bytes in get_args(field.annotation):
+            columns[f"{name}_status"] = (
+                f"CASE WHEN {prefix}{name} IS NOT NULL OR {prefix}{name}_sha256 IS NOT NULL "
+                f"THEN '有文件' ELSE '无文件' END as {name}_status"
+            )
+        else:
+            columns[name] = f"{prefix}{name}"
+    return columns
+
+GENERAL_INFO_COLUMNS = _projection_columns(PatientGeneralInfoRequest)
+LAB_IMAGING_COLUMNS = _projection_columns(PatientLabImagingRequest)
+HOME_MONITORING_COLUMNS = _projection_columns(PatientHomeMonitoringRequest)
+
+def parse_fields(fields: Optional[str], allowed: Dict[str, str]) -> Optional[List[str]]:
+    """解析并校验逗号分隔的 fields 参数，未指定时返回 None"""
+    if not fields:
+        return None
+
+    requested = [name.strip() for name in fields.split(",") if name.strip()]
+    invalid = [name for name in requested if name not in allowed]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"无效的字段: {', '.join(invalid)}")
+
+    # 去重并保持顺序
+    return list(dict.fromkeys(requested))
+
+def build_select_list(requested: Optional[List[str]], columns: Dict[str, str], table_alias: str = "") -> str:
+    """生成SELECT列表，始终包含 id 和 created_at"""
+    prefix = f"{table_alias}." if table_alias else ""
+    names = requested if requested is not None else list(columns)
+    return ", ".join([f"{prefix}id"] + [columns[name] for name in names] + [f"{prefix}created_at"])
 
 # 1. 患者基本信息管理接口
 @admin_router.get("/patients/general-info", response_model=List[PatientDataResponse])
 async def get_patient_general_info(
+    request: Request,
     page: int = Query(1, ge=1, description="页码"),
     page_size: int = Query(20, ge=1, le=100, description="每页数量"),
     start_date: Optional[date] = Query(None, description="开始日期"),
     end_date: Optional[date] = Query(None, description="结束日期"),
     age_min: Optional[int] = Query(None, ge=0, description="最小年龄"),
-    age_max: Optional[int] = Query(None, ge=0, description="最大年龄")
+    age_max: Optional[int] = Query(None, ge=0, description="最大年龄"),
+    fields: Optional[str] = Query(None, description="返回字段（逗号分隔）")
 ):
     """获取患者基本信息列表"""
+    not_modified, cache_headers = check_conditional(request, ["patient_general_info"])
+    if not_modified:
+        return not_modified
+    
+    select_list = build_select_list(parse_fields(fields, GENERAL_INFO_COLUMNS), GENERAL_INFO_COLUMNS)
+    
+    connection = None
     try:
         connection = get_db_connection()
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
+        cursor = database.dict_cursor(connection)
         
         # 构建查询条件
         where_conditions = []
@@ -82,13 +200,7 @@ async def get_patient_general_info(
         
         # 查询数据
         sql = f"""
-        SELECT id, age, ethnicity, education, occupation, economic_status, 
-               height, pre_pregnancy_weight, pre_pregnancy_bmi, 
-               last_menstrual_period, gestational_weeks, 
-               pre_pregnancy_systolic, pre_pregnancy_diastolic, pre_pregnancy_map,
-               medical_history, gravidity, parity, uterine_surgery,
-               family_history, allergy_history, conception_method,
-               pregnancy_type, aspirin_use, complications, created_at
+        SELECT {select_list}
         FROM patient_general_info
         {where_clause}
         ORDER BY created_at DESC
@@ -99,35 +211,37 @@ async def get_patient_general_info(
         cursor.execute(sql, params)
         results = cursor.fetchall()
         
-        # 格式化响应
-        formatted_results = []
-        for row in results:
-            formatted_results.append(PatientDataResponse(
-                id=row['id'],
-                created_at=row['created_at'],
-                data=row
-            ))
-        
         cursor.close()
-        connection.close()
         
-        return formatted_results
+        # 直接编码为JSON字节，格式与 PatientDataResponse 一致
+        return patient_rows_response(results, headers=cache_headers)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"查询失败: {str(e)}")
+    finally:
+        database.close_db_connection(connection)
 
 # 2. 实验室检查数据管理接口
 @admin_router.get("/patients/lab-imaging", response_model=List[PatientDataResponse])
 async def get_patient_lab_imaging(
+    request: Request,
     page: int = Query(1, ge=1, description="页码"),
     page_size: int = Query(20, ge=1, le=100, description="每页数量"),
     start_date: Optional[date] = Query(None, description="开始日期"),
-    end_date: Optional[date] = Query(None, description="结束日期")
+    end_date: Optional[date] = Query(None, description="结束日期"),
+    fields: Optional[str] = Query(None, description="返回字段（逗号分隔）")
 ):
     """获取实验室检查数据列表"""
+    not_modified, cache_headers = check_conditional(request, ["patient_lab_imaging"])
+    if not_modified:
+        return not_modified
+    
+    select_list = build_select_list(parse_fields(fields, LAB_IMAGING_COLUMNS), LAB_IMAGING_COLUMNS)
+    
+    connection = None
     try:
         connection = get_db_connection()
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
+        cursor = database.dict_cursor(connection)
         
         # 构建查询条件
         where_conditions = []
@@ -148,14 +262,7 @@ async def get_patient_lab_imaging(
         
         # 查询数据
         sql = f"""
-        SELECT id, examination_date, ultrasound_date, rbc_count, wbc_count,
-               hemoglobin, platelet_count, hematocrit, platelet_volume,
-               urine_protein_qualitative, urine_cast, urine_protein_24h,
-               total_bilirubin, total_protein, albumin, alt, ast, total_bile_acid,
-               creatinine, urea, uric_acid, aptt, pt, inr, tt, fib, d_dimer,
-               fasting_glucose, glucose_1h, glucose_2h, plgf, sflt1, sflt1_plgf_ratio,
-               nt, uta_pi, ua_sd_ratio, ua_pi, ua_ri, mca_sd_ratio, mca_pi, mca_ri, cpr,
-               created_at
+        SELECT {select_list}
         FROM patient_lab_imaging
         {where_clause}
         ORDER BY created_at DESC
@@ -166,35 +273,37 @@ async def get_patient_lab_imaging(
         cursor.execute(sql, params)
         results = cursor.fetchall()
         
-        # 格式化响应
-        formatted_results = []
-        for row in results:
-            formatted_results.append(PatientDataResponse(
-                id=row['id'],
-                created_at=row['created_at'],
-                data=row
-            ))
-        
         cursor.close()
-        connection.close()
         
-        return formatted_results
+        # 直接编码为JSON字节，格式与 PatientDataResponse 一致
+        return patient_rows_response(results, headers=cache_headers)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"查询失败: {str(e)}")
+    finally:
+        database.close_db_connection(connection)
 
 # 3. 家庭监测数据管理接口
 @admin_router.get("/patients/home-monitoring", response_model=List[PatientDataResponse])
 async def get_patient_home_monitoring(
+    request: Request,
     page: int = Query(1, ge=1, description="页码"),
     page_size: int = Query(20, ge=1, le=100, description="每页数量"),
     start_date: Optional[date] = Query(None, description="开始日期"),
-    end_date: Optional[date] = Query(None, description="结束日期")
+    end_date: Optional[date] = Query(None, description="结束日期"),
+    fields: Optional[str] = Query(None, description="返回字段（逗号分隔）")
 ):
     """获取家庭监测数据列表"""
+    not_modified, cache_headers = check_conditional(request, ["patient_home_monitoring"])
+    if not_modified:
+        return not_modified
+    
+    select_list = build_select_list(parse_fields(fields, HOME_MONITORING_COLUMNS), HOME_MONITORING_COLUMNS)
+    
+    connection = None
     try:
         connection = get_db_connection()
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
+        cursor = database.dict_cursor(connection)
         
         # 构建查询条件
         where_conditions = []
@@ -215,11 +324,7 @@ async def get_patient_home_monitoring(
         
         # 查询数据（不包含文件内容）
         sql = f"""
-        SELECT id, home_monitoring_date, home_systolic, home_diastolic,
-               fetal_heart_rate, fetal_movement, home_sflt1_plgf_ratio,
-               CASE WHEN fetal_monitoring_file IS NOT NULL THEN '有文件' ELSE '无文件' END as fetal_monitoring_file_status,
-               CASE WHEN urine_test_file IS NOT NULL THEN '有文件' ELSE '无文件' END as urine_test_file_status,
-               created_at
+        SELECT {select_list}
         FROM patient_home_monitoring
         {where_clause}
         ORDER BY created_at DESC
@@ -230,70 +335,129 @@ async def get_patient_home_monitoring(
         cursor.execute(sql, params)
         results = cursor.fetchall()
         
-        # 格式化响应
-        formatted_results = []
-        for row in results:
-            formatted_results.append(PatientDataResponse(
-                id=row['id'],
-                created_at=row['created_at'],
-                data=row
-            ))
-        
         cursor.close()
-        connection.close()
         
-        return formatted_results
+        # 直接编码为JSON字节，格式与 PatientDataResponse 一致
+        return patient_rows_response(results, headers=cache_headers)
         
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"查询失败: {str(e)}")
+    finally:
+        database.close_db_connection(connection)
+
+# 家庭监测记录中的文件字段
+HOME_MONITORING_FILE_FIELDS = [
+    name for name, field in PatientHomeMonitoringRequest.model_fields.items() if bytes in get_args(field.annotation)
+]
+
+@admin_router.get("/patients/home-monitoring/{record_id}/files/{field}")
+async def download_home_monitoring_file(request: Request, record_id: int, field: str):
+    """
+    下载家庭监测记录中的文件：文件存储中压缩保存的文件在客户端支持该压缩方式时原样发送
+    （Content-Encoding: zstd/gzip），否则解压后发送；迁移前保存在 BLOB 列中的文件直接返回
+    """
+    if field not in HOME_MONITORING_FILE_FIELDS:
+        raise HTTPException(status_code=400, detail=f"无效的文件字段: {field}（可选 {', '.join(HOME_MONITORING_FILE_FIELDS)}）")
+
+    connection = None
+    try:
+        connection = get_db_connection()
+        cursor = database.dict_cursor(connection)
+        cursor.execute(f"""
+        SELECT h.{field} as blob_content, s.sha256, s.size, s.stored_size, s.encoding, s.content_type
+        FROM patient_home_monitoring h
+        LEFT JOIN stored_files s ON s.sha256 = h.{field}_sha256
+        WHERE h.id = %s
+        """, (record_id,))
+        row = cursor.fetchone()
+        cursor.close()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"查询失败: {str(e)}")
+    finally:
+        database.close_db_connection(connection)
+
+    if not row:
+        raise HTTPException(status_code=404, detail="记录不存在")
+    filename = f"home_monitoring_{record_id}_{field}"
+    if row["sha256"]:
+        stored = file_store.StoredFile(
+            row["sha256"], row["size"], row["content_type"], row["stored_size"], row["encoding"]
+        )
+        return file_store.file_response(stored, request.headers.get("accept-encoding", ""), filename)
+    if row["blob_content"] is not None:
+        return Response(
+            content=bytes(row["blob_content"]), media_type="application/octet-stream",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        )
+    raise HTTPException(status_code=404, detail="该记录没有此文件")
+
+@admin_router.get("/files/stats")
+async def get_file_compression_stats():
+    """文件存储的压缩统计：按压缩方式（zstd/gzip/identity）汇总文件数、原始大小、保存大小和压缩比"""
+    try:
+        by_encoding = await to_thread(file_store.compression_stats)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"查询失败: {str(e)}")
 
+    size = sum(item["size"] for item in by_encoding.values())
+    stored_size = sum(item["stored_size"] for item in by_encoding.values())
+    return {
+        "files": sum(item["files"] for item in by_encoding.values()),
+        "size": size,
+        "stored_size": stored_size,
+        "ratio": round(size / stored_size, 2) if stored_size else 1.0,
+        "by_encoding": by_encoding
+    }
+
 # 4. 预测结果管理接口
 @admin_router.get("/predictions", response_model=List[PatientDataResponse])
 async def get_predictions(
+    request: Request,
     model_type: Optional[str] = Query(None, description="模型类型: fgr, fgr_neonatal, maternal_cox, neonatal_cox"),
     page: int = Query(1, ge=1, description="页码"),
     page_size: int = Query(20, ge=1, le=100, description="每页数量"),
     start_date: Optional[date] = Query(None, description="开始日期"),
     end_date: Optional[date] = Query(None, description="结束日期"),
     min_prediction: Optional[float] = Query(None, ge=0, le=100, description="最小预测值"),
-    max_prediction: Optional[float] = Query(None, ge=0, le=100, description="最大预测值")
+    max_prediction: Optional[float] = Query(None, ge=0, le=100, description="最大预测值"),
+    fields: Optional[str] = Query(None, description="返回字段（逗号分隔，需指定 model_type）"),
+    source: str = Query('clinician', description=SOURCE_QUERY_DESCRIPTION)
 ):
     """获取预测结果列表"""
+    prediction_from = parse_source(source)
+    requested_fields = None
+    if fields:
+        if model_type not in PREDICTION_REQUEST_MODELS:
+            raise HTTPException(status_code=400, detail="指定 fields 时必须提供有效的 model_type")
+        prediction_columns = _projection_columns(PREDICTION_REQUEST_MODELS[model_type])
+        prediction_columns['prediction_result'] = 'prediction_result'
+        if PREDICTION_TABLES[model_type] in RESCORED_TABLES:
+            prediction_columns['source'] = 'source'
+        requested_fields = parse_fields(fields, prediction_columns)
+    
+    if model_type and model_type in PREDICTION_TABLES:
+        version_tables = [PREDICTION_TABLES[model_type]]
+    else:
+        version_tables = list(PREDICTION_TABLES.values())
+    not_modified, cache_headers = check_conditional(request, version_tables)
+    if not_modified:
+        return not_modified
+    
+    connection = None
     try:
         connection = get_db_connection()
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
+        cursor = database.dict_cursor(connection)
         
         # 根据模型类型选择表
-        table_mapping = {
-            'fgr': 'model_fgr_params',
-            'fgr_neonatal': 'model_fgr_neonatal_params',
-            'maternal_cox': 'model_maternal_cox_params',
-            'neonatal_cox': 'model_neonatal_cox_params'
-        }
-        
-        if model_type and model_type not in table_mapping:
+        if model_type and model_type not in PREDICTION_TABLES:
             raise HTTPException(status_code=400, detail="无效的模型类型")
         
         # 构建查询条件
         where_conditions = []
         params = []
         
-        if model_type:
-            # 如果指定了模型类型，只查询该模型
-            table_name = table_mapping[model_type]
-            sql = f"SELECT * FROM {table_name}"
-        else:
-            # 否则查询所有模型的结果
-            sql = """
-            SELECT 'fgr' as model_type, id, prediction_result, created_at FROM model_fgr_params
-            UNION ALL
-            SELECT 'fgr_neonatal' as model_type, id, prediction_result, created_at FROM model_fgr_neonatal_params
-            UNION ALL
-            SELECT 'maternal_cox' as model_type, id, prediction_result, created_at FROM model_maternal_cox_params
-            UNION ALL
-            SELECT 'neonatal_cox' as model_type, id, prediction_result, created_at FROM model_neonatal_cox_params
-            """
-        
         if start_date:
             where_conditions.append("created_at >= %s")
             params.append(start_date)
@@ -310,219 +474,527 @@ async def get_predictions(
             where_conditions.append("prediction_result <= %s")
             params.append(max_prediction)
         
-        if where_conditions:
-            sql += " WHERE " + " AND ".join(where_conditions)
-        
-        sql += " ORDER BY created_at DESC"
+        where_clause = " WHERE " + " AND ".join(where_conditions) if where_conditions else ""
         
         # 计算偏移量
         offset = (page - 1) * page_size
-        sql += f" LIMIT %s OFFSET %s"
-        params.extend([page_size, offset])
+        
+        if model_type:
+            # 如果指定了模型类型，只查询该模型
+            table_name = PREDICTION_TABLES[model_type]
+            if requested_fields is not None:
+                select_list = build_select_list(requested_fields, prediction_columns)
+            else:
+                select_list = "*"
+            sql = f"""
+            SELECT {select_list} FROM {prediction_source(table_name, prediction_from)}
+            {where_clause}
+            ORDER BY created_at DESC
+            LIMIT %s OFFSET %s
+            """
+            params.extend([page_size, offset])
+        else:
+            # 否则查询所有模型的结果：条件和分页下推到每个模型（各自按 created_at 索引取前 offset + page_size 条），
+            # 再合并排序，不需要读取和排序全部预测记录
+            branches = [
+                f"""SELECT * FROM (
+                    SELECT '{current_type}' as model_type, id, prediction_result, created_at
+                    FROM {prediction_source(table_name, prediction_from)}
+                    {where_clause}
+                    ORDER BY created_at DESC
+                    LIMIT %s
+                ) {current_type}_recent"""
+                for current_type, table_name in PREDICTION_TABLES.items()
+            ]
+            sql = f"""
+            SELECT * FROM ({" UNION ALL ".join(branches)}) predictions
+            ORDER BY created_at DESC
+            LIMIT %s OFFSET %s
+            """
+            params = (params + [offset + page_size]) * len(branches) + [page_size, offset]
         
         cursor.execute(sql, params)
         results = cursor.fetchall()
         
-        # 格式化响应
-        formatted_results = []
-        for row in results:
-            formatted_results.append(PatientDataResponse(
-                id=row['id'],
-                created_at=row['created_at'],
-                data=row
-            ))
-        
         cursor.close()
-        connection.close()
         
-        return formatted_results
+        # 直接编码为JSON字节，格式与 PatientDataResponse 一致
+        return patient_rows_response(results, headers=cache_headers)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"查询失败: {str(e)}")
+    finally:
+        database.close_db_connection(connection)
 
 # 5. 统计分析接口
+def statistics_queries(start_date: Optional[date], end_date: Optional[date],
+                       source: Optional[str] = SOURCE_CLINICIAN) -> Queries:
+    """统计接口的查询：患者数、各模型预测数（按来源）和按日期的患者数，互不依赖，并发执行"""
+    # 构建日期条件
+    date_condition = ""
+    params = []
+    if start_date and end_date:
+        date_condition = "WHERE created_at BETWEEN %s AND %s"
+        params = [start_date, end_date]
+    elif start_date:
+        date_condition = "WHERE created_at >= %s"
+        params = [start_date]
+    elif end_date:
+        date_condition = "WHERE created_at <= %s"
+        params = [end_date]
+    
+    queries: Queries = {
+        "total_patients": (f"SELECT COUNT(*) as count FROM patient_general_info {date_condition}", params, False)
+    }
+    for model_type, table in PREDICTION_TABLES.items():
+        queries[model_type] = (f"SELECT COUNT(*) as count FROM {prediction_source(table, source)} {date_condition}", params, False)
+    queries["data_by_date"] = (f"""
+    SELECT DATE(created_at) as date, COUNT(*) as count
+    FROM patient_general_info
+    {date_condition}
+    GROUP BY DATE(created_at)
+    ORDER BY date DESC
+    LIMIT 30
+    """, params, True)
+    return queries
+
 @admin_router.get("/statistics", response_model=StatisticsResponse)
 async def get_statistics(
+    request: Request,
+    response: Response,
     start_date: Optional[date] = Query(None, description="开始日期"),
-    end_date: Optional[date] = Query(None, description="结束日期")
+    end_date: Optional[date] = Query(None, description="结束日期"),
+    source: str = Query('clinician', description=SOURCE_QUERY_DESCRIPTION)
 ):
     """获取统计数据"""
+    prediction_from = parse_source(source)
+    not_modified, cache_headers = check_conditional(request, ["patient_general_info"] + list(PREDICTION_TABLES.values()))
+    if not_modified:
+        return not_modified
+    
     try:
-        connection = get_db_connection()
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        
-        # 构建日期条件
-        date_condition = ""
-        params = []
-        if start_date and end_date:
-            date_condition = "WHERE created_at BETWEEN %s AND %s"
-            params = [start_date, end_date]
-        elif start_date:
-            date_condition = "WHERE created_at >= %s"
-            params = [start_date]
-        elif end_date:
-            date_condition = "WHERE created_at <= %s"
-            params = [end_date]
+        results, missing = await fan_out(statistics_queries(start_date, end_date, prediction_from), required=["total_patients"])
         
-        # 统计患者总数
-        cursor.execute(f"SELECT COUNT(*) as count FROM patient_general_info {date_condition}", params)
-        total_patients = cursor.fetchone()['count']
-        
-        # 统计预测总数
-        cursor.execute(f"SELECT COUNT(*) as count FROM model_fgr_params {date_condition}", params)
-        fgr_count = cursor.fetchone()['count']
-        
-        cursor.execute(f"SELECT COUNT(*) as count FROM model_fgr_neonatal_params {date_condition}", params)
-        fgr_neonatal_count = cursor.fetchone()['count']
-        
-        cursor.execute(f"SELECT COUNT(*) as count FROM model_maternal_cox_params {date_condition}", params)
-        maternal_cox_count = cursor.fetchone()['count']
-        
-        cursor.execute(f"SELECT COUNT(*) as count FROM model_neonatal_cox_params {date_condition}", params)
-        neonatal_cox_count = cursor.fetchone()['count']
-        
-        total_predictions = fgr_count + fgr_neonatal_count + maternal_cox_count + neonatal_cox_count
-        
-        # 按日期统计数据
-        cursor.execute(f"""
-        SELECT DATE(created_at) as date, COUNT(*) as count
-        FROM patient_general_info
-        {date_condition}
-        GROUP BY DATE(created_at)
-        ORDER BY date DESC
-        LIMIT 30
-        """, params)
-        data_by_date = cursor.fetchall()
-        
-        # 预测结果分布
+        # 预测结果分布（缺失的模型不计入）
         prediction_distribution = {
-            "fgr": fgr_count,
-            "fgr_neonatal": fgr_neonatal_count,
-            "maternal_cox": maternal_cox_count,
-            "neonatal_cox": neonatal_cox_count
+            model_type: results[model_type]['count'] for model_type in PREDICTION_TABLES if model_type in results
         }
         
-        cursor.close()
-        connection.close()
-        
+        # 部分结果不缓存
+        if not missing:
+            response.headers.update(cache_headers)
         return StatisticsResponse(
-            total_patients=total_patients,
-            total_predictions=total_predictions,
-            data_by_date=data_by_date,
-            prediction_distribution=prediction_distribution
+            total_patients=results["total_patients"]['count'],
+            total_predictions=sum(prediction_distribution.values()),
+            data_by_date=results.get("data_by_date", []),
+            prediction_distribution=prediction_distribution,
+            missing=missing
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"统计失败: {str(e)}")
 
-# 6. 患者详细信息接口
-@admin_router.get("/patients/{patient_id}/detail", response_model=PatientDetailResponse)
-async def get_patient_detail(patient_id: int):
-    """获取患者详细信息"""
+def _interpolate_percentile(fine_counts: Dict[int, int], total: int, percentile: float,
+                            min_value: Optional[float], max_value: Optional[float]) -> Optional[float]:
+    """
+    根据细粒度直方图线性插值估算百分位数（误差不超过一个细分桶宽度），
+    结果限制在实际的 [最小值, 最大值] 内（桶内插值可能越过实际取值）
+    """
+    if total == 0:
+        return None
+
+    bucket_width = 100.0 / DISTRIBUTION_FINE_BUCKETS
+    target = total * percentile / 100.0
+    cumulative = 0
+    value = 100.0
+    for bucket in sorted(fine_counts):
+        count = fine_counts[bucket]
+        if cumulative + count >= target:
+            fraction = (target - cumulative) / count if count else 0.0
+            value = (bucket + fraction) * bucket_width
+            break
+        cumulative += count
+
+    if min_value is not None:
+        value = max(value, min_value)
+    if max_value is not None:
+        value = min(value, max_value)
+    return round(value, 4)
+
+# 5.1 风险分布接口
+@admin_router.get("/predictions/distribution", response_model=List[RiskDistributionResponse])
+async def get_prediction_distribution(
+    request: Request,
+    response: Response,
+    model_type: Optional[str] = Query(None, description="模型类型: fgr, fgr_neonatal, maternal_cox, neonatal_cox"),
+    start_date: Optional[date] = Query(None, description="开始日期"),
+    end_date: Optional[date] = Query(None, description="结束日期"),
+    bins: int = Query(20, ge=1, le=100, description="直方图分组数（需能整除1000）"),
+    percentiles: List[float] = Query([5, 25, 50, 75, 95], description="百分位数"),
+    thresholds: List[float] = Query([10, 30, 50], description="风险阈值（统计 >= 阈值的数量）"),
+    source: str = Query('clinician', description=SOURCE_QUERY_DESCRIPTION)
+):
+    """获取预测风险值分布（直方图、百分位数、阈值计数），全部在SQL中聚合"""
+    prediction_from = parse_source(source)
+    if model_type and model_type not in PREDICTION_TABLES:
+        raise HTTPException(status_code=400, detail="无效的模型类型")
+
+    if DISTRIBUTION_FINE_BUCKETS % bins != 0:
+        raise HTTPException(status_code=400, detail=f"bins 必须能整除 {DISTRIBUTION_FINE_BUCKETS}")
+
+    if any(p < 0 or p > 100 for p in percentiles):
+        raise HTTPException(status_code=400, detail="百分位数必须在 0-100 之间")
+
+    model_types = [model_type] if model_type else list(PREDICTION_TABLES)
+    not_modified, cache_headers = check_conditional(
+        request, [PREDICTION_TABLES[current_type] for current_type in model_types]
+    )
+    if not_modified:
+        return not_modified
+
+    connection = None
     try:
         connection = get_db_connection()
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        
-        # 获取基本信息
-        cursor.execute("SELECT * FROM patient_general_info WHERE id = %s", (patient_id,))
-        general_info = cursor.fetchone()
-        
-        # 获取实验室检查数据
-        cursor.execute("SELECT * FROM patient_lab_imaging ORDER BY created_at DESC")
-        lab_imaging = cursor.fetchall()
-        
-        # 获取家庭监测数据（不包含文件内容）
-        cursor.execute("""
-        SELECT id, home_monitoring_date, home_systolic, home_diastolic,
-               fetal_heart_rate, fetal_movement, home_sflt1_plgf_ratio,
-               CASE WHEN fetal_monitoring_file IS NOT NULL THEN '有文件' ELSE '无文件' END as fetal_monitoring_file_status,
-               CASE WHEN urine_test_file IS NOT NULL THEN '有文件' ELSE '无文件' END as urine_test_file_status,
-               created_at
+        cursor = database.dict_cursor(connection)
+
+        # 构建查询条件
+        where_conditions = ["prediction_result IS NOT NULL"]
+        params = []
+
+        if start_date:
+            where_conditions.append("created_at >= %s")
+            params.append(start_date)
+
+        if end_date:
+            where_conditions.append("created_at <= %s")
+            params.append(end_date)
+
+        where_clause = " WHERE " + " AND ".join(where_conditions)
+
+        results = []
+
+        for current_type in model_types:
+            table_name = PREDICTION_TABLES[current_type]
+
+            # 汇总值与阈值计数
+            threshold_columns = "".join(
+                f", SUM(CASE WHEN prediction_result >= %s THEN 1 ELSE 0 END) as t{i}"
+                for i in range(len(thresholds))
+            )
+            cursor.execute(f"""
+            SELECT COUNT(*) as total, MIN(prediction_result) as min_value,
+                   MAX(prediction_result) as max_value, AVG(prediction_result) as mean_value
+                   {threshold_columns}
+            FROM {prediction_source(table_name, prediction_from)}
+            {where_clause}
+            """, list(thresholds) + params)
+            summary = cursor.fetchone()
+            total = summary['total'] or 0
+
+            # 细粒度直方图（最多 DISTRIBUTION_FINE_BUCKETS 行）
+            cursor.execute(f"""
+            SELECT CASE
+                       WHEN prediction_result < 0 THEN 0
+                       WHEN prediction_result >= 100 THEN %s
+                       ELSE FLOOR(prediction_result * %s / 100)
+                   END as bucket,
+                   COUNT(*) as count
+            FROM {prediction_source(table_name, prediction_from)}
+            {where_clause}
+            GROUP BY bucket
+            """, [DISTRIBUTION_FINE_BUCKETS - 1, DISTRIBUTION_FINE_BUCKETS] + params)
+            fine_counts = {int(row['bucket']): int(row['count']) for row in cursor.fetchall()}
+
+            # 合并为请求的分组
+            bin_width = 100.0 / bins
+            fine_per_bin = DISTRIBUTION_FINE_BUCKETS // bins
+            bin_counts = [0] * bins
+            for bucket, count in fine_counts.items():
+                bin_counts[bucket // fine_per_bin] += count
+
+            histogram = [
+                {
+                    "lower": round(i * bin_width, 4),
+                    "upper": round((i + 1) * bin_width, 4),
+                    "count": bin_counts[i]
+                }
+                for i in range(bins)
+            ]
+
+            min_value = float(summary['min_value']) if summary['min_value'] is not None else None
+            max_value = float(summary['max_value']) if summary['max_value'] is not None else None
+            results.append(RiskDistributionResponse(
+                model_type=current_type,
+                total=total,
+                min=min_value,
+                max=max_value,
+                mean=float(summary['mean_value']) if summary['mean_value'] is not None else None,
+                histogram=histogram,
+                percentiles={
+                    f"p{p:g}": _interpolate_percentile(fine_counts, total, p, min_value, max_value)
+                    for p in percentiles
+                },
+                threshold_counts={
+                    f"{t:g}": int(summary[f"t{i}"] or 0)
+                    for i, t in enumerate(thresholds)
+                }
+            ))
+
+        cursor.close()
+
+        response.headers.update(cache_headers)
+        return results
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"统计失败: {str(e)}")
+    finally:
+        database.close_db_connection(connection)
+
+# 6. 患者详细信息接口
+def detail_queries(patient_id: int, general_select: str = "*", lab_select: str = "*",
+                   home_select: Optional[str] = None) -> Queries:
+    """患者详情的查询：基本信息、检查、监测（不包含文件内容）和 COX 模型预测，互不依赖，并发执行"""
+    home_select = home_select or build_select_list(None, HOME_MONITORING_COLUMNS)
+    queries: Queries = {
+        "general_info": (f"SELECT {general_select} FROM patient_general_info WHERE id = %s", (patient_id,), False),
+        "lab_imaging": (f"""
+        SELECT {lab_select}
+        FROM patient_lab_imaging
+        WHERE patient_id = %s
+        ORDER BY created_at DESC
+        """, (patient_id,), True),
+        "home_monitoring": (f"""
+        SELECT {home_select}
         FROM patient_home_monitoring
+        WHERE patient_id = %s
         ORDER BY created_at DESC
-        """)
-        home_monitoring = cursor.fetchall()
+        """, (patient_id,), True)
+    }
+    for model_type in ("maternal_cox", "neonatal_cox"):
+        table = PREDICTION_TABLES[model_type]
+        queries[model_type] = (f"""
+        SELECT '{model_type}' as model_type, {table}.*
+        FROM {prediction_source(table)}
+        WHERE patient_id = %s
+        ORDER BY created_at DESC
+        """, (patient_id,), True)
+    return queries
+
+@admin_router.get("/patients/{patient_id}/detail", response_model=PatientDetailResponse)
+async def get_patient_detail(
+    patient_id: int,
+    request: Request,
+    response: Response,
+    fields: Optional[str] = Query(None, description="返回字段（逗号分隔，可混合基本信息/检查/监测字段）")
+):
+    """获取患者详细信息"""
+    not_modified, cache_headers = check_conditional(request, PATIENT_TABLES + list(PREDICTION_TABLES.values()))
+    if not_modified:
+        return not_modified
+    
+    requested_fields = parse_fields(
+        fields, {**GENERAL_INFO_COLUMNS, **LAB_IMAGING_COLUMNS, **HOME_MONITORING_COLUMNS}
+    )
+    
+    # 按所属表拆分请求字段；未指定 fields 时保持原有查询列
+    if requested_fields is not None:
+        general_select = build_select_list(
+            [name for name in requested_fields if name in GENERAL_INFO_COLUMNS], GENERAL_INFO_COLUMNS
+        )
+        lab_select = build_select_list(
+            [name for name in requested_fields if name in LAB_IMAGING_COLUMNS], LAB_IMAGING_COLUMNS
+        )
+        home_select = build_select_list(
+            [name for name in requested_fields if name in HOME_MONITORING_COLUMNS], HOME_MONITORING_COLUMNS
+        )
+    else:
+        general_select = "*"
+        lab_select = "*"
+        home_select = build_select_list(None, HOME_MONITORING_COLUMNS)
+    
+    try:
+        results, missing = await fan_out(
+            detail_queries(patient_id, general_select, lab_select, home_select), required=["general_info"]
+        )
         
-        # 获取预测结果
+        # 获取预测结果（FGR 类预测的输入不关联患者，只有 COX 模型预测记录 patient_id）
         predictions = []
+        for model_type in ("maternal_cox", "neonatal_cox"):
+            predictions.extend(results.get(model_type, []))
         
-        # FGR预测
-        cursor.execute("SELECT 'fgr' as model_type, * FROM model_fgr_params ORDER BY created_at DESC")
-        fgr_predictions = cursor.fetchall()
-        predictions.extend(fgr_predictions)
-        
-        # FGR-Neonatal预测
-        cursor.execute("SELECT 'fgr_neonatal' as model_type, * FROM model_fgr_neonatal_params ORDER BY created_at DESC")
-        fgr_neonatal_predictions = cursor.fetchall()
-        predictions.extend(fgr_neonatal_predictions)
-        
-        # Maternal-COX预测
-        cursor.execute("SELECT 'maternal_cox' as model_type, * FROM model_maternal_cox_params ORDER BY created_at DESC")
-        maternal_cox_predictions = cursor.fetchall()
-        predictions.extend(maternal_cox_predictions)
-        
-        # Neonatal-COX预测
-        cursor.execute("SELECT 'neonatal_cox' as model_type, * FROM model_neonatal_cox_params ORDER BY created_at DESC")
-        neonatal_cox_predictions = cursor.fetchall()
-        predictions.extend(neonatal_cox_predictions)
-        
-        cursor.close()
-        connection.close()
-        
+        if not missing:
+            response.headers.update(cache_headers)
         return PatientDetailResponse(
-            general_info=general_info,
-            lab_imaging=lab_imaging,
-            home_monitoring=home_monitoring,
-            predictions=predictions
+            general_info=results["general_info"],
+            lab_imaging=results.get("lab_imaging", []),
+            home_monitoring=results.get("home_monitoring", []),
+            predictions=predictions,
+            missing=missing
         )
         
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"查询失败: {str(e)}")
+
+# 6.1 人群筛选接口
+class CohortFilter(BaseModel):
+    field: str
+    op: str
+    value: Any = None
+
+class CohortQueryRequest(BaseModel):
+    filters: List[CohortFilter] = []
+    count_only: bool = False
+    limit: int = Field(50, ge=1, le=500)
+    cursor: Optional[str] = None
+    fields: Optional[str] = None
+
+# 人群筛选结果的患者字段（含派生特征）
+COHORT_COLUMNS = {
+    **_projection_columns(PatientGeneralInfoRequest, "p"),
+    'gestational_days': 'p.gestational_days',
+    'derived_bmi': 'p.derived_bmi',
+    'derived_map': 'p.derived_map'
+}
+
+@admin_router.post("/cohort/query")
+async def query_cohort(request: CohortQueryRequest):
+    """
+    按声明式条件筛选患者，字段形如 patient.age、lab.sflt1_plgf_ratio、home.derived_map、
+    maternal_cox.prediction_result（白名单见 cohort_query.COHORT_SOURCES），
+    运算符 eq/ne/gt/gte/lt/lte/between/in/is_null/not_null。
+    count_only 只返回人数；否则按患者ID分页，next_cursor 传回 cursor 取下一页
+    """
+    filters = [(f.field, f.op, f.value) for f in request.filters]
+    after_id = cohort_query.decode_cursor(request.cursor)
+    if request.count_only:
+        sql, params = cohort_query.count_query(filters)
+    else:
+        select_list = build_select_list(parse_fields(request.fields, COHORT_COLUMNS), COHORT_COLUMNS, "p")
+        sql, params = cohort_query.page_query(filters, select_list, after_id, request.limit)
+    
+    connection = None
+    try:
+        connection = get_db_connection()
+        cursor = database.dict_cursor(connection)
+        cursor.execute(sql, params)
+        results = cursor.fetchall()
+        cursor.close()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"查询失败: {str(e)}")
+    finally:
+        database.close_db_connection(connection)
+    
+    if request.count_only:
+        return FastJSONResponse({"count": results[0]['count']})
+    
+    next_cursor = None
+    if len(results) == request.limit:
+        next_cursor = cohort_query.encode_cursor(results[-1]['id'])
+    return FastJSONResponse({
+        "items": [{"id": row['id'], "created_at": row['created_at'], "data": row} for row in results],
+        "next_cursor": next_cursor
+    })
 
 # 7. 数据导出接口
+def build_export_query(
+    start_date: Optional[date],
+    end_date: Optional[date],
+    fields: Optional[str]
+) -> tuple:
+    """构建患者数据导出查询，返回 (SQL, 参数)，同步导出与后台导出任务共用"""
+    general_columns = _projection_columns(PatientGeneralInfoRequest, "p")
+    lab_columns = _projection_columns(PatientLabImagingRequest, "l")
+    home_columns = _projection_columns(PatientHomeMonitoringRequest, "h")
+    requested_fields = parse_fields(fields, {**general_columns, **lab_columns, **home_columns})
+    
+    if requested_fields is not None:
+        # 只查询请求的列，且只连接用到的表
+        select_list = build_select_list(
+            requested_fields, {**general_columns, **lab_columns, **home_columns}, "p"
+        )
+        join_lab = any(name in lab_columns for name in requested_fields)
+        join_home = any(name in home_columns for name in requested_fields)
+    else:
+        select_list = """p.*, 
+               l.examination_date, l.rbc_count, l.wbc_count, l.hemoglobin,
+               h.home_monitoring_date, h.home_systolic, h.home_diastolic"""
+        join_lab = True
+        join_home = True
+    
+    # 每名患者一行，关联最近一次实验室检查和家庭监测（按 (patient_id, 日期) 索引取一条）
+    joins = ""
+    if join_lab:
+        joins += """
+    LEFT JOIN patient_lab_imaging l ON l.id = (
+        SELECT li.id FROM patient_lab_imaging li
+        WHERE li.patient_id = p.id
+        ORDER BY li.examination_date DESC, li.id DESC
+        LIMIT 1
+    )"""
+    if join_home:
+        joins += """
+    LEFT JOIN patient_home_monitoring h ON h.id = (
+        SELECT hm.id FROM patient_home_monitoring hm
+        WHERE hm.patient_id = p.id
+        ORDER BY hm.home_monitoring_date DESC, hm.id DESC
+        LIMIT 1
+    )"""
+    
+    # 构建查询条件
+    where_conditions = []
+    params = []
+    
+    if start_date:
+        where_conditions.append("p.created_at >= %s")
+        params.append(start_date)
+    
+    if end_date:
+        where_conditions.append("p.created_at <= %s")
+        params.append(end_date)
+    
+    where_clause = " WHERE " + " AND ".join(where_conditions) if where_conditions else ""
+    
+    sql = f"""
+    SELECT {select_list}
+    FROM patient_general_info p
+    {joins}
+    {where_clause}
+    ORDER BY p.created_at DESC
+    """
+    return sql, params
+
 @admin_router.get("/export/patients")
 async def export_patients(
+    request: Request,
+    response: Response,
     format: str = Query("csv", description="导出格式: csv, json"),
     start_date: Optional[date] = Query(None, description="开始日期"),
-    end_date: Optional[date] = Query(None, description="结束日期")
+    end_date: Optional[date] = Query(None, description="结束日期"),
+    fields: Optional[str] = Query(None, description="导出字段（逗号分隔，可混合基本信息/检查/监测字段）")
 ):
-    """导出患者数据"""
+    """导出患者数据（数据量大时请使用 POST /admin/jobs/export 后台导出）"""
+    not_modified, cache_headers = check_conditional(request, PATIENT_TABLES)
+    if not_modified:
+        return not_modified
+    
+    sql, params = build_export_query(start_date, end_date, fields)
+    
+    connection = None
     try:
         connection = get_db_connection()
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        
-        # 构建查询条件
-        where_conditions = []
-        params = []
-        
-        if start_date:
-            where_conditions.append("created_at >= %s")
-            params.append(start_date)
-        
-        if end_date:
-            where_conditions.append("created_at <= %s")
-            params.append(end_date)
-        
-        where_clause = " WHERE " + " AND ".join(where_conditions) if where_conditions else ""
+        cursor = database.dict_cursor(connection)
         
         # 查询数据
-        sql = f"""
-        SELECT p.*, 
-               l.examination_date, l.rbc_count, l.wbc_count, l.hemoglobin,
-               h.home_monitoring_date, h.home_systolic, h.home_diastolic
-        FROM patient_general_info p
-        LEFT JOIN patient_lab_imaging l ON p.id = l.id
-        LEFT JOIN patient_home_monitoring h ON p.id = h.id
-        {where_clause}
-        ORDER BY p.created_at DESC
-        """
-        
         cursor.execute(sql, params)
         results = cursor.fetchall()
         
         cursor.close()
-        connection.close()
         
+        response.headers.update(cache_headers)
         if format.lower() == "json":
             return {"data": results}
         else:
@@ -531,11 +1003,14 @@ async def export_patients(
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"导出失败: {str(e)}")
+    finally:
+        database.close_db_connection(connection)
 
 # 8. 系统健康检查接口
 @admin_router.get("/health")
 async def admin_health_check():
     """后台管理系统健康检查"""
+    connection = None
     try:
         connection = get_db_connection()
         cursor = connection.cursor()
@@ -558,12 +1033,12 @@ async def admin_health_check():
             table_stats[table] = count
         
         cursor.close()
-        connection.close()
         
         return {
             "status": "healthy",
             "database": "connected",
             "table_statistics": table_stats,
+            "connection_pool": database.pool.stats(),
             "timestamp": datetime.now().isoformat()
         }
         
@@ -572,4 +1047,225 @@ async def admin_health_check():
             "status": "unhealthy",
             "error": str(e),
             "timestamp": datetime.now().isoformat()
-        } 
\ No newline at end of file
+        } 
+    finally:
+        database.close_db_connection(connection)
+
+# 9. 实时事件推送接口（SSE）
+EVENT_TYPES = ['general_info', 'lab_imaging', 'home_monitoring', 'prediction']
+
+def _format_sse(event: Dict[str, Any]) -> bytes:
+    """编码为 text/event-stream 格式"""
+    payload = dumps({"type": event['type'], "time": event['time'], "data": event['data']})
+    return b"id: %s\nevent: %s\ndata: %s\n\n" % (
+        event['id'].encode('utf-8'), event['type'].encode('utf-8'), payload
+    )
+
+@admin_router.get("/events/stream")
+async def stream_events(
+    request: Request,
+    types: str = Query("home_monitoring,prediction", description="事件类型（逗号分隔）: general_info, lab_imaging, home_monitoring, prediction"),
+    min_prediction: float = Query(EVENT_CONFIG['high_risk_threshold'], ge=0, le=100, description="只推送预测值不低于该阈值的预测结果")
+):
+    """推送新写入的患者记录和高风险预测结果，替代轮询列表接口"""
+    event_types = {name.strip() for name in types.split(",") if name.strip()}
+    invalid = event_types - set(EVENT_TYPES)
+    if invalid or not event_types:
+        raise HTTPException(status_code=400, detail=f"无效的事件类型: {', '.join(sorted(invalid))}")
+
+    subscription = event_bus.subscribe(event_types, min_prediction)
+
+    # 断线重连时补发错过的事件；Last-Event-ID 来自其它 worker、重启前的进程或已超出补发范围时
+    # 无法按序号补发，先推送 resync 事件，客户端收到后通过列表接口重新加载
+    last_event_id = request.headers.get("last-event-id")
+    missed = []
+    resync = None
+    if last_event_id:
+        replay = event_bus.recent_events(last_event_id)
+        if replay is None:
+            resync = {"id": event_bus.current_id(), "type": "resync", "time": datetime.now(),
+                      "data": {"last_event_id": last_event_id}}
+        else:
+            missed = [e for e in replay if subscription.accepts(e)]
+
+    async def event_generator():
+        try:
+            yield b"retry: 3000\n\n"
+            if resync:
+                yield _format_sse(resync)
+            last_sent_seq = 0
+            for event in missed:
+                last_sent_seq = event['seq']
+                yield _format_sse(event)
+            while True:
+                if await request.is_disconnected():
+                    break
+                try:
+                    event = await asyncio.wait_for(
+                        subscription.queue.get(), timeout=EVENT_CONFIG['keepalive_seconds']
+                    )
+                except asyncio.TimeoutError:
+                    # 心跳，保持连接并检测断开
+                    yield b": keepalive\n\n"
+                    continue
+                if event is None:
+                    # 服务停机，客户端按 retry 间隔重连到其它实例
+                    break
+                # 跳过已作为补发事件发送过的记录
+                if event['seq'] <= last_sent_seq:
+                    continue
+                yield _format_sse(event)
+        finally:
+            event_bus.unsubscribe(subscription)
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# 10. 后台任务接口
+EXPORT_MEDIA_TYPES = {
+    'csv': 'text/csv',
+    'json': 'application/json'
+}
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', errors='replace')
+    return value
+
+def _run_export_job(context: jobs.JobContext, params: Dict[str, Any]) -> str:
+    """流式读取导出结果并写入文件，不在内存中保留全部行"""
+    start_date = date.fromisoformat(params['start_date']) if params.get('start_date') else None
+    end_date = date.fromisoformat(params['end_date']) if params.get('end_date') else None
+    sql, query_params = build_export_query(start_date, end_date, params.get('fields'))
+
+    connection = database.pool.acquire()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"SELECT COUNT(*) FROM ({sql}) t", query_params)
+        total = cursor.fetchone()[0]
+        cursor.close()
+
+        # 无缓冲游标：逐行从数据库读取
+        cursor = database.stream_cursor(connection)
+        cursor.execute(sql, query_params)
+        written = 0
+        with open(context.result_path, 'w', encoding='utf-8', newline='') as f:
+            if params['format'] == 'json':
+                f.write('[')
+            writer = None
+            for row in cursor:
+                if params['format'] == 'json':
+                    f.write((',' if written else '') + dumps(row).decode('utf-8'))
+                else:
+                    if writer is None:
+                        writer = csv.DictWriter(f, fieldnames=list(row.keys()))
+                        writer.writeheader()
+                    writer.writerow({key: _csv_value(value) for key, value in row.items()})
+                written += 1
+                if written % JOB_CONFIG['progress_interval'] == 0:
+                    context.update_progress(written / max(total, 1), f"已导出 {written}/{total} 行")
+            if params['format'] == 'json':
+                f.write(']')
+        cursor.close()
+    finally:
+        database.pool.release(connection)
+
+    return f"导出完成，共 {written} 行"
+
+def _run_rescore_job(context: jobs.JobContext, params: Dict[str, Any]) -> str:
+    """执行批量重新评分，完成后将汇总写入结果文件"""
+    # rescore 依赖 NumPy，只在执行任务时导入，避免拖慢服务启动
+    import rescore
+
+    def on_progress(processed: int, total: int) -> None:
+        context.update_progress(processed / max(total, 1), f"已评分 {processed}/{total} 名患者")
+
+    summary = rescore.run(
+        params['chunk_size'], params['workers'], params['resume'],
+        RESCORE_CONFIG['checkpoint_path'], progress=on_progress
+    )
+    with open(context.result_path, 'wb') as f:
+        f.write(dumps(summary))
+    return f"评分完成，共 {summary['patients']} 名患者"
+
+jobs.register_job_type('export_patients', _run_export_job)
+jobs.register_job_type('rescore', _run_rescore_job)
+
+class RescoreJobRequest(BaseModel):
+    chunk_size: int = RESCORE_CONFIG['chunk_size']
+    workers: int = RESCORE_CONFIG['workers']
+    resume: bool = True
+
+def _submit(job_type: str, params: Dict[str, Any], result_suffix: str) -> Dict[str, Any]:
+    try:
+        return jobs.submit_job(job_type, params, result_suffix)
+    except jobs.JobQueueFull:
+        raise HTTPException(status_code=429, detail="排队中的后台任务过多，请稍后再试")
+
+def _get_job_or_404(job_id: str) -> Dict[str, Any]:
+    job = jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"任务 {job_id} 不存在")
+    return job
+
+@admin_router.post("/jobs/export", status_code=202)
+async def submit_export_job(
+    format: str = Query("csv", description="导出格式: csv, json"),
+    start_date: Optional[date] = Query(None, description="开始日期"),
+    end_date: Optional[date] = Query(None, description="结束日期"),
+    fields: Optional[str] = Query(None, description="导出字段（逗号分隔，可混合基本信息/检查/监测字段）")
+):
+    """提交后台导出任务，立即返回任务ID"""
+    format = format.lower()
+    if format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="无效的导出格式，可选: csv, json")
+    # 提交前校验字段，避免任务执行时才失败
+    build_export_query(start_date, end_date, fields)
+
+    params = {
+        "format": format,
+        "start_date": start_date.isoformat() if start_date else None,
+        "end_date": end_date.isoformat() if end_date else None,
+        "fields": fields
+    }
+    return _submit('export_patients', params, format)
+
+@admin_router.post("/jobs/rescore", status_code=202)
+async def submit_rescore_job(request: RescoreJobRequest = RescoreJobRequest()):
+    """提交批量重新评分任务，立即返回任务ID"""
+    return _submit('rescore', request.model_dump(), 'json')
+
+@admin_router.get("/jobs")
+async def list_jobs(limit: int = Query(50, ge=1, le=500, description="返回数量")):
+    """最近的后台任务"""
+    return {"jobs": jobs.list_jobs(limit)}
+
+@admin_router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """查询任务状态与进度"""
+    return _get_job_or_404(job_id)
+
+@admin_router.get("/jobs/{job_id}/result")
+async def download_job_result(job_id: str):
+    """下载任务结果文件"""
+    job = _get_job_or_404(job_id)
+    if job['status'] != jobs.SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"任务尚未完成，当前状态: {job['status']}")
+    if not job['result_path'] or not os.path.exists(job['result_path']):
+        raise HTTPException(status_code=410, detail="结果文件已不存在")
+
+    suffix = os.path.splitext(job['result_path'])[1].lstrip('.')
+    return FileResponse(
+        job['result_path'],
+        media_type=EXPORT_MEDIA_TYPES.get(suffix, 'application/octet-stream'),
+        filename=f"{job['job_type']}_{job_id}.{suffix}"
+    )
+
+@admin_router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """取消任务（运行中的任务在下一次汇报进度时停止）"""
+    _get_job_or_404(job_id)
+    return jobs.cancel_job(job_id)
\ No newline at end of file
@@ -0,0 +1,727 @@
+#!/usr/bin/env python3
+"""
+性能基准测试脚本
+
+用法:
+    python benchmarks.py serialization [--rows 100] [--repeat 200]
+    python benchmarks.py import-time [--budget-ms 1200] [--runs 5]
+    python benchmarks.py audit-storage [--rows 100000] [--distinct 20000]
+    python benchmarks.py predict-throughput [--requests 4000] [--backend sqlite]
+    python benchmarks.py admin-fanout [--patients 20000] [--repeat 20] [--backend sqlite]
+    python benchmarks.py upload-stream [--size-mb 100] [--chunk-kb 64]
+    python benchmarks.py file-compression [--minutes 40] [--repeat 5]
+    python benchmarks.py response-compression [--rows 20,100,1000] [--repeat 50]
+    python benchmarks.py rate-limit [--keys 2000000] [--capacity 1048576]
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import List, get_args
+
+from models import PatientLabImagingRequest
+
+def _timed(func, repeat: int) -> float:
+    """执行 repeat 次并返回单次平均耗时（毫秒）"""
+    func()  # 预热
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+def _synthetic_lab_rows(count: int) -> List[dict]:
+    """生成与 /admin/patients/lab-imaging 查询结果结构相同的模拟数据行"""
+    rows = []
+    base_time = datetime(2024, 1, 1, 8, 30, 0)
+    for i in range(count):
+        row = {'id': i + 1}
+        for name, field in PatientLabImagingRequest.model_fields.items():
+            field_types = get_args(field.annotation)
+            if date in field_types:
+                row[name] = date(2024, 1, 1) + timedelta(days=i % 200)
+            elif str in field_types:
+                row[name] = random.choice(['阴性', '+', '++'])
+            else:
+                row[name] = Decimal(f"{random.uniform(0, 300):.2f}")
+        row['created_at'] = base_time + timedelta(minutes=i, microseconds=i * 7)
+        rows.append(row)
+    return rows
+
+def bench_serialization(args):
+    """对比管理端列表接口的原序列化路径与快速序列化路径"""
+    from pydantic import TypeAdapter
+    from admin_api import PatientDataResponse
+    from serialization import patient_rows_response, orjson
+
+    rows = _synthetic_lab_rows(args.rows)
+    adapter = TypeAdapter(List[PatientDataResponse])
+
+    def current_path() -> bytes:
+        # 逐行构造模型 -> response_model 校验 -> jsonable -> json.dumps
+        models = [
+            PatientDataResponse(id=row['id'], created_at=row['created_at'], data=row)
+            for row in rows
+        ]
+        validated = adapter.validate_python(models, from_attributes=True)
+        content = adapter.dump_python(validated, mode="json")
+        return json.dumps(
+            content, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+        ).encode("utf-8")
+
+    def fast_path() -> bytes:
+        return patient_rows_response(rows).body
+
+    # 两条路径的输出必须一致
+    if json.loads(current_path()) != json.loads(fast_path()):
+        raise SystemExit("❌ 快速序列化路径输出与原路径不一致")
+
+    current_ms = _timed(current_path, args.repeat)
+    fast_ms = _timed(fast_path, args.repeat)
+
+    print(f"行数: {args.rows}, 重复: {args.repeat}, 编码器: {'orjson' if orjson else 'json'}")
+    print(f"原路径:   {current_ms:.3f} ms/页")
+    print(f"快速路径: {fast_ms:.3f} ms/页")
+    print(f"加速比:   {current_ms / fast_ms:.1f}x")
+
+# 服务启动时不应导入的模块：重型依赖只在批量评分等任务中按需导入，后台管理API在首次访问时导入，
+# PyMySQL 在首次连接数据库时导入
+LAZY_MODULES = ('numpy', 'scipy', 'admin_api', 'pymysql')
+
+def _measure_import(module: str) -> dict:
+    """在新的解释器中用 -X importtime 导入模块，返回总耗时（毫秒）与各模块自身耗时"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"❌ 导入 {module} 失败:\n{result.stderr[-2000:]}")
+
+    self_times = {}
+    total_ms = None
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        self_times[name] = int(self_us) / 1000
+        if name == module:
+            total_ms = int(cumulative_us) / 1000
+    return {"total_ms": total_ms, "self_times": self_times}
+
+def bench_import_time(args):
+    """检查冷启动导入 main 的耗时（多次的中位数）是否在预算内，且未导入重型依赖；超出时以非零状态退出"""
+    from config import APP_CONFIG
+
+    budget_ms = args.budget_ms or APP_CONFIG['import_budget_ms']
+    # 取多次的中位数：单次耗时受机器负载影响较大，最小值又会掩盖真实的增长
+    runs = sorted((_measure_import(args.module) for _ in range(args.runs)), key=lambda run: run["total_ms"])
+    median = runs[len(runs) // 2]
+
+    print(f"模块: {args.module}, 次数: {args.runs}, 预算: {budget_ms} ms")
+    all_runs = ", ".join(f"{run['total_ms']:.0f}" for run in runs)
+    print(f"导入耗时中位数: {median['total_ms']:.1f} ms（各次: {all_runs}）")
+    print("自身耗时最多的模块:")
+    for name, ms in sorted(median["self_times"].items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {ms:8.1f} ms  {name}")
+
+    failures = []
+    if median["total_ms"] > budget_ms:
+        failures.append(f"导入耗时中位数 {median['total_ms']:.1f} ms 超出预算 {budget_ms} ms")
+    eager = sorted({name for run in runs for name in LAZY_MODULES if name in run["self_times"]})
+    if eager:
+        failures.append(f"启动时导入了应按需导入的模块: {', '.join(eager)}")
+
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        raise SystemExit(1)
+    print("✅ 冷启动导入耗时在预算内")
+
+def _synthetic_cox_inputs(count: int) -> List[tuple]:
+    """生成 Maternal-COX 预测记录的取值（与 PREDICTION_COLUMNS 顺序一致）"""
+    rows = []
+    for _ in range(count):
+        plt, cr, up24, alt, sbpmax = (
+            random.randint(50, 400), round(random.uniform(40, 150), 1), round(random.uniform(0, 5), 2),
+            random.randint(5, 200), random.randint(110, 190)
+        )
+        rows.append((
+            random.randint(1, count), plt, cr, up24, alt, sbpmax, random.random() < 0.2,
+            random.randint(1, 30), round(random.uniform(0, 100), 2), round(random.uniform(-3, 3), 6),
+            round(random.uniform(0, 0.1), 6), round(random.uniform(0, 1), 6)
+        ))
+    return rows
+
+def _sqlite_sizes(connection) -> dict:
+    """各数据表与索引占用的字节数（SQLite dbstat）"""
+    return dict(connection.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name").fetchall())
+
+def bench_audit_storage(args):
+    """
+    用合成数据对比预测记录 full 与 compact 两种存储方式的数据和索引大小（SQLite 模拟，
+    MySQL 中可对比 information_schema.TABLES 的 data_length / index_length）
+    """
+    import sqlite3
+    from prediction_audit import PREDICTION_COLUMNS, input_hash
+
+    table = 'model_maternal_cox_params'
+    columns = PREDICTION_COLUMNS[table]
+    # 重复使用的输入集中在少数记录上（医生反复用同一组输入重新计算）
+    distinct = _synthetic_cox_inputs(args.distinct)
+    weights = [1 / (rank + 1) for rank in range(len(distinct))]
+    picks = random.choices(range(len(distinct)), weights=weights, k=args.rows)
+    # 时间戳按整数秒保存，接近 MySQL TIMESTAMP 的 4 字节存储
+    base_time = int(datetime(2024, 1, 1).timestamp())
+    events = [(distinct[i], base_time + n * 30) for n, i in enumerate(picks)]
+
+    column_sql = ", ".join(f"{column} NUMERIC" for column in columns)
+    placeholders = ", ".join(["?"] * len(columns))
+
+    full = sqlite3.connect(":memory:")
+    full.execute(f"CREATE TABLE {table} (id INTEGER PRIMARY KEY, {column_sql}, created_at INTEGER)")
+    full.execute(f"CREATE INDEX idx_patient ON {table} (patient_id, created_at)")
+    full.executemany(
+        f"INSERT INTO {table} ({', '.join(columns)}, created_at) VALUES ({placeholders}, ?)",
+        [(*values, created_at) for values, created_at in events]
+    )
+    full.commit()
+
+    compact = sqlite3.connect(":memory:")
+    compact.execute(f"""
+    CREATE TABLE {table} (id INTEGER PRIMARY KEY, {column_sql}, created_at INTEGER,
+                          input_hash BLOB UNIQUE, use_count INTEGER, last_used_at INTEGER)
+    """)
+    compact.execute(f"CREATE INDEX idx_patient ON {table} (patient_id, created_at)")
+    compact.execute("""
+    CREATE TABLE prediction_events (id INTEGER PRIMARY KEY, model_type INTEGER, params_id INTEGER, created_at INTEGER)
+    """)
+    compact.execute("CREATE INDEX idx_prediction_events_created ON prediction_events (model_type, created_at)")
+    ids = {}
+    for values, timestamp in events:
+        key = input_hash(table, values)
+        if key in ids:
+            compact.execute(
+                f"UPDATE {table} SET use_count = use_count + 1, last_used_at = ? WHERE id = ?", (timestamp, ids[key])
+            )
+        else:
+            ids[key] = compact.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}, created_at, input_hash, use_count, last_used_at) "
+                f"VALUES ({placeholders}, ?, ?, 1, ?)", (*values, timestamp, key, timestamp)
+            ).lastrowid
+        compact.execute(
+            "INSERT INTO prediction_events (model_type, params_id, created_at) VALUES (3, ?, ?)",
+            (ids[key], timestamp)
+        )
+    compact.commit()
+
+    # 两种方式读出的预测次数必须一致
+    restored = compact.execute(
+        f"SELECT COUNT(*) FROM prediction_events e JOIN {table} p ON p.id = e.params_id"
+    ).fetchone()[0]
+    if restored != args.rows:
+        raise SystemExit(f"❌ compact 方式还原的记录数 {restored} 与写入数 {args.rows} 不一致")
+
+    full_sizes, compact_sizes = _sqlite_sizes(full), _sqlite_sizes(compact)
+    data_names = {table, 'prediction_events'}
+
+    def totals(sizes: dict):
+        data = sum(size for name, size in sizes.items() if name in data_names)
+        index = sum(size for name, size in sizes.items() if name not in data_names and name != 'sqlite_schema')
+        return data, index
+
+    full_data, full_index = totals(full_sizes)
+    compact_data, compact_index = totals(compact_sizes)
+    print(f"预测次数: {args.rows}, 不同输入: {len(ids)}（重复率 {1 - len(ids) / args.rows:.1%}）")
+    print(f"{'':10}{'数据':>12}{'索引':>12}{'合计':>12}")
+    print(f"{'full':10}{full_data / 1024:>10.0f}KB{full_index / 1024:>10.0f}KB"
+          f"{(full_data + full_index) / 1024:>10.0f}KB")
+    print(f"{'compact':10}{compact_data / 1024:>10.0f}KB{compact_index / 1024:>10.0f}KB"
+          f"{(compact_data + compact_index) / 1024:>10.0f}KB")
+    print(f"compact 节省: 数据 {1 - compact_data / full_data:.1%}，索引 {1 - compact_index / full_index:.1%}，"
+          f"合计 {1 - (compact_data + compact_index) / (full_data + full_index):.1%}")
+    print("各表/索引:")
+    for name, size in sorted(compact_sizes.items(), key=lambda item: -item[1]):
+        print(f"  {size / 1024:8.0f} KB  {name}")
+
+# 四个预测接口的示例请求体
+PREDICT_PAYLOADS = {
+    '/predict/fgr': {
+        "preterm": True, "lmp_date": "2024-01-01", "diagnosis_date": "2024-07-01", "hypertension": True,
+        "nst": False, "weight_growth": True, "umbilical_flow": False
+    },
+    '/predict/fgr-neonatal': {
+        "anc_visits": 6, "umbilical_flow": True, "pe_gestation": False, "delivery_gestation": True,
+        "fetal_growth": False
+    },
+    '/predict/maternal-cox': {
+        "plt": 120, "cr": 70, "up24": 1.5, "alt": 30, "sbpmax": 165, "pdas": True, "cox1_time": 7
+    },
+    '/predict/neonatal-cox': {
+        "lmp_date": "2024-01-01", "admission_date": "2024-07-20", "gda_group": 1, "cox2_time": 7,
+        "nst": False, "sbp_admission": 160, "dbp_admission": 100, "cr2": 65
+    }
+}
+
+def bench_predict_throughput(args):
+    """
+    对比预测接口快速路径与 FastAPI 路由的单核吞吐量：在一个事件循环中依次直接调用 ASGI 应用
+    （不含网络和服务器开销），预测结果照常写入数据库
+    """
+    import asyncio
+    import tempfile
+
+    if args.backend == 'sqlite':
+        os.environ['DB_BACKEND'] = 'sqlite'
+        os.environ['DB_SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='bench_'), 'bench.sqlite3')
+    # 所有请求来自同一客户端，关闭限流
+    os.environ['RATE_LIMIT'] = 'false'
+    from config import APP_CONFIG
+    from main import app
+
+    requests = [(path.encode(), json.dumps(body).encode()) for path, body in PREDICT_PAYLOADS.items()]
+
+    async def call(path: bytes, body: bytes) -> tuple:
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST',
+            'scheme': 'http', 'path': path.decode(), 'raw_path': path, 'root_path': '', 'query_string': b'',
+            'headers': [(b'host', b'bench'), (b'content-type', b'application/json'),
+                        (b'content-length', str(len(body)).encode())],
+            'client': ('127.0.0.1', 50000), 'server': ('bench', 80)
+        }
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        await app(scope, receive, send)
+        return messages[0]['status'], b''.join(m.get('body', b'') for m in messages[1:])
+
+    async def run(count: int) -> float:
+        start = time.perf_counter()
+        for i in range(count):
+            await call(*requests[i % len(requests)])
+        return count / (time.perf_counter() - start)
+
+    async def compare():
+        results = {}
+        for fast in (False, True):
+            APP_CONFIG['fast_predict'] = fast
+            responses = [await call(*request) for request in requests]
+            if any(status != 200 for status, _ in responses):
+                raise SystemExit(f"❌ 预测请求失败: {responses}")
+            results[fast] = [json.loads(body) for _, body in responses]
+            await run(args.requests // 10)  # 预热
+            results[fast, 'rps'] = await run(args.requests)
+        # 两条路径的响应内容必须一致
+        if results[False] != results[True]:
+            raise SystemExit("❌ 快速路径响应与 FastAPI 路由不一致")
+        return results[False, 'rps'], results[True, 'rps']
+
+    route_rps, fast_rps = asyncio.run(compare())
+    print(f"请求数: {args.requests}（4 个预测接口轮流），存储: {args.backend}")
+    print(f"FastAPI 路由: {route_rps:8.0f} 请求/秒/核")
+    print(f"快速路径:     {fast_rps:8.0f} 请求/秒/核")
+    print(f"加速比:       {fast_rps / route_rps:.2f}x")
+
+def bench_admin_fanout(args):
+    """
+    对比统计和患者详情接口依次执行与并发执行子查询的耗时（取中位数）：子查询耗时之和是依次执行的下限，
+    最大值是并发执行的下限。mysql 后端须使用单独的空库（DB_DATABASE=...），数据由 query_plans.seed 写入
+    """
+    import asyncio
+    import statistics
+    import tempfile
+
+    if args.backend == 'sqlite':
+        os.environ['DB_SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='bench_'), 'bench.sqlite3')
+    os.environ['DB_BACKEND'] = args.backend
+    from config import FANOUT_CONFIG
+    from database import connect, pool
+    from fan_out import fan_out, run_query
+    from admin_api import detail_queries, statistics_queries
+    from query_plans import SEEDED_TABLES, analyze, seed
+
+    connection = connect()
+    cursor = connection.cursor()
+    cursor.execute("SELECT COUNT(*) FROM patient_general_info")
+    if cursor.fetchone()[0]:
+        raise SystemExit("❌ patient_general_info 已有数据，请使用单独的空库")
+    cursor.close()
+    seed(connection, args.patients)
+    analyze(connection, SEEDED_TABLES)
+    connection.close()
+
+    def median_ms(func) -> float:
+        func()  # 预热
+        samples = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            func()
+            samples.append((time.perf_counter() - start) * 1000)
+        return statistics.median(samples)
+
+    cases = {
+        "统计": statistics_queries(None, None),
+        "统计 近30天": statistics_queries(date.today() - timedelta(days=30), None),
+        "患者详情": detail_queries(1)
+    }
+    default_parallel = FANOUT_CONFIG['max_parallel']
+    pool.warm_up(default_parallel)
+    print(f"患者数: {args.patients}，存储: {args.backend}，每项执行 {args.repeat} 次取中位数（毫秒）")
+    print(f"{'接口':<12}{'子查询':>6}{'之和':>10}{'最大':>10}{'依次执行':>10}{'并发执行':>10}{'加速比':>8}")
+    loop = asyncio.new_event_loop()
+    try:
+        for name, queries in cases.items():
+            sub_queries = [median_ms(lambda query=query: run_query(*query)) for query in queries.values()]
+            latencies = {}
+            for parallel in (1, default_parallel):
+                FANOUT_CONFIG['max_parallel'] = parallel
+                latencies[parallel] = median_ms(lambda: loop.run_until_complete(fan_out(queries)))
+            FANOUT_CONFIG['max_parallel'] = default_parallel
+            print(f"{name:<12}{len(queries):>6}{sum(sub_queries):>12.2f}{max(sub_queries):>12.2f}"
+                  f"{latencies[1]:>12.2f}{latencies[default_parallel]:>12.2f}"
+                  f"{latencies[1] / latencies[default_parallel]:>9.2f}x")
+    finally:
+        loop.close()
+
+def bench_upload_stream(args):
+    """
+    上传 size_mb 的胎心监护文件：直接调用 ASGI 应用、按 chunk_kb 分块发送 multipart 请求体（不含网络开销），
+    统计端到端吞吐量和进程内存峰值（RSS）的增加；另外单独统计分块保存（store_upload）的吞吐量和
+    Python 分配内存峰值（tracemalloc），并与整体读入内存（原实现的 await file.read()）对比
+    """
+    import asyncio
+    import hashlib
+    import resource
+    import shutil
+    import tempfile
+    import tracemalloc
+
+    workdir = tempfile.mkdtemp(prefix='bench_upload_')
+    os.environ['DB_BACKEND'] = 'sqlite'
+    os.environ['DB_SQLITE_PATH'] = os.path.join(workdir, 'bench.sqlite3')
+    os.environ['UPLOAD_DIR'] = os.path.join(workdir, 'uploads')
+    from starlette.datastructures import Headers, UploadFile
+    from file_store import store_upload, stored_path
+    from main import app
+
+    size = args.size_mb * 1024 * 1024
+    chunk_size = args.chunk_kb * 1024
+    source = os.path.join(workdir, 'ctg.bin')
+    digest = hashlib.sha256()
+    with open(source, 'wb') as f:
+        for _ in range(args.size_mb):
+            block = os.urandom(1024 * 1024)
+            digest.update(block)
+            f.write(block)
+
+    boundary = b'benchboundary'
+    head = (b'--' + boundary + b'\r\nContent-Disposition: form-data; name="patient_id"\r\n\r\n1\r\n'
+            + b'--' + boundary + b'\r\nContent-Disposition: form-data; name="fetal_monitoring_file"; '
+            + b'filename="ctg.bin"\r\nContent-Type: application/octet-stream\r\n\r\n')
+    tail = b'\r\n--' + boundary + b'--\r\n'
+
+    async def upload() -> tuple:
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST',
+            'scheme': 'http', 'path': '/api/patient/home-monitoring', 'raw_path': b'/api/patient/home-monitoring',
+            'root_path': '', 'query_string': b'',
+            'headers': [(b'host', b'bench'), (b'content-type', b'multipart/form-data; boundary=' + boundary),
+                        (b'content-length', str(len(head) + size + len(tail)).encode())],
+            'client': ('127.0.0.1', 50000), 'server': ('bench', 80)
+        }
+        f = open(source, 'rb')
+        parts = iter([head])
+        messages = []
+
+        async def receive():
+            chunk = next(parts, None)
+            if chunk is None:
+                chunk = f.read(chunk_size)
+            return {'type': 'http.request', 'body': chunk or tail, 'more_body': bool(chunk)}
+
+        async def send(message):
+            messages.append(message)
+
+        try:
+            await app(scope, receive, send)
+        finally:
+            f.close()
+        return messages[0]['status'], b''.join(m.get('body', b'') for m in messages[1:])
+
+    def upload_file() -> UploadFile:
+        """与 multipart 解析结果相同的 UploadFile（超过 1 MB 的内容在临时文件中）"""
+        spooled = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+        with open(source, 'rb') as f:
+            while block := f.read(1024 * 1024):
+                spooled.write(block)
+        spooled.seek(0)
+        return UploadFile(spooled, size=size, filename='ctg.bin', headers=Headers())
+
+    def traced_peak(coro) -> tuple:
+        """执行协程，返回 (结果, 耗时, Python 分配内存峰值)"""
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = asyncio.run(coro)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return result, elapsed, peak
+
+    # 端到端：multipart 解析由 python-multipart 完成，不用 tracemalloc（逐次分配的追踪开销很大）
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    status, body = asyncio.run(upload())
+    elapsed = time.perf_counter() - start
+    rss_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+    if status != 200:
+        raise SystemExit(f"❌ 上传失败: {status} {body[:200]}")
+    with open(stored_path(digest.hexdigest()), 'rb') as f:
+        stored = hashlib.sha256()
+        while block := f.read(1024 * 1024):
+            stored.update(block)
+    if stored.hexdigest() != digest.hexdigest():
+        raise SystemExit("❌ 保存的文件与上传内容不一致")
+
+    async def whole_read(file: UploadFile) -> int:
+        return len(await file.read())
+
+    _, store_elapsed, store_peak = traced_peak(store_upload(upload_file(), 'fetal_monitoring_file'))
+    _, _, whole_peak = traced_peak(whole_read(upload_file()))
+
+    print(f"文件大小: {args.size_mb} MB，请求体分块: {args.chunk_kb} KB，存储: {os.environ['UPLOAD_DIR']}")
+    print(f"端到端上传:     {elapsed:6.2f} 秒，{args.size_mb / elapsed:6.0f} MB/s，"
+          f"进程内存峰值增加 {rss_growth / 1024:.1f} MB（含 multipart 解析）")
+    print(f"分块保存:       {store_elapsed:6.2f} 秒，{args.size_mb / store_elapsed:6.0f} MB/s，"
+          f"分配内存峰值 {store_peak / 1024 / 1024:.1f} MB")
+    print(f"整体读入内存:   分配内存峰值 {whole_peak / 1024 / 1024:.1f} MB（原实现的 file.read()）")
+    shutil.rmtree(workdir, ignore_errors=True)
+
+def _synthetic_ctg(minutes: int) -> dict:
+    """
+    生成典型的家庭监测文件：胎心监护导出的 CSV 和 XML（4 Hz 采样的胎心率、宫缩压力、胎动标记），
+    以及尿检试纸照片（JPEG 文件头 + 随机内容，近似已压缩的图像数据）
+    """
+    rng = random.Random(42)
+    fhr, toco = 140.0, 10.0
+    samples = []
+    for i in range(minutes * 60 * 4):
+        fhr = min(170.0, max(110.0, fhr + rng.gauss(0, 0.8)))
+        toco = min(100.0, max(0.0, toco + rng.gauss(0, 1.5)))
+        samples.append((i * 0.25, round(fhr), round(toco), int(rng.random() < 0.002)))
+
+    csv_text = "time_s,fhr_bpm,toco_mmhg,fetal_movement\n" + "".join(
+        f"{t:.2f},{f},{c},{m}\n" for t, f, c, m in samples
+    )
+    xml_text = ('<?xml version="1.0" encoding="UTF-8"?>\n<ctg device="home-monitor" rate_hz="4">\n' + "".join(
+        f'  <sample t="{t:.2f}"><fhr unit="bpm">{f}</fhr><toco unit="mmHg">{c}</toco>'
+        f'<movement>{m}</movement></sample>\n' for t, f, c, m in samples
+    ) + '</ctg>\n')
+    # Random.randbytes 需要 Python 3.9，按位生成同样可复现
+    jpeg = b'\xff\xd8\xff\xe0\x00\x10JFIF\x00' + rng.getrandbits(400 * 1024 * 8).to_bytes(400 * 1024, 'little')
+    return {'ctg.csv': csv_text.encode(), 'ctg.xml': xml_text.encode(), 'urine.jpg': jpeg}
+
+def bench_file_compression(args):
+    """
+    按上传时的写入路径（分块、试压缩选择方式、计算哈希）保存典型的胎心监护和尿检文件，
+    对比各压缩方式的压缩比、压缩和解压吞吐量，以及 UPLOAD_COMPRESSION=auto 时选择的方式
+    """
+    import io
+    from config import UPLOAD_CONFIG
+    from file_store import CODECS, MB, _FileWriter, choose_encoding
+
+    files = _synthetic_ctg(args.minutes)
+    chunk_size = UPLOAD_CONFIG['chunk_size']
+
+    def store(content: bytes) -> tuple:
+        buffer = io.BytesIO()
+        writer = _FileWriter(buffer)
+        for offset in range(0, len(content), chunk_size):
+            writer.write(content[offset:offset + chunk_size])
+        writer.finish()
+        return writer.encoding, buffer.getvalue()
+
+    def read(encoding: str, stored: bytes) -> bytes:
+        decompressor = CODECS[encoding][1]()
+        return b''.join(
+            decompressor.decompress(stored[offset:offset + 64 * 1024]) for offset in range(0, len(stored), 64 * 1024)
+        )
+
+    print(f"监护时长: {args.minutes} 分钟，写入分块: {chunk_size // 1024} KB，可用压缩方式: {', '.join(CODECS)}")
+    print(f"{'文件':<12}{'大小(KB)':>10}{'auto 选择':>12}{'方式':>8}{'保存(KB)':>10}{'压缩比':>8}"
+          f"{'压缩MB/s':>10}{'解压MB/s':>10}")
+    configured = UPLOAD_CONFIG['compression']
+    try:
+        for name, content in files.items():
+            UPLOAD_CONFIG['compression'] = 'auto'
+            chosen = choose_encoding(content[:chunk_size])[0]
+            for codec in CODECS:
+                UPLOAD_CONFIG['compression'] = codec
+                encoding, stored = store(content)
+                compress_ms = _timed(lambda: store(content), args.repeat)
+                if encoding == 'identity':
+                    print(f"{name:<12}{len(content) / 1024:>10.0f}{chosen:>12}{codec:>8}{len(stored) / 1024:>10.0f}"
+                          f"{'1.00':>8}{len(content) / MB / compress_ms * 1000:>10.0f}{'-':>10}（不压缩）")
+                    continue
+                if read(encoding, stored) != content:
+                    raise SystemExit(f"❌ {name} 使用 {codec} 解压后与原内容不一致")
+                decompress_ms = _timed(lambda: read(encoding, stored), args.repeat)
+                print(f"{name:<12}{len(content) / 1024:>10.0f}{chosen:>12}{codec:>8}{len(stored) / 1024:>10.0f}"
+                      f"{len(content) / len(stored):>8.2f}{len(content) / MB / compress_ms * 1000:>10.0f}"
+                      f"{len(content) / MB / decompress_ms * 1000:>10.0f}")
+    finally:
+        UPLOAD_CONFIG['compression'] = configured
+
+def bench_response_compression(args):
+    """
+    管理端检查数据列表（每行 40 多个字段）在不同页大小下的响应体大小和压缩耗时，
+    以及预测接口经过压缩中间件（只判断路径前缀）的额外耗时
+    """
+    import asyncio
+    from config import COMPRESSION_CONFIG
+    from response_compression import SUPPORTED_ENCODINGS, CompressionMiddleware, compress
+    from serialization import patient_rows_response
+
+    print(f"压缩方式: {', '.join(SUPPORTED_ENCODINGS)}，gzip 级别 {COMPRESSION_CONFIG['gzip_level']}，"
+          f"brotli 质量 {COMPRESSION_CONFIG['brotli_quality']}，"
+          f"线程池阈值 {COMPRESSION_CONFIG['thread_threshold'] // 1024} KB")
+    print(f"{'行数':>6}{'方式':>6}{'原始(KB)':>10}{'压缩后(KB)':>12}{'压缩比':>8}{'耗时(ms)':>10}")
+    for count in [int(value) for value in args.rows.split(',')]:
+        body = patient_rows_response(_synthetic_lab_rows(count)).body
+        for encoding in SUPPORTED_ENCODINGS:
+            compressed = compress(encoding, body)
+            elapsed = _timed(lambda: compress(encoding, body), args.repeat)
+            print(f"{count:>6}{encoding:>6}{len(body) / 1024:>10.1f}{len(compressed) / 1024:>12.1f}"
+                  f"{len(body) / len(compressed):>8.1f}{elapsed:>10.3f}")
+
+    prediction = b'{"success":true,"risk_score":0.1234,"risk_level":"low"}'
+
+    async def app(scope, receive, send):
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'application/json')]})
+        await send({'type': 'http.response.body', 'body': prediction})
+
+    scope = {'type': 'http', 'method': 'POST', 'path': '/predict/maternal-cox',
+             'headers': [(b'accept-encoding', b'gzip, deflate, br')]}
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        pass
+
+    async def calls(handler, count: int) -> float:
+        start = time.perf_counter()
+        for _ in range(count):
+            await handler(scope, receive, send)
+        return (time.perf_counter() - start) * 1e6 / count
+
+    count = args.repeat * 1000
+    direct_us = asyncio.run(calls(app, count))
+    wrapped_us = asyncio.run(calls(CompressionMiddleware(app), count))
+    print(f"预测接口经过压缩中间件的额外耗时: {wrapped_us - direct_us:.2f} µs/请求（不压缩）")
+
+def bench_rate_limit(args):
+    """
+    keys 个不同客户端依次请求（超过表容量，触发淘汰）：统计每次限流检查的耗时、状态表内存，
+    并与按客户端保存 (令牌数, 时间) 的 OrderedDict LRU 的内存占用对比
+    """
+    import tracemalloc
+    from collections import OrderedDict
+    from rate_limit import TokenBuckets
+
+    buckets = TokenBuckets(args.capacity)
+    now = time.time()
+    start = time.perf_counter()
+    for i in range(args.keys):
+        buckets.take(f"predict\0ip:10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}#{i >> 24}", 10, 30, now + i * 1e-6)
+    elapsed = time.perf_counter() - start
+
+    # 同一客户端连续请求：突发上限内放行，之后按速率放行
+    allowed = sum(buckets.take("predict\0key:bench", 10, 30, now + args.keys * 1e-6).allowed for _ in range(100))
+    if allowed != 30:
+        raise SystemExit(f"❌ 突发上限 30，实际放行 {allowed}")
+
+    sample = min(args.keys, 200000)
+    tracemalloc.start()
+    lru: OrderedDict = OrderedDict()
+    for i in range(sample):
+        lru[f"predict\0ip:10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}"] = (30.0, now + i)
+    dict_bytes = tracemalloc.get_traced_memory()[0] / sample
+    tracemalloc.stop()
+
+    print(f"客户端数: {args.keys}，表容量: {args.capacity} 个槽位")
+    print(f"限流检查:       {elapsed * 1e6 / args.keys:.2f} µs/次")
+    print(f"状态表内存:     {buckets.nbytes / 1024 / 1024:.1f} MB（固定，{buckets.nbytes / args.capacity:.0f} 字节/客户端），"
+          f"淘汰仍在限流中的客户端 {buckets.evictions} 个")
+    print(f"OrderedDict:    约 {dict_bytes:.0f} 字节/客户端，{args.capacity} 个客户端约 "
+          f"{dict_bytes * args.capacity / 1024 / 1024:.0f} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description="性能基准测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serialization_parser = subparsers.add_parser("serialization", help="管理端列表序列化")
+    serialization_parser.add_argument("--rows", type=int, default=100)
+    serialization_parser.add_argument("--repeat", type=int, default=200)
+    serialization_parser.set_defaults(func=bench_serialization)
+
+    import_parser = subparsers.add_parser("import-time", help="冷启动导入耗时预算检查")
+    import_parser.add_argument("--module", default="main")
+    import_parser.add_argument("--budget-ms", type=int, default=None, help="默认取 APP_IMPORT_BUDGET_MS")
+    import_parser.add_argument("--runs", type=int, default=5)
+    import_parser.add_argument("--top", type=int, default=10)
+    import_parser.set_defaults(func=bench_import_time)
+
+    audit_parser = subparsers.add_parser("audit-storage", help="预测记录 full/compact 存储大小对比")
+    audit_parser.add_argument("--rows", type=int, default=100000, help="预测次数")
+    audit_parser.add_argument("--distinct", type=int, default=20000, help="不同输入的数量")
+    audit_parser.set_defaults(func=bench_audit_storage)
+
+    predict_parser = subparsers.add_parser("predict-throughput", help="预测接口快速路径吞吐量")
+    predict_parser.add_argument("--requests", type=int, default=4000)
+    predict_parser.add_argument("--backend", choices=["sqlite", "mysql"], default="sqlite",
+                                help="预测结果写入的存储（sqlite 使用临时文件）")
+    predict_parser.set_defaults(func=bench_predict_throughput)
+
+    fanout_parser = subparsers.add_parser("admin-fanout", help="管理端子查询依次执行与并发执行的耗时")
+    fanout_parser.add_argument("--patients", type=int, default=20000)
+    fanout_parser.add_argument("--repeat", type=int, default=20)
+    fanout_parser.add_argument("--backend", choices=["sqlite", "mysql"], default="sqlite",
+                               help="sqlite 使用临时文件，mysql 使用 DB_CONFIG 指定的空库")
+    fanout_parser.set_defaults(func=bench_admin_fanout)
+
+    upload_parser = subparsers.add_parser("upload-stream", help="分块上传的吞吐量和内存峰值")
+    upload_parser.add_argument("--size-mb", type=int, default=100)
+    upload_parser.add_argument("--chunk-kb", type=int, default=64, help="请求体每次到达的大小")
+    upload_parser.set_defaults(func=bench_upload_stream)
+
+    compression_parser = subparsers.add_parser("file-compression", help="上传文件各压缩方式的压缩比和吞吐量")
+    compression_parser.add_argument("--minutes", type=int, default=40, help="模拟的胎心监护时长")
+    compression_parser.add_argument("--repeat", type=int, default=5)
+    compression_parser.set_defaults(func=bench_file_compression)
+
+    response_parser = subparsers.add_parser("response-compression", help="管理端响应压缩的压缩比和耗时")
+    response_parser.add_argument("--rows", default="20,100,1000", help="页大小（逗号分隔）")
+    response_parser.add_argument("--repeat", type=int, default=50)
+    response_parser.set_defaults(func=bench_response_compression)
+
+    rate_parser = subparsers.add_parser("rate-limit", help="限流检查耗时和状态表内存")
+    rate_parser.add_argument("--keys", type=int, default=2000000, help="不同客户端数")
+    rate_parser.add_argument("--capacity", type=int, default=1 << 20, help="状态表槽位数")
+    rate_parser.set_defaults(func=bench_rate_limit)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
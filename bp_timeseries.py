@@ -0,0 +1,280 @@
+"""
+家庭血压时间序列模块
+按患者维护收缩压、舒张压和平均动脉压的滚动统计（最大值、均值、斜率），每次写入 O(1) 更新；
+时间窗口以查询当天为终点，最近一次监测早于窗口时该窗口没有样本
+"""
+
+import math
+import threading
+from array import array
+from collections import OrderedDict, deque
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+from config import TIMESERIES_CONFIG
+from database import get_db_connection, close_db_connection
+from shared_state import patient_invalidations
+from utils import calculate_map
+
+METRICS = ('sbp', 'dbp', 'map')
+
+class RollingStats:
+    """单个指标在单个时间窗口内的增量统计"""
+    __slots__ = ('max_queue', 'n', 'sum_x', 'sum_y', 'sum_xx', 'sum_xy')
+
+    def __init__(self):
+        self.max_queue = deque()  # 单调递减队列，保存样本的绝对下标
+        self.n = 0
+        self.sum_x = 0.0
+        self.sum_y = 0.0
+        self.sum_xx = 0.0
+        self.sum_xy = 0.0
+
+    def add(self, index: int, x: float, y: float, values: array) -> None:
+        while self.max_queue and values[self.max_queue[-1]] <= y:
+            self.max_queue.pop()
+        self.max_queue.append(index)
+        self.n += 1
+        self.sum_x += x
+        self.sum_y += y
+        self.sum_xx += x * x
+        self.sum_xy += x * y
+
+    def remove(self, index: int, x: float, y: float) -> None:
+        if self.max_queue and self.max_queue[0] == index:
+            self.max_queue.popleft()
+        self.n -= 1
+        self.sum_x -= x
+        self.sum_y -= y
+        self.sum_xx -= x * x
+        self.sum_xy -= x * y
+
+    def summary(self, values: array) -> Dict[str, Optional[float]]:
+        if self.n == 0:
+            return {"max": None, "mean": None, "slope": None, "count": 0}
+
+        # 最小二乘斜率（每天的变化量）
+        denominator = self.n * self.sum_xx - self.sum_x * self.sum_x
+        slope = None
+        if self.n >= 2 and abs(denominator) > 1e-9:
+            slope = round((self.n * self.sum_xy - self.sum_x * self.sum_y) / denominator, 4)
+
+        return {
+            "max": values[self.max_queue[0]],
+            "mean": round(self.sum_y / self.n, 2),
+            "slope": slope,
+            "count": self.n
+        }
+
+class PatientSeries:
+    """单个患者的血压序列，按日期顺序保存在紧凑数组中"""
+
+    def __init__(self, windows: List[int]):
+        self.windows = sorted(windows)
+        self.base = 0  # 数组第一个元素对应的绝对下标
+        self.origin: Optional[date] = None  # 日期换算为天数的基准
+        self.days = array('l')
+        self.values = {metric: array('d') for metric in METRICS}
+        self.starts = {window: 0 for window in self.windows}
+        self.stats = {window: {metric: RollingStats() for metric in METRICS} for window in self.windows}
+
+    @property
+    def last_date(self) -> Optional[date]:
+        if not self.days:
+            return None
+        return self.origin + timedelta(days=self.days[-1])
+
+    def append(self, sample_date: date, sbp: Optional[float], dbp: Optional[float]) -> None:
+        """追加一条样本（日期不早于最后一条），各窗口摊销 O(1) 更新"""
+        if self.origin is None:
+            self.origin = sample_date
+        day = (sample_date - self.origin).days
+        sbp = float(sbp) if sbp is not None else math.nan
+        dbp = float(dbp) if dbp is not None else math.nan
+        sample = {
+            'sbp': sbp,
+            'dbp': dbp,
+            'map': calculate_map(sbp, dbp)  # 任一缺失时结果为 NaN
+        }
+
+        index = self.base + len(self.days)
+        self.days.append(day)
+        for metric in METRICS:
+            self.values[metric].append(sample[metric])
+
+        for window in self.windows:
+            stats = self.stats[window]
+            # 加入新样本
+            for metric in METRICS:
+                if not math.isnan(sample[metric]):
+                    stats[metric].add(index, day, sample[metric], self._view(metric))
+            self._evict(window, day)
+
+        self._compact()
+
+    def advance(self, as_of: date) -> None:
+        """将各窗口的终点移到 as_of（查询当天），移出早于窗口的样本；终点只前进不后退"""
+        if self.origin is None:
+            return
+        day = (as_of - self.origin).days
+        for window in self.windows:
+            self._evict(window, day)
+        self._compact()
+
+    def _evict(self, window: int, day: int) -> None:
+        """移出窗口 (day - window, day] 之外的旧样本"""
+        stats = self.stats[window]
+        start = self.starts[window]
+        end = self.base + len(self.days)
+        while start < end and self.days[start - self.base] <= day - window:
+            old_day = self.days[start - self.base]
+            for metric in METRICS:
+                old_value = self.values[metric][start - self.base]
+                if not math.isnan(old_value):
+                    stats[metric].remove(start, old_day, old_value)
+            start += 1
+        self.starts[window] = start
+
+    def _view(self, metric: str) -> '_OffsetView':
+        return _OffsetView(self.values[metric], self.base)
+
+    def _compact(self) -> None:
+        """丢弃最大窗口之外的样本，当可丢弃部分超过一半时整体移动（摊销 O(1)）"""
+        drop = self.starts[self.windows[-1]] - self.base
+        if drop > 0 and drop * 2 >= len(self.days):
+            del self.days[:drop]
+            for metric in METRICS:
+                del self.values[metric][:drop]
+            self.base += drop
+
+    def summary(self) -> Dict[str, dict]:
+        return {
+            f"{window}d": {
+                metric: self.stats[window][metric].summary(self._view(metric))
+                for metric in METRICS
+            }
+            for window in self.windows
+        }
+
+class _OffsetView:
+    """按绝对下标访问已压缩数组"""
+    __slots__ = ('values', 'base')
+
+    def __init__(self, values: array, base: int):
+        self.values = values
+        self.base = base
+
+    def __getitem__(self, index: int) -> float:
+        return self.values[index - self.base]
+
+class BPTimeSeriesStore:
+    """患者血压序列存储，按最近使用淘汰"""
+
+    def __init__(self, windows: List[int], max_patients: int):
+        self.windows = windows
+        self.max_patients = max_patients
+        self._series: 'OrderedDict[int, PatientSeries]' = OrderedDict()
+        # 正在从数据库加载的患者 -> [加载中的请求数, 加载期间的写入次数]
+        self._loading: Dict[int, List[int]] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, patient_id: int) -> PatientSeries:
+        """从数据库加载患者的样本（走 patient_id 索引，只读取该患者的记录）"""
+        series = PatientSeries(self.windows)
+        connection = get_db_connection()
+        if not connection:
+            return series
+
+        try:
+            cursor = connection.cursor()
+            cursor.execute("""
+            SELECT COALESCE(home_monitoring_date, DATE(created_at)) as sample_date,
+                   home_systolic, home_diastolic
+            FROM patient_home_monitoring
+            WHERE patient_id = %s
+            ORDER BY sample_date, id
+            """, (patient_id,))
+            for sample_date, sbp, dbp in cursor.fetchall():
+                series.append(sample_date, sbp, dbp)
+            cursor.close()
+        finally:
+            close_db_connection(connection)
+        return series
+
+    def get(self, patient_id: int) -> PatientSeries:
+        """
+        获取患者序列，未缓存时从数据库加载。加载在锁外进行，期间有写入或失效时
+        加载结果可能不含该写入，只返回给本次调用而不缓存，下次读取重新加载
+        """
+        patient_invalidations.poll()
+        with self._lock:
+            series = self._series.get(patient_id)
+            if series is not None:
+                self._series.move_to_end(patient_id)
+                return series
+            loading = self._loading.setdefault(patient_id, [0, 0])
+            loading[0] += 1
+            writes = loading[1]
+
+        try:
+            series = self._load(patient_id)
+        finally:
+            with self._lock:
+                loading[0] -= 1
+                if loading[0] == 0:
+                    del self._loading[patient_id]
+        with self._lock:
+            if loading[1] == writes and patient_id not in self._series:
+                self._series[patient_id] = series
+                while len(self._series) > self.max_patients:
+                    self._series.popitem(last=False)
+        return series
+
+    def record(self, patient_id: int, sample_date: date, sbp: Optional[float], dbp: Optional[float]) -> None:
+        """写入路径调用：已缓存的患者增量更新，乱序样本则丢弃缓存等待重新加载"""
+        with self._lock:
+            self._mark_written(patient_id)
+            series = self._series.get(patient_id)
+            if series is None:
+                return
+            if series.last_date is not None and sample_date < series.last_date:
+                del self._series[patient_id]
+                return
+            series.append(sample_date, sbp, dbp)
+
+    def forget(self, patient_id: Optional[int]) -> None:
+        """丢弃缓存的序列（其它 worker 写入了该患者的数据），None 表示清空全部"""
+        with self._lock:
+            self._mark_written(patient_id)
+            if patient_id is None:
+                self._series.clear()
+            else:
+                self._series.pop(patient_id, None)
+
+    def _mark_written(self, patient_id: Optional[int]) -> None:
+        """记录加载期间的写入（调用方持有锁），None 表示全部患者"""
+        for loading_id, loading in self._loading.items():
+            if patient_id is None or loading_id == patient_id:
+                loading[1] += 1
+
+    def summary(self, patient_id: int, as_of: Optional[date] = None) -> Dict[str, dict]:
+        """各窗口的统计，窗口以 as_of（默认当天）为终点"""
+        series = self.get(patient_id)
+        with self._lock:
+            series.advance(as_of or date.today())
+            return series.summary()
+
+    def sbp_max(self, patient_id: int, window: int, as_of: Optional[date] = None) -> Optional[float]:
+        """截至 as_of（默认当天）的窗口内收缩压最大值（COX模型的 SBPMax 输入）"""
+        if window not in self.windows:
+            raise ValueError(f"未配置的时间窗口: {window}")
+        series = self.get(patient_id)
+        with self._lock:
+            series.advance(as_of or date.today())
+            return series.stats[window]['sbp'].summary(series._view('sbp'))['max']
+
+bp_store = BPTimeSeriesStore(TIMESERIES_CONFIG['windows'], TIMESERIES_CONFIG['max_patients'])
+patient_invalidations.subscribe(bp_store.forget)
+
+def maternal_cox_inputs(patient_id: int) -> Dict[str, Optional[float]]:
+    """从血压序列填充母体COX模型的血压相关输入"""
+    return {"sbpmax": bp_store.sbp_max(patient_id, TIMESERIES_CONFIG['cox_sbpmax_window'])}
\ No newline at end of file
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+人群筛选查询模块
+
+管理端按声明式条件筛选患者（POST /admin/cohort/query）。条件形如
+{"field": "lab.sflt1_plgf_ratio", "op": "gt", "value": 38}，字段只能取 COHORT_SOURCES 白名单，
+编译为参数化 SQL：患者表的条件直接作用于 patient_general_info，其它表的条件按表分组，
+编译为 p.id IN (SELECT patient_id ...)，同一张表的多个条件须由同一条记录满足。
+
+每个可筛选字段都有对应的二级索引，由 cohort_indexes() 按白名单生成
+（migrations/006_cohort_indexes.sql、init_sqlite.sql 中的同名索引即其输出）。
+修改白名单后重新生成:
+    python cohort_query.py indexes [--dialect mysql|sqlite]
+"""
+
+import argparse
+import base64
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from fastapi import HTTPException
+
+# 可筛选的数据：名称 -> (表名, 别名, 可筛选字段)；除 patient 外都按 patient_id 关联患者
+COHORT_SOURCES: Dict[str, Tuple[str, str, Tuple[str, ...]]] = {
+    'patient': ('patient_general_info', 'p', (
+        'age', 'parity', 'pregnancy_type', 'aspirin_use', 'conception_method', 'last_menstrual_period',
+        'gestational_days', 'derived_bmi', 'derived_map'
+    )),
+    'lab': ('patient_lab_imaging', 'l', (
+        'examination_date', 'gestational_days', 'sflt1_plgf_ratio', 'plgf', 'platelet_count',
+        'creatinine', 'alt', 'urine_protein_24h'
+    )),
+    'home': ('patient_home_monitoring', 'h', (
+        'home_monitoring_date', 'gestational_days', 'derived_map', 'home_systolic', 'home_diastolic',
+        'home_sflt1_plgf_ratio'
+    )),
+    # compact 模式下相同输入只保存一行参数记录，按「是否存在」筛选时与逐次记录等价，
+    # 因此直接查询参数表；created_at 在 compact 模式下不是每次预测的时间，不开放筛选
+    'maternal_cox': ('model_maternal_cox_params', 'mc', ('prediction_result',)),
+    'neonatal_cox': ('model_neonatal_cox_params', 'nc', ('prediction_result',))
+}
+
+# 已由其它迁移建好、可直接用于筛选的索引：(表名, 字段) -> 索引名
+EXISTING_INDEXES = {
+    ('patient_general_info', 'gestational_days'): 'idx_general_gestational_days',
+    ('patient_general_info', 'derived_bmi'): 'idx_general_derived_bmi',
+    ('patient_general_info', 'derived_map'): 'idx_general_derived_map',
+    ('patient_lab_imaging', 'gestational_days'): 'idx_lab_gestational_days',
+    ('patient_home_monitoring', 'gestational_days'): 'idx_home_gestational_map'
+}
+
+# 比较运算符
+COMPARISONS = {'eq': '=', 'ne': '<>', 'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+OPERATORS = (*COMPARISONS, 'between', 'in', 'is_null', 'not_null')
+
+MAX_FILTERS = 20
+MAX_IN_VALUES = 100
+
+def index_name(source: str, column: str) -> str:
+    """筛选字段使用的索引名"""
+    table = COHORT_SOURCES[source][0]
+    return EXISTING_INDEXES.get((table, column), f"idx_cohort_{source}_{column}")
+
+def cohort_indexes() -> List[Tuple[str, str, Tuple[str, ...]]]:
+    """
+    白名单字段需要新建的二级索引 (索引名, 表名, 索引列)：患者表按字段建索引；
+    其它表按 (字段, patient_id) 建索引，范围条件命中后不回表即可得到患者ID
+    """
+    indexes = []
+    for source, (table, _, columns) in COHORT_SOURCES.items():
+        for column in columns:
+            if (table, column) in EXISTING_INDEXES:
+                continue
+            key = (column,) if source == 'patient' else (column, 'patient_id')
+            indexes.append((index_name(source, column), table, key))
+    return indexes
+
+def index_statements(dialect: str = 'mysql') -> List[str]:
+    """建索引语句（SQLite 使用 IF NOT EXISTS）"""
+    if_not_exists = "IF NOT EXISTS " if dialect == 'sqlite' else ""
+    return [
+        f"CREATE INDEX {if_not_exists}{name} ON {table} ({', '.join(key)});"
+        for name, table, key in cohort_indexes()
+    ]
+
+def _is_scalar(value: Any) -> bool:
+    return isinstance(value, (str, int, float, bool))
+
+def _condition(expr: str, op: str, value: Any, field: str) -> Tuple[str, List[Any]]:
+    """单个条件编译为 SQL 片段和参数"""
+    if op in COMPARISONS:
+        if not _is_scalar(value):
+            raise HTTPException(status_code=400, detail=f"条件 {field} {op} 需要一个取值")
+        return f"{expr} {COMPARISONS[op]} %s", [value]
+    if op == 'between':
+        if not isinstance(value, list) or len(value) != 2 or not all(_is_scalar(v) for v in value):
+            raise HTTPException(status_code=400, detail=f"条件 {field} between 需要 [下限, 上限]")
+        return f"{expr} BETWEEN %s AND %s", list(value)
+    if op == 'in':
+        if (not isinstance(value, list) or not 1 <= len(value) <= MAX_IN_VALUES
+                or not all(_is_scalar(v) for v in value)):
+            raise HTTPException(status_code=400, detail=f"条件 {field} in 需要 1-{MAX_IN_VALUES} 个取值")
+        return f"{expr} IN ({', '.join(['%s'] * len(value))})", list(value)
+    if op in ('is_null', 'not_null'):
+        if value is not None:
+            raise HTTPException(status_code=400, detail=f"条件 {field} {op} 不需要取值")
+        return f"{expr} IS {'NULL' if op == 'is_null' else 'NOT NULL'}", []
+    raise HTTPException(status_code=400, detail=f"无效的运算符: {op}（可选 {', '.join(OPERATORS)}）")
+
+def compile_filters(filters: Sequence[Tuple[str, str, Any]]) -> Tuple[str, List[Any]]:
+    """
+    把 (字段, 运算符, 取值) 条件编译为患者表（别名 p）的 WHERE 条件和参数，没有条件时返回空字符串。
+    字段不在白名单或取值格式不对时返回 400
+    """
+    if len(filters) > MAX_FILTERS:
+        raise HTTPException(status_code=400, detail=f"条件不能超过 {MAX_FILTERS} 个")
+
+    grouped: Dict[str, List[Tuple[str, List[Any]]]] = {}
+    for field, op, value in filters:
+        source, _, column = field.partition('.')
+        if source not in COHORT_SOURCES or column not in COHORT_SOURCES[source][2]:
+            raise HTTPException(status_code=400, detail=f"不支持筛选的字段: {field}")
+        alias = COHORT_SOURCES[source][1]
+        grouped.setdefault(source, []).append(_condition(f"{alias}.{column}", op, value, field))
+
+    conditions = []
+    params: List[Any] = []
+    for source, compiled in grouped.items():
+        table, alias, _ = COHORT_SOURCES[source]
+        sql = " AND ".join(condition for condition, _ in compiled)
+        for _, values in compiled:
+            params.extend(values)
+        if source == 'patient':
+            conditions.append(sql)
+        else:
+            conditions.append(f"p.id IN (SELECT {alias}.patient_id FROM {table} {alias} WHERE {sql})")
+    return " AND ".join(conditions), params
+
+def count_query(filters: Sequence[Tuple[str, str, Any]]) -> Tuple[str, List[Any]]:
+    """满足条件的患者数"""
+    where, params = compile_filters(filters)
+    sql = "SELECT COUNT(*) as count FROM patient_general_info p"
+    if where:
+        sql += f" WHERE {where}"
+    return sql, params
+
+def page_query(filters: Sequence[Tuple[str, str, Any]], select_list: str,
+               after_id: int, limit: int) -> Tuple[str, List[Any]]:
+    """按患者ID升序分页（游标为上一页最后一个患者ID）"""
+    where, params = compile_filters(filters)
+    conditions = [where] if where else []
+    conditions.append("p.id > %s")
+    sql = f"""
+    SELECT {select_list}
+    FROM patient_general_info p
+    WHERE {' AND '.join(conditions)}
+    ORDER BY p.id
+    LIMIT %s
+    """
+    return sql, params + [after_id, limit]
+
+def encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"after_id": last_id}).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor: Optional[str]) -> int:
+    """解析分页游标，未提供时从头开始"""
+    if not cursor:
+        return 0
+    try:
+        after_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))['after_id']
+        if not isinstance(after_id, int):
+            raise ValueError(after_id)
+        return after_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
+def main():
+    parser = argparse.ArgumentParser(description="人群筛选字段的二级索引")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    indexes_parser = subparsers.add_parser("indexes", help="输出建索引语句")
+    indexes_parser.add_argument("--dialect", choices=["mysql", "sqlite"], default="mysql")
+    args = parser.parse_args()
+
+    for statement in index_statements(args.dialect):
+        print(statement)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -3,6 +3,7 @@
 """
 
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # 加载环境变量
@@ -18,11 +19,178 @@ DB_CONFIG = {
     'charset': os.getenv('DB_CHARSET', 'utf8mb4')
 }
 
+# 存储后端配置
+STORAGE_CONFIG = {
+    # mysql: 使用 DB_CONFIG 连接 MySQL；sqlite: 嵌入式 SQLite 文件（WAL 模式），适合单机部署和基准测试
+    'backend': os.getenv('DB_BACKEND', 'mysql').lower(),
+    'sqlite_path': os.getenv('DB_SQLITE_PATH', 'medical_platform.sqlite3'),
+    # SQLite 写锁等待时间（秒）
+    'sqlite_busy_timeout': float(os.getenv('DB_SQLITE_BUSY_TIMEOUT', 5))
+}
+
+# 数据库连接池配置（每个 worker 一个连接池）
+DB_POOL_CONFIG = {
+    # 每个 worker 的连接数上限，0 表示按 MySQL max_connections 自动计算
+    'size': int(os.getenv('DB_POOL_SIZE', 0)),
+    # 自动计算时为批量评分、回填等不经过连接池的任务和脚本预留的连接数
+    'reserved_connections': int(os.getenv('DB_POOL_RESERVED', 20)),
+    'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 32)),
+    # 等待空闲连接的超时时间（秒）
+    'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+    # 空闲超过该时间（秒）的连接在取出时先 ping 检查
+    'ping_interval': int(os.getenv('DB_POOL_PING_INTERVAL', 30)),
+    # 服务启动时预先建立的连接数
+    'warm_up_connections': int(os.getenv('DB_POOL_WARM_UP', 2))
+}
+
+# 数据库请求追踪配置（db_tracing.py）
+TRACE_CONFIG = {
+    # 记录每个请求的 SQL 语句数和耗时，写入 Server-Timing 响应头
+    'enabled': os.getenv('DB_TRACE', 'True').lower() == 'true',
+    # 单条语句耗时超过该值（毫秒）时写入慢查询日志
+    'slow_query_ms': float(os.getenv('DB_SLOW_QUERY_MS', 200)),
+    # 一个请求执行的语句数超过该值时，按归一化 SQL 汇总写入慢查询日志（N+1 查询）
+    'chatty_statements': int(os.getenv('DB_TRACE_CHATTY_STATEMENTS', 20)),
+    'slow_log_path': os.getenv('DB_SLOW_QUERY_LOG', 'slow_queries.jsonl'),
+    # 每个请求最多保留的语句明细条数
+    'max_statements': int(os.getenv('DB_TRACE_MAX_STATEMENTS', 500))
+}
+
+# 管理端并发查询配置（fan_out.py）
+FANOUT_CONFIG = {
+    # 一个请求的并发查询总时长上限（秒）
+    'timeout': float(os.getenv('ADMIN_FANOUT_TIMEOUT', 5)),
+    # 同一请求最多同时占用的连接数，1 表示依次执行
+    'max_parallel': int(os.getenv('ADMIN_FANOUT_MAX_PARALLEL', 4)),
+    # 非必需的查询超时或失败时是否返回部分结果（false 时返回错误）
+    'partial': os.getenv('ADMIN_FANOUT_PARTIAL', 'True').lower() == 'true'
+}
+
+# 响应压缩配置（response_compression.py）
+COMPRESSION_CONFIG = {
+    'enabled': os.getenv('RESPONSE_COMPRESSION', 'True').lower() == 'true',
+    # 压缩响应的接口路径前缀（逗号分隔），预测接口不压缩
+    'path_prefixes': tuple(os.getenv('RESPONSE_COMPRESSION_PATHS', '/admin/').split(',')),
+    # 小于该字节数的响应不压缩
+    'min_size': int(os.getenv('RESPONSE_COMPRESSION_MIN_BYTES', 1024)),
+    # 超过该字节数的响应体（或流式响应的分块）在压缩线程池中压缩
+    'thread_threshold': int(os.getenv('RESPONSE_COMPRESSION_THREAD_BYTES', 64 * 1024)),
+    'workers': int(os.getenv('RESPONSE_COMPRESSION_WORKERS', 2)),
+    'gzip_level': int(os.getenv('RESPONSE_GZIP_LEVEL', 6)),
+    'brotli_quality': int(os.getenv('RESPONSE_BROTLI_QUALITY', 4))
+}
+
+# 限流配置（rate_limit.py）
+RATE_LIMIT_CONFIG = {
+    'enabled': os.getenv('RATE_LIMIT', 'True').lower() == 'true',
+    # 标识客户端的请求头（API Key）；只有 RATE_LIMIT_API_KEYS（逗号分隔）中登记的 Key 单独计数，
+    # 未登记、未携带或未配置时按客户端 IP（客户端不能靠更换 Key 绕过限流）
+    'key_header': os.getenv('RATE_LIMIT_KEY_HEADER', 'X-API-Key').lower().encode('latin-1'),
+    'api_keys': frozenset(key.strip() for key in os.getenv('RATE_LIMIT_API_KEYS', '').split(',') if key.strip()),
+    # 部署在反向代理之后时按 X-Forwarded-For 的第一个地址识别客户端
+    'trust_forwarded': os.getenv('RATE_LIMIT_TRUST_FORWARDED', 'False').lower() == 'true',
+    # 接口组：路径前缀、每秒速率、突发上限（令牌桶容量）
+    'groups': {
+        'predict': {
+            'paths': ('/predict/',),
+            'rate': float(os.getenv('RATE_LIMIT_PREDICT_RATE', 10)),
+            'burst': int(os.getenv('RATE_LIMIT_PREDICT_BURST', 30))
+        },
+        'ingest': {
+            'paths': ('/api/patient/',),
+            'rate': float(os.getenv('RATE_LIMIT_INGEST_RATE', 5)),
+            'burst': int(os.getenv('RATE_LIMIT_INGEST_BURST', 20))
+        }
+    },
+    # 客户端状态表的槽位数（每个 24 字节），超出时淘汰最久未访问的客户端
+    'max_keys': int(os.getenv('RATE_LIMIT_MAX_KEYS', 1 << 20)),
+    # local: 每个 worker 各自计数；shared: 多 worker 部署时共用共享内存中的状态表
+    'backend': os.getenv('RATE_LIMIT_BACKEND', 'local').lower()
+}
+
 # 应用配置
 APP_CONFIG = {
+    # 冷启动导入耗时预算（毫秒，多次导入的中位数实测约 650-850，其中 FastAPI 自身约 550，预留机器负载波动的余量），
+    # 由 benchmarks.py import-time 检查
+    'import_budget_ms': int(os.getenv('APP_IMPORT_BUDGET_MS', 1200)),
     'host': os.getenv('APP_HOST', '0.0.0.0'),
     'port': int(os.getenv('APP_PORT', 8000)),
-    'debug': os.getenv('APP_DEBUG', 'True').lower() == 'true'
+    'debug': os.getenv('APP_DEBUG', 'True').lower() == 'true',
+    # 预测接口快速路径（fast_predict.py），关闭后由 FastAPI 路由处理
+    'fast_predict': os.getenv('APP_FAST_PREDICT', 'True').lower() == 'true',
+    # 停机截止时间（秒）：排空请求、停止后台任务、刷新写入的总时长
+    'shutdown_timeout': float(os.getenv('APP_SHUTDOWN_TIMEOUT', 30)),
+    # worker 进程数，大于 1 时同一主机的 worker 通过共享内存文件同步状态
+    'workers': int(os.getenv('APP_WORKERS', 1)),
+    'shared_state_dir': os.getenv(
+        'APP_SHARED_STATE_DIR', os.path.join(tempfile.gettempdir(), 'medical_platform_shared')
+    ),
+    # 跨 worker 缓存失效日志的容量（条）
+    'invalidation_log_size': int(os.getenv('APP_INVALIDATION_LOG_SIZE', 4096))
+}
+
+# 预测记录存储配置
+AUDIT_CONFIG = {
+    # full: 每次预测保存一行完整记录；compact: 相同输入只保存一行参数记录，每次预测另记一条事件
+    'mode': os.getenv('PREDICTION_AUDIT_MODE', 'full').lower()
+}
+
+# 缓存配置
+CACHE_CONFIG = {
+    # 表版本（ETag校验值）从数据库重新加载的间隔（秒），0 表示只依赖本进程写入维护
+    'validator_ttl': int(os.getenv('CACHE_VALIDATOR_TTL', 60))
+}
+
+# 幂等请求配置（Idempotency-Key）
+IDEMPOTENCY_CONFIG = {
+    # 需要去重的写入接口路径前缀
+    'path_prefixes': ('/predict/', '/api/patient/'),
+    # 幂等键保留时间（小时）
+    'ttl_hours': int(os.getenv('IDEMPOTENCY_TTL_HOURS', 24)),
+    'max_key_length': 255,
+    # 处理中记录的租约（秒）：超过该时间仍未完成（进程崩溃等）的占用可被重试的请求接管
+    'lease_seconds': int(os.getenv('IDEMPOTENCY_LEASE_SECONDS', 300)),
+    # 本进程最近响应缓存的条数与有效期（秒）
+    'cache_size': int(os.getenv('IDEMPOTENCY_CACHE_SIZE', 10000)),
+    'cache_ttl': int(os.getenv('IDEMPOTENCY_CACHE_TTL', 600)),
+    # 清理过期幂等键的间隔（秒）
+    'cleanup_interval': int(os.getenv('IDEMPOTENCY_CLEANUP_INTERVAL', 300)),
+    # 请求体超过该字节数的部分暂存在临时文件中（上传文件的请求）
+    'spool_size': int(os.getenv('IDEMPOTENCY_SPOOL_SIZE', 1024 * 1024))
+}
+
+# 上传文件配置（file_store.py）
+UPLOAD_CONFIG = {
+    # 文件存储目录，按内容哈希保存
+    'dir': os.getenv('UPLOAD_DIR', 'uploads'),
+    # 分块读取的大小（字节）
+    'chunk_size': int(os.getenv('UPLOAD_CHUNK_SIZE', 1024 * 1024)),
+    # 单个文件与整个请求体的大小上限
+    'max_file_bytes': int(float(os.getenv('UPLOAD_MAX_FILE_MB', 200)) * 1024 * 1024),
+    'max_request_bytes': int(float(os.getenv('UPLOAD_MAX_REQUEST_MB', 400)) * 1024 * 1024),
+    # 保存时的压缩方式: auto（优先 zstd，未安装 zstandard 时使用 gzip）、zstd、gzip、none
+    'compression': os.getenv('UPLOAD_COMPRESSION', 'auto').lower(),
+    # 检查请求体大小的上传接口路径前缀
+    'paths': ('/api/patient/home-monitoring',)
+}
+
+# 实时事件推送配置
+EVENT_CONFIG = {
+    # 推送高风险预测的默认阈值（prediction_result，百分比）
+    'high_risk_threshold': float(os.getenv('EVENT_HIGH_RISK_THRESHOLD', 50)),
+    'keepalive_seconds': int(os.getenv('EVENT_KEEPALIVE_SECONDS', 15)),
+    'queue_size': int(os.getenv('EVENT_QUEUE_SIZE', 1000)),
+    'replay_size': int(os.getenv('EVENT_REPLAY_SIZE', 1000))
+}
+
+# 家庭血压时间序列配置
+TIMESERIES_CONFIG = {
+    # 滚动统计窗口（天）
+    'windows': [int(w) for w in os.getenv('BP_WINDOWS', '7,14,28').split(',')],
+    # 母体COX模型 SBPMax 取值窗口（天），必须在 windows 中
+    'cox_sbpmax_window': int(os.getenv('BP_COX_SBPMAX_WINDOW', 14)),
+    # 内存中最多保留的患者序列数
+    'max_patients': int(os.getenv('BP_MAX_PATIENTS', 100000))
 }
 
 # 预定义的 COX 模型参数
@@ -45,4 +213,30 @@ cox2_model_coefficients = {
 
 # 基线风险函数值
 H0_vec_cox1 = {"2": 0.02, "7": 0.15, "14": 0.35}
-H0_vec_cox2 = {"2": 0.04998589, "7": 0.13582579, "14": 0.34366626} 
\ No newline at end of file
+H0_vec_cox2 = {"2": 0.04998589, "7": 0.13582579, "14": 0.34366626} 
+
+# 模型特征汇总配置
+FEATURE_CONFIG = {
+    # 患者特征缓存时间（秒）
+    'cache_ttl': int(os.getenv('FEATURE_CACHE_TTL', 30)),
+    'cache_size': int(os.getenv('FEATURE_CACHE_SIZE', 10000))
+}
+
+# 批量重新评分配置
+RESCORE_CONFIG = {
+    'chunk_size': int(os.getenv('RESCORE_CHUNK_SIZE', 5000)),
+    'workers': int(os.getenv('RESCORE_WORKERS', os.cpu_count() or 1)),
+    'checkpoint_path': os.getenv('RESCORE_CHECKPOINT', 'rescore_checkpoint.json')
+}
+
+# 后台任务配置
+JOB_CONFIG = {
+    # 任务状态库（本地 SQLite 文件）与结果文件目录
+    'db_path': os.getenv('JOB_DB_PATH', 'jobs.sqlite3'),
+    'result_dir': os.getenv('JOB_RESULT_DIR', 'job_results'),
+    # 同时执行的任务数与最多排队的任务数
+    'max_workers': int(os.getenv('JOB_MAX_WORKERS', 2)),
+    'max_queued': int(os.getenv('JOB_MAX_QUEUED', 20)),
+    # 导出任务每写入多少行汇报一次进度
+    'progress_interval': int(os.getenv('JOB_PROGRESS_INTERVAL', 1000))
+}
\ No newline at end of file
@@ -1,24 +1,198 @@
 """
 数据库操作模块
+连接、游标和 SQL 方言由存储后端（storage.py，DB_BACKEND=mysql/sqlite）提供，其它模块只通过本模块访问数据库
 """
 
-import pymysql
-from pymysql import Error
-from config import DB_CONFIG
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from config import APP_CONFIG, DB_POOL_CONFIG
+from db_tracing import traced
+from shared_state import SharedCounters
+from storage import create_backend
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    """存储后端，首次连接时才按 DB_BACKEND 创建（MySQL 后端此时才导入 PyMySQL），导入本模块不创建"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend()
+    return _backend
+
+class PoolTimeout(Exception):
+    """等待空闲连接超时"""
+
+def errors() -> tuple:
+    """数据库操作可能抛出的异常，用于 except 子句（except errors() as e），在处理异常时才取后端的异常类型"""
+    return (*get_backend().errors, PoolTimeout)
+
+# MySQL max_connections 的默认值，查询失败时使用
+DEFAULT_MAX_CONNECTIONS = 151
+
+def compute_pool_size(max_connections: int, workers: int) -> int:
+    """按 worker 数分摊 MySQL 连接上限（扣除预留连接），结果在 1 到 max_size 之间"""
+    available = max_connections - DB_POOL_CONFIG['reserved_connections']
+    return max(1, min(DB_POOL_CONFIG['max_size'], available // max(workers, 1)))
+
+# 同一主机所有 worker 的连接池累计指标
+_pool_metrics = SharedCounters('db_pool', ['connections_opened', 'checkouts', 'wait_timeouts'], 'q')
+
+class ConnectionPool:
+    """单个 worker 的连接池，连接归还时回滚未提交的事务，避免读到旧快照"""
+
+    def __init__(self):
+        self.size: Optional[int] = None
+        self._idle: List[Tuple[Any, float]] = []  # (连接, 归还时间)，后进先出
+        self._in_use = 0
+        self._condition = threading.Condition()
+
+    def _resolve_size(self) -> int:
+        if DB_POOL_CONFIG['size'] > 0:
+            return DB_POOL_CONFIG['size']
+        max_connections = DEFAULT_MAX_CONNECTIONS
+        try:
+            # 嵌入式数据库没有连接数上限，按默认值计算
+            max_connections = get_backend().max_connections() or DEFAULT_MAX_CONNECTIONS
+        except Exception as e:
+            print(f"读取 max_connections 失败，按默认值 {DEFAULT_MAX_CONNECTIONS} 计算: {e}")
+        size = compute_pool_size(max_connections, APP_CONFIG['workers'])
+        print(f"数据库连接池: max_connections={max_connections}, workers={APP_CONFIG['workers']}, 每个 worker {size} 个连接")
+        return size
+
+    def _ensure_size(self) -> int:
+        if self.size is None:
+            size = self._resolve_size()
+            with self._condition:
+                if self.size is None:
+                    self.size = size
+        return self.size
+
+    def acquire(self):
+        """取出连接，已达上限时等待其它请求归还"""
+        self._ensure_size()
+
+        deadline = time.monotonic() + DB_POOL_CONFIG['timeout']
+        with self._condition:
+            while not self._idle and self._in_use >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    _pool_metrics.add('wait_timeouts', 1)
+                    raise PoolTimeout(f"等待数据库连接超时（连接池大小 {self.size}）")
+                self._condition.wait(remaining)
+            connection, returned_at = self._idle.pop() if self._idle else (None, 0.0)
+            self._in_use += 1
+
+        try:
+            if connection is None:
+                connection = traced(get_backend().connect())
+                _pool_metrics.add('connections_opened', 1)
+            elif time.monotonic() - returned_at > DB_POOL_CONFIG['ping_interval']:
+                connection.ping(reconnect=True)
+        except Exception:
+            self._release_slot()
+            raise
+        _pool_metrics.add('checkouts', 1)
+        return connection
+
+    def release(self, connection) -> None:
+        """归还连接，已断开的连接直接丢弃"""
+        keep = False
+        try:
+            if connection.open:
+                connection.rollback()
+                keep = True
+        except errors():
+            connection.close()
+
+        with self._condition:
+            self._in_use -= 1
+            if keep:
+                self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+    def _release_slot(self) -> None:
+        with self._condition:
+            self._in_use -= 1
+            self._condition.notify()
+
+    def warm_up(self, count: int) -> int:
+        """预先建立连接放入池中，返回成功建立的连接数"""
+        connections = []
+        try:
+            for _ in range(min(count, self._ensure_size())):
+                connections.append(self.acquire())
+        except Exception as e:
+            print(f"连接池预热失败: {e}")
+        finally:
+            for connection in connections:
+                self.release(connection)
+        return len(connections)
+
+    def close_all(self) -> None:
+        """关闭所有空闲连接"""
+        with self._condition:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            try:
+                connection.close()
+            except errors():
+                pass
+
+    def available(self) -> int:
+        """当前不用等待即可取出的连接数"""
+        self._ensure_size()
+        with self._condition:
+            return max(0, self.size - self._in_use)
+
+    def stats(self) -> Dict[str, Any]:
+        """本 worker 的连接池状态，以及同一主机所有 worker 的累计指标"""
+        with self._condition:
+            local = {"size": self.size, "in_use": self._in_use, "idle": len(self._idle)}
+        totals = {key: values[0] for key, values in _pool_metrics.read_all().items()}
+        return {**local, "workers": APP_CONFIG['workers'], "host_totals": totals}
+
+pool = ConnectionPool()
+
+def connect():
+    """建立不经过连接池的连接（长时间占用的导出、批量评分等），用完自行 close()"""
+    return traced(get_backend().connect())
+
+def dict_cursor(connection):
+    """按字典返回行的游标"""
+    return get_backend().cursor(connection, as_dict=True)
+
+def stream_cursor(connection):
+    """逐行读取结果的字典游标，用于大结果集"""
+    return get_backend().cursor(connection, as_dict=True, stream=True)
+
+def is_duplicate_key(error: Exception) -> bool:
+    """是否为唯一键冲突"""
+    return get_backend().is_duplicate_key(error)
+
+def with_statement_timeout(sql: str, seconds: float) -> str:
+    """为只读查询加上数据库端的执行时间上限（不支持的后端原样返回）"""
+    return get_backend().with_statement_timeout(sql, seconds)
+
+def interrupt(connection) -> None:
+    """从其它线程中断连接上正在执行的语句"""
+    get_backend().interrupt(connection)
 
 def get_db_connection():
-    """获取数据库连接"""
+    """从连接池获取数据库连接"""
     try:
-        connection = pymysql.connect(**DB_CONFIG)
-        return connection
-    except Error as e:
+        return pool.acquire()
+    except errors() as e:
         print(f"数据库连接错误: {e}")
         return None
 
 def close_db_connection(connection):
-    """关闭数据库连接"""
+    """将数据库连接归还连接池"""
     if connection:
-        connection.close()
+        pool.release(connection)
 
 def execute_insert(sql, values):
     """执行插入操作"""
@@ -32,7 +206,7 @@ def execute_insert(sql, values):
         connection.commit()
         record_id = cursor.lastrowid
         return record_id, None
-    except Error as e:
+    except errors() as e:
         connection.rollback()
         return None, f"数据库操作失败: {str(e)}"
     finally:
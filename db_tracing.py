@@ -0,0 +1,199 @@
+"""
+数据库请求追踪模块
+每个 HTTP 请求记录执行的 SQL 语句数、每条语句的耗时和返回行数：
+    - 响应头 Server-Timing: db;dur=毫秒;desc="N queries" 和 X-DB-Queries，浏览器开发者工具中可直接看到
+    - 单条语句超过 DB_SLOW_QUERY_MS，或一个请求的语句数超过 DB_TRACE_CHATTY_STATEMENTS 时，
+      把归一化的 SQL（字面量和占位符替换为 ?）与耗时写入本地 JSONL 慢查询日志（DB_SLOW_QUERY_LOG）
+
+连接池和 connect() 返回的连接由 traced() 包装，请求之外（脚本、后台任务）执行的语句不记录
+"""
+
+import contextvars
+import hashlib
+import json
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from config import TRACE_CONFIG
+from utils import to_thread
+
+class RequestTrace:
+    """一个请求的数据库访问记录，语句明细最多保留 max_statements 条"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        # [SQL, 耗时（秒）, 返回行数]，行数在读取结果时累加
+        self.statements: List[list] = []
+        # 请求内的查询可能在多个线程中并发执行
+        self._lock = threading.Lock()
+
+    def record(self, sql: str, duration: float) -> Optional[list]:
+        with self._lock:
+            self.count += 1
+            self.duration += duration
+            if len(self.statements) >= TRACE_CONFIG['max_statements']:
+                return None
+            statement = [sql, duration, 0]
+            self.statements.append(statement)
+            return statement
+
+_current: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar('db_trace', default=None)
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current.get()
+
+class TracedCursor:
+    """记录 execute/executemany 耗时和读取行数的游标，其它属性交给原游标"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._statement: Optional[list] = None
+
+    def _run(self, method, sql: str, params):
+        trace = _current.get()
+        if trace is None:
+            self._statement = None
+            return method(sql, params)
+        started = time.perf_counter()
+        try:
+            return method(sql, params)
+        finally:
+            self._statement = trace.record(sql, time.perf_counter() - started)
+
+    def execute(self, sql: str, params=None):
+        return self._run(self._cursor.execute, sql, params)
+
+    def executemany(self, sql: str, seq_of_params):
+        return self._run(self._cursor.executemany, sql, seq_of_params)
+
+    def _rows(self, count: int) -> None:
+        if self._statement is not None:
+            self._statement[2] += count
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._rows(1)
+        return row
+
+    def fetchmany(self, size: int = 1):
+        rows = self._cursor.fetchmany(size)
+        self._rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._rows(len(rows))
+        return rows
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._rows(1)
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class TracedConnection:
+    """返回 TracedCursor 的连接，其它属性交给原连接"""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def cursor(self, *args, **kwargs) -> TracedCursor:
+        return TracedCursor(self._connection.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+def traced(connection):
+    """按 DB_TRACE 包装连接"""
+    return TracedConnection(connection) if TRACE_CONFIG['enabled'] else connection
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%s|\?")
+_IN_LISTS = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.I)
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_sql(sql: str) -> str:
+    """归一化 SQL：字面量和占位符替换为 ?，IN 列表合并为 IN (...)，空白压缩为一个空格"""
+    normalized = _LITERALS.sub('?', sql)
+    normalized = _IN_LISTS.sub('IN (...)', normalized)
+    return _WHITESPACE.sub(' ', normalized).strip()
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 3)
+
+def _slow_log_entries(method: str, path: str, status: int, trace: RequestTrace) -> List[Dict[str, Any]]:
+    """慢语句各一条记录；语句数过多时另记一条按归一化 SQL 汇总的请求记录"""
+    now = datetime.now().isoformat(timespec='milliseconds')
+    request = {"time": now, "method": method, "path": path, "status": status,
+               "statements": trace.count, "db_ms": _ms(trace.duration)}
+    entries = []
+    for sql, duration, rows in trace.statements:
+        if duration * 1000 >= TRACE_CONFIG['slow_query_ms']:
+            normalized = normalize_sql(sql)
+            entries.append({**request, "type": "slow_query", "sql": normalized,
+                            "fingerprint": hashlib.sha1(normalized.encode()).hexdigest()[:12],
+                            "duration_ms": _ms(duration), "rows": rows})
+
+    if trace.count > TRACE_CONFIG['chatty_statements']:
+        groups: Dict[str, Dict[str, Any]] = {}
+        for sql, duration, rows in trace.statements:
+            group = groups.setdefault(normalize_sql(sql), {"count": 0, "total_ms": 0.0, "rows": 0})
+            group["count"] += 1
+            group["total_ms"] += duration * 1000
+            group["rows"] += rows
+        summary = [{"sql": sql, **group, "total_ms": round(group["total_ms"], 3)} for sql, group in groups.items()]
+        summary.sort(key=lambda group: group["total_ms"], reverse=True)
+        entries.append({**request, "type": "chatty_request", "queries": summary})
+    return entries
+
+_log_lock = threading.Lock()
+
+def write_slow_log(entries: List[Dict[str, Any]]) -> None:
+    with _log_lock:
+        with open(TRACE_CONFIG['slow_log_path'], 'a', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+
+class DBTraceMiddleware:
+    """为每个请求建立 RequestTrace，响应头中写入数据库耗时，请求结束后写慢查询日志"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not TRACE_CONFIG['enabled']:
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace()
+        token = _current.set(trace)
+        status = 500
+
+        async def traced_send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                # 流式响应的响应头只包含发送响应头之前执行的语句
+                if trace.count:
+                    message = {**message, 'headers': [
+                        *message.get('headers', []),
+                        (b'server-timing', f'db;dur={_ms(trace.duration)};desc="{trace.count} queries"'.encode()),
+                        (b'x-db-queries', str(trace.count).encode())
+                    ]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, traced_send)
+        finally:
+            _current.reset(token)
+            entries = _slow_log_entries(scope['method'], scope['path'], status, trace) if trace.count else []
+            if entries:
+                try:
+                    await to_thread(write_slow_log, entries)
+                except OSError as e:
+                    print(f"慢查询日志写入失败: {e}")
\ No newline at end of file
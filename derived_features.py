@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+患者派生特征模块
+
+患者数据写入时计算派生特征并保存在带索引的列中，按孕周、MAP、BMI 的范围查询直接走索引，
+不再在应用中逐行重新计算：
+    - patient_general_info: gestational_days（录入当天的孕天数）、derived_bmi、derived_map
+    - patient_lab_imaging: gestational_days（检查日期的孕天数）
+    - patient_home_monitoring: gestational_days（监测日期的孕天数）、derived_map
+
+孕天数按末次月经计算，基本信息未填写末次月经时解析孕周文本（gestational_weeks）；
+客户端提交的 pre_pregnancy_bmi、pre_pregnancy_map 原样保留，派生列只由身高体重和血压计算。
+
+每张表回填完成后递增该表的数据版本（table_versions.bump_data_version），管理端读接口的 ETag 随之改变；
+同时清空特征缓存和血压时间序列缓存（本进程及同一主机共享状态的 worker）。
+
+用法（执行迁移 005 后回填已有记录，可重复执行）:
+    python derived_features.py [--batch-size 1000]
+"""
+
+import argparse
+import time
+from datetime import date
+from typing import Optional, Tuple
+from fastapi import HTTPException
+from database import get_db_connection, close_db_connection, connect, dict_cursor
+from shared_state import patient_invalidations
+from table_versions import bump_data_version
+from utils import calculate_bmi, calculate_gestational_days, calculate_map, parse_gestational_weeks
+
+BACKFILL_BATCH_SIZE = 1000
+
+def gestational_days_at(lmp_date: Optional[date], current_date: Optional[date]) -> Optional[int]:
+    """某一天的孕天数，日期缺失或早于末次月经时返回 None"""
+    if lmp_date is None or current_date is None or current_date < lmp_date:
+        return None
+    return calculate_gestational_days(lmp_date, current_date)
+
+def bmi_of(weight: Optional[float], height: Optional[float]) -> Optional[float]:
+    """由体重（kg）和身高（cm）计算 BMI，缺失或非正数时返回 None"""
+    if weight is None or height is None or weight <= 0 or height <= 0:
+        return None
+    return round(calculate_bmi(float(weight), float(height)), 2)
+
+def map_of(sbp: Optional[float], dbp: Optional[float]) -> Optional[float]:
+    """由收缩压、舒张压计算 MAP，缺失或收缩压低于舒张压时返回 None"""
+    if sbp is None or dbp is None or dbp <= 0 or sbp < dbp:
+        return None
+    return round(calculate_map(float(sbp), float(dbp)), 2)
+
+def general_info_features(lmp_date: Optional[date], gestational_weeks: Optional[str], entry_date: date,
+                          height: Optional[float], weight: Optional[float],
+                          sbp: Optional[float], dbp: Optional[float]) -> Tuple:
+    """基本信息的派生特征 (gestational_days, derived_bmi, derived_map)"""
+    gestational_days = gestational_days_at(lmp_date, entry_date)
+    if gestational_days is None and lmp_date is None:
+        gestational_days = parse_gestational_weeks(gestational_weeks)
+    return gestational_days, bmi_of(weight, height), map_of(sbp, dbp)
+
+def patient_lmp(patient_id: Optional[int]) -> Optional[date]:
+    """患者的末次月经，未关联患者、患者不存在或未填写时返回 None"""
+    if patient_id is None:
+        return None
+
+    connection = get_db_connection()
+    if not connection:
+        raise HTTPException(status_code=500, detail="数据库连接失败")
+
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT last_menstrual_period FROM patient_general_info WHERE id = %s", (patient_id,))
+        row = cursor.fetchone()
+        cursor.close()
+        return row[0] if row else None
+    finally:
+        close_db_connection(connection)
+
+# 回填：表名 -> (读取一批记录的 SQL, 由记录计算派生列的函数, 写回的 SQL)
+BACKFILL_TABLES = {
+    'patient_general_info': (
+        """
+        SELECT id, last_menstrual_period, gestational_weeks, DATE(created_at) as entry_date,
+               height, pre_pregnancy_weight, pre_pregnancy_systolic, pre_pregnancy_diastolic
+        FROM patient_general_info
+        WHERE id > %s ORDER BY id LIMIT %s
+        """,
+        lambda row: general_info_features(
+            row['last_menstrual_period'], row['gestational_weeks'], row['entry_date'], row['height'],
+            row['pre_pregnancy_weight'], row['pre_pregnancy_systolic'], row['pre_pregnancy_diastolic']
+        ),
+        "UPDATE patient_general_info SET gestational_days = %s, derived_bmi = %s, derived_map = %s WHERE id = %s"
+    ),
+    'patient_lab_imaging': (
+        """
+        SELECT l.id, l.examination_date, p.last_menstrual_period
+        FROM patient_lab_imaging l
+        LEFT JOIN patient_general_info p ON p.id = l.patient_id
+        WHERE l.id > %s ORDER BY l.id LIMIT %s
+        """,
+        lambda row: (gestational_days_at(row['last_menstrual_period'], row['examination_date']),),
+        "UPDATE patient_lab_imaging SET gestational_days = %s WHERE id = %s"
+    ),
+    'patient_home_monitoring': (
+        # 监测日期缺失时与血压时间序列一致，按录入日期计算
+        """
+        SELECT h.id, COALESCE(h.home_monitoring_date, DATE(h.created_at)) as monitoring_date,
+               h.home_systolic, h.home_diastolic, p.last_menstrual_period
+        FROM patient_home_monitoring h
+        LEFT JOIN patient_general_info p ON p.id = h.patient_id
+        WHERE h.id > %s ORDER BY h.id LIMIT %s
+        """,
+        lambda row: (
+            gestational_days_at(row['last_menstrual_period'], row['monitoring_date']),
+            map_of(row['home_systolic'], row['home_diastolic'])
+        ),
+        "UPDATE patient_home_monitoring SET gestational_days = %s, derived_map = %s WHERE id = %s"
+    )
+}
+
+def backfill_table(connection, table: str, batch_size: int) -> int:
+    """按主键分批重新计算一张表的派生列，每批一个事务，返回更新的记录数"""
+    select_sql, compute, update_sql = BACKFILL_TABLES[table]
+    cursor = dict_cursor(connection)
+    after_id = 0
+    updated = 0
+    while True:
+        cursor.execute(select_sql, (after_id, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        cursor.executemany(update_sql, [(*compute(row), row['id']) for row in rows])
+        connection.commit()
+        after_id = rows[-1]['id']
+        updated += len(rows)
+    cursor.close()
+    return updated
+
+def backfill(batch_size: int = BACKFILL_BATCH_SIZE) -> dict:
+    """回填全部患者数据表的派生列，返回各表更新的记录数"""
+    connection = connect()
+    try:
+        counts = {}
+        for table in BACKFILL_TABLES:
+            started = time.perf_counter()
+            counts[table] = backfill_table(connection, table, batch_size)
+            if counts[table]:
+                # 记录被原地更新：使该表的 ETag 和按患者缓存的数据失效
+                bump_data_version(connection, table)
+                patient_invalidations.invalidate_all()
+            print(f"✅ {table}: {counts[table]} 条，耗时 {time.perf_counter() - started:.1f} 秒")
+        return counts
+    finally:
+        connection.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="回填患者派生特征")
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE)
+    args = parser.parse_args()
+
+    backfill(args.batch_size)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,123 @@
+"""
+事件推送模块
+进程内发布/订阅，将新写入的患者记录和预测结果推送给管理端的 SSE 连接。
+事件ID为 "{进程启动ID}-{序号}"：序号只在同一进程内连续，重连到其它 worker 或重启后的进程时
+Last-Event-ID 的启动ID不同，无法按序号补发，由调用方通知客户端重新加载
+"""
+
+import asyncio
+import itertools
+import threading
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+from config import EVENT_CONFIG
+
+class Subscription:
+    """单个订阅者：事件队列绑定在订阅时所在的事件循环上"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, event_types: Set[str], min_prediction: float):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=EVENT_CONFIG['queue_size'])
+        self.event_types = event_types
+        self.min_prediction = min_prediction
+        self.dropped = 0
+
+    def accepts(self, event: Dict[str, Any]) -> bool:
+        """按事件类型和预测风险阈值过滤"""
+        if event['type'] not in self.event_types:
+            return False
+        if event['type'] == 'prediction':
+            return (event['data'].get('prediction_result') or 0) >= self.min_prediction
+        return True
+
+    def offer(self, event: Optional[Dict[str, Any]]) -> None:
+        """放入事件，队列已满时丢弃最旧的事件（慢消费者不阻塞写入路径）"""
+        if self.queue.full():
+            try:
+                self.queue.get_nowait()
+                self.dropped += 1
+            except asyncio.QueueEmpty:
+                pass
+        self.queue.put_nowait(event)
+
+    def close(self) -> None:
+        """放入结束标记（None），推送连接收到后结束"""
+        self.offer(None)
+
+_subscribers: Set[Subscription] = set()
+_recent_events: deque = deque(maxlen=EVENT_CONFIG['replay_size'])
+_event_seqs = itertools.count(1)
+_last_seq = 0
+_lock = threading.Lock()
+
+# 本进程的启动ID，每个 worker、每次重启都不同
+BOOT_ID = uuid.uuid4().hex[:12]
+
+def event_id(seq: int) -> str:
+    return f"{BOOT_ID}-{seq}"
+
+def current_id() -> str:
+    """最近一条已发布事件的ID（尚无事件时序号为 0）"""
+    return event_id(_last_seq)
+
+def subscribe(event_types: Set[str], min_prediction: float) -> Subscription:
+    """创建订阅（需在事件循环中调用）"""
+    subscription = Subscription(asyncio.get_running_loop(), event_types, min_prediction)
+    with _lock:
+        _subscribers.add(subscription)
+    return subscription
+
+def unsubscribe(subscription: Subscription) -> None:
+    """取消订阅"""
+    with _lock:
+        _subscribers.discard(subscription)
+
+def close_all() -> None:
+    """停机时结束所有推送连接（线程安全）"""
+    with _lock:
+        subscribers = list(_subscribers)
+    for subscription in subscribers:
+        try:
+            subscription.loop.call_soon_threadsafe(subscription.close)
+        except RuntimeError:
+            unsubscribe(subscription)
+
+def recent_events(last_event_id: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    获取 Last-Event-ID 之后的最近事件，用于断线重连时补发。ID 来自其它进程（启动ID不同）、
+    格式无效，或之后的事件已超出补发缓冲区时返回 None，表示无法补发、需要完整重新加载
+    """
+    boot_id, _, seq = last_event_id.rpartition('-')
+    if boot_id != BOOT_ID or not seq.isdigit():
+        return None
+    after_seq = int(seq)
+    with _lock:
+        if after_seq > _last_seq:
+            return None
+        if _recent_events and _recent_events[0]['seq'] > after_seq + 1:
+            return None
+        return [event for event in _recent_events if event['seq'] > after_seq]
+
+def publish(event_type: str, data: Dict[str, Any]) -> None:
+    """发布事件（线程安全，可在同步写入路径中直接调用）"""
+    global _last_seq
+    with _lock:
+        _last_seq = next(_event_seqs)
+        event = {
+            'id': event_id(_last_seq),
+            'seq': _last_seq,
+            'type': event_type,
+            'time': datetime.now(),
+            'data': data
+        }
+        _recent_events.append(event)
+        subscribers = [s for s in _subscribers if s.accepts(event)]
+
+    for subscription in subscribers:
+        try:
+            subscription.loop.call_soon_threadsafe(subscription.offer, event)
+        except RuntimeError:
+            # 订阅者所在事件循环已关闭
+            unsubscribe(subscription)
\ No newline at end of file
@@ -0,0 +1,130 @@
+"""
+并发查询模块
+管理端接口中互不依赖的查询（各模型表、检查、监测、计数）各自从连接池取连接并发执行，
+接口耗时由各查询耗时之和降为其中的最大值。
+
+每个请求的查询总时长不超过 ADMIN_FANOUT_TIMEOUT 秒；超时或失败的查询按部分结果处理：
+必需的查询缺失时返回 504（超时）或 500，其它查询缺失时照常返回，并在结果中列出缺失的查询名。
+ADMIN_FANOUT_PARTIAL=false 时任一查询缺失都返回错误。
+
+超时在数据库端生效：MySQL 查询带 MAX_EXECUTION_TIME 提示（剩余时长），SQLite 在超时时 interrupt()
+正在执行的语句，执行线程随即结束并归还连接。并发数不超过连接池当前的空闲连接数，连接池已满时依次执行
+"""
+
+import asyncio
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from fastapi import HTTPException
+from config import FANOUT_CONFIG
+import database
+from utils import to_thread
+
+# 查询名 -> (SQL, 参数, 是否读取全部行)；只读取一行时结果为该行或 None
+Queries = Dict[str, Tuple[str, Sequence[Any], bool]]
+
+# 超时中断后等待执行线程结束、归还连接的时间（秒）
+INTERRUPT_GRACE = 1.0
+
+class QueryCancelled(Exception):
+    """请求已超时，不再开始新的查询"""
+
+class RunningQueries:
+    """一个请求中正在执行的查询所占用的连接，超时后统一中断"""
+
+    def __init__(self):
+        self._connections: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self.cancelled = False
+
+    def start(self, name: str, connection) -> None:
+        with self._lock:
+            if self.cancelled:
+                raise QueryCancelled(name)
+            self._connections[name] = connection
+
+    def finish(self, name: str) -> None:
+        # 归还连接之前移除，避免中断复用该连接的其它请求
+        with self._lock:
+            self._connections.pop(name, None)
+
+    def interrupt(self) -> None:
+        with self._lock:
+            self.cancelled = True
+            for connection in self._connections.values():
+                try:
+                    database.interrupt(connection)
+                except Exception as e:
+                    print(f"中断超时查询失败: {e}")
+
+def run_query(sql: str, params: Sequence[Any], fetch_all: bool, deadline: Optional[float] = None,
+              running: Optional[RunningQueries] = None, name: str = '') -> Any:
+    """在连接池的一个连接上执行查询；deadline（time.monotonic()）为数据库端的执行时间上限"""
+    connection = database.pool.acquire()
+    try:
+        if running is not None:
+            running.start(name, connection)
+        if deadline is not None:
+            sql = database.with_statement_timeout(sql, max(deadline - time.monotonic(), 0.001))
+        cursor = database.dict_cursor(connection)
+        cursor.execute(sql, params)
+        result = cursor.fetchall() if fetch_all else cursor.fetchone()
+        cursor.close()
+        return result
+    finally:
+        if running is not None:
+            running.finish(name)
+        database.pool.release(connection)
+
+def parallelism(query_count: int) -> int:
+    """本次可同时执行的查询数：不超过 ADMIN_FANOUT_MAX_PARALLEL 和连接池的空闲连接数，至少为 1（依次执行）"""
+    return max(1, min(FANOUT_CONFIG['max_parallel'], database.pool.available(), query_count))
+
+async def fan_out(queries: Queries, required: Sequence[str] = ()) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    并发执行查询，返回 (结果, 缺失的查询名)。
+    超时的查询在数据库端中断，执行线程结束并归还连接后（最多 INTERRUPT_GRACE 秒）才返回
+    """
+    timeout = FANOUT_CONFIG['timeout']
+    deadline = time.monotonic() + timeout
+    semaphore = asyncio.Semaphore(parallelism(len(queries)))
+    running = RunningQueries()
+
+    async def run(name: str, sql: str, params: Sequence[Any], fetch_all: bool) -> Any:
+        async with semaphore:
+            if running.cancelled:
+                raise QueryCancelled(name)
+            return await to_thread(run_query, sql, params, fetch_all, deadline, running, name)
+
+    tasks = {name: asyncio.create_task(run(name, *query)) for name, query in queries.items()}
+    _, pending = await asyncio.wait(tasks.values(), timeout=timeout)
+    timed_out = {name for name, task in tasks.items() if task in pending}
+    if pending:
+        running.interrupt()
+        _, still_running = await asyncio.wait(pending, timeout=INTERRUPT_GRACE)
+        for task in still_running:
+            task.cancel()
+
+    results: Dict[str, Any] = {}
+    missing: List[str] = []
+    errors: Dict[str, Exception] = {}
+    for name, task in tasks.items():
+        if name in timed_out:
+            if task.done() and not task.cancelled():
+                # 被中断的语句抛出的异常即超时本身
+                task.exception()
+            missing.append(name)
+        elif task.exception() is not None:
+            missing.append(name)
+            errors[name] = task.exception()
+            print(f"并发查询 {name} 失败: {task.exception()}")
+        else:
+            results[name] = task.result()
+
+    fatal = [name for name in missing if name in required or not FANOUT_CONFIG['partial']]
+    if fatal:
+        failed = [name for name in fatal if name in errors]
+        if failed:
+            raise HTTPException(status_code=500, detail=f"查询失败: {errors[failed[0]]}")
+        raise HTTPException(status_code=504, detail=f"查询超时（{timeout} 秒）: {', '.join(fatal)}")
+    return results, missing
\ No newline at end of file
@@ -0,0 +1,92 @@
+"""
+预测接口快速路径
+/predict/* 四个模型接口调用频率高，而计算本身只需几微秒，主要耗时在框架的路由、依赖解析、
+请求体 JSON 解析和 response_model 二次校验上。快速路径在 ASGI 层直接处理这些请求：
+用 Pydantic 编译好的校验器从原始字节解析请求体（model_validate_json），
+结果不再经过 response_model 校验，直接用 orjson 编码为字节。
+
+路由仍在 main.py 中正常声明，OpenAPI 文档不变；请求体校验失败、非 JSON 请求等情况
+交给原路由处理，错误响应与原来完全一致。APP_FAST_PREDICT=false 可关闭快速路径。
+"""
+
+from typing import Callable, Dict, Optional, Tuple, Type
+from fastapi import HTTPException
+from pydantic import BaseModel, ValidationError
+from config import APP_CONFIG
+from models import (
+    FGRPredictionRequest, FGRNeonatalPredictionRequest,
+    MaternalCOXPredictionRequest, NeonatalCOXPredictionRequest
+)
+from prediction_models import (
+    predict_fgr, predict_fgr_neonatal, predict_maternal_cox, predict_neonatal_cox
+)
+from serialization import dumps
+from idempotency import replay_receive
+
+# 路径 -> (请求模型, 预测函数)
+FAST_ROUTES: Dict[str, Tuple[Type[BaseModel], Callable]] = {
+    '/predict/fgr': (FGRPredictionRequest, predict_fgr),
+    '/predict/fgr-neonatal': (FGRNeonatalPredictionRequest, predict_fgr_neonatal),
+    '/predict/maternal-cox': (MaternalCOXPredictionRequest, predict_maternal_cox),
+    '/predict/neonatal-cox': (NeonatalCOXPredictionRequest, predict_neonatal_cox)
+}
+
+_JSON_HEADERS = [(b'content-type', b'application/json')]
+
+def _is_json(scope) -> bool:
+    """与 FastAPI 相同：未指定 Content-Type 或为 application/json、application/*+json"""
+    for name, value in scope['headers']:
+        if name == b'content-type':
+            media_type = value.split(b';', 1)[0].strip().lower()
+            return media_type == b'application/json' or (
+                media_type.startswith(b'application/') and media_type.endswith(b'+json')
+            )
+    return True
+
+class FastPredictMiddleware:
+    """预测接口的快速路径，其它请求原样交给应用"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        route = None
+        if scope['type'] == 'http' and scope['method'] == 'POST' and APP_CONFIG['fast_predict']:
+            route = FAST_ROUTES.get(scope['path'])
+        if route is None or not _is_json(scope):
+            await self.app(scope, receive, send)
+            return
+
+        body = b''
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get('body', b'')
+            more_body = message.get('more_body', False)
+
+        model, predict = route
+        try:
+            request = model.model_validate_json(body)
+        except ValidationError:
+            # 由原路由生成标准的 422 响应
+            await self.app(scope, replay_receive(body, receive), send)
+            return
+
+        try:
+            result = predict(request)
+        except HTTPException as e:
+            await _send(send, e.status_code, dumps({"detail": e.detail}), e.headers)
+            return
+
+        await _send(send, 200, dumps({
+            "prediction": result.prediction,
+            "message": result.message,
+            "additional_info": result.additional_info
+        }))
+
+async def _send(send, status_code: int, body: bytes, headers: Optional[Dict[str, str]] = None) -> None:
+    raw_headers = _JSON_HEADERS + [(b'content-length', str(len(body)).encode())]
+    if headers:
+        raw_headers += [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()]
+    await send({'type': 'http.response.start', 'status': status_code, 'headers': raw_headers})
+    await send({'type': 'http.response.body', 'body': body})
\ No newline at end of file
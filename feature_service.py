@@ -0,0 +1,159 @@
+"""
+模型特征汇总服务模块
+从已保存的患者数据在服务端组装COX模型的输入特征
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Dict, List, Optional
+from fastapi import HTTPException
+from config import FEATURE_CONFIG
+from database import get_db_connection, close_db_connection, dict_cursor
+from models import (
+    MaternalCOXPredictionRequest, NeonatalCOXPredictionRequest,
+    MaternalCOXPatientRequest, NeonatalCOXPatientRequest
+)
+from bp_timeseries import maternal_cox_inputs
+from shared_state import patient_invalidations
+from utils import calculate_gestational_days
+
+# 患者ID -> (过期时间, 特征)
+_feature_cache: 'OrderedDict[int, tuple]' = OrderedDict()
+_cache_lock = threading.Lock()
+
+def _drop_cached(patient_id: Optional[int]) -> None:
+    """清除单个患者的缓存特征，None 表示清空全部"""
+    with _cache_lock:
+        if patient_id is None:
+            _feature_cache.clear()
+        else:
+            _feature_cache.pop(patient_id, None)
+
+def invalidate_patient_features(patient_id: Optional[int]) -> None:
+    """患者有新数据写入时清除特征缓存，并通知同一主机的其它 worker"""
+    if patient_id is None:
+        return
+    _drop_cached(patient_id)
+    patient_invalidations.publish(patient_id)
+
+patient_invalidations.subscribe(_drop_cached)
+
+def _query_patient_features(patient_id: int) -> Optional[Dict[str, Any]]:
+    """一条语句取回末次月经、最近一次实验室检查和最近一次家庭血压"""
+    connection = get_db_connection()
+    if not connection:
+        raise HTTPException(status_code=500, detail="数据库连接失败")
+
+    try:
+        cursor = dict_cursor(connection)
+        cursor.execute("""
+        SELECT p.id, p.last_menstrual_period,
+               l.examination_date, l.platelet_count, l.creatinine, l.alt, l.urine_protein_24h,
+               h.home_monitoring_date, h.home_systolic, h.home_diastolic
+        FROM patient_general_info p
+        LEFT JOIN patient_lab_imaging l ON l.id = (
+            SELECT li.id FROM patient_lab_imaging li
+            WHERE li.patient_id = p.id
+            ORDER BY li.examination_date DESC, li.id DESC
+            LIMIT 1
+        )
+        LEFT JOIN patient_home_monitoring h ON h.id = (
+            SELECT hm.id FROM patient_home_monitoring hm
+            WHERE hm.patient_id = p.id AND hm.home_systolic IS NOT NULL
+            ORDER BY hm.home_monitoring_date DESC, hm.id DESC
+            LIMIT 1
+        )
+        WHERE p.id = %s
+        """, (patient_id,))
+        row = cursor.fetchone()
+        cursor.close()
+        return row
+    finally:
+        close_db_connection(connection)
+
+def get_patient_features(patient_id: int) -> Dict[str, Any]:
+    """获取患者特征（带短时缓存），患者不存在时返回404"""
+    patient_invalidations.poll()
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _feature_cache.get(patient_id)
+        if cached and cached[0] > now:
+            _feature_cache.move_to_end(patient_id)
+            return cached[1]
+
+    row = _query_patient_features(patient_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"患者 {patient_id} 不存在")
+
+    features = {
+        "lmp_date": row['last_menstrual_period'],
+        "examination_date": row['examination_date'],
+        "plt": _to_float(row['platelet_count']),
+        "cr": _to_float(row['creatinine']),
+        "alt": _to_float(row['alt']),
+        "up24": _to_float(row['urine_protein_24h']),
+        "home_monitoring_date": row['home_monitoring_date'],
+        "latest_sbp": _to_float(row['home_systolic']),
+        "latest_dbp": _to_float(row['home_diastolic']),
+        # 收缩压最大值取自血压时间序列（已缓存时无需再查询）
+        "sbpmax": maternal_cox_inputs(patient_id)['sbpmax']
+    }
+
+    with _cache_lock:
+        _feature_cache[patient_id] = (now + FEATURE_CONFIG['cache_ttl'], features)
+        while len(_feature_cache) > FEATURE_CONFIG['cache_size']:
+            _feature_cache.popitem(last=False)
+    return features
+
+def _to_float(value: Any) -> Optional[float]:
+    """数据库返回的 Decimal 转换为 float"""
+    return float(value) if value is not None else None
+
+def _require(values: Dict[str, Any]) -> None:
+    """缺少必需特征时返回422，并说明缺少哪些字段"""
+    missing: List[str] = [name for name, value in values.items() if value is None]
+    if missing:
+        raise HTTPException(
+            status_code=422,
+            detail=f"患者数据缺少以下特征，请先录入或在请求中提供: {', '.join(missing)}"
+        )
+
+def build_maternal_cox_request(patient_id: int, request: MaternalCOXPatientRequest) -> MaternalCOXPredictionRequest:
+    """组装母体COX模型输入，请求中提供的值优先"""
+    features = get_patient_features(patient_id)
+    values = {
+        "plt": request.plt if request.plt is not None else features['plt'],
+        "cr": request.cr if request.cr is not None else features['cr'],
+        "up24": request.up24 if request.up24 is not None else features['up24'],
+        "alt": request.alt if request.alt is not None else features['alt'],
+        "sbpmax": request.sbpmax if request.sbpmax is not None else features['sbpmax']
+    }
+    _require(values)
+    return MaternalCOXPredictionRequest(pdas=request.pdas, cox1_time=request.cox1_time, **values)
+
+def build_neonatal_cox_request(patient_id: int, request: NeonatalCOXPatientRequest) -> NeonatalCOXPredictionRequest:
+    """组装新生儿COX模型输入，请求中提供的值优先，入院日期默认为当天"""
+    features = get_patient_features(patient_id)
+    values = {
+        "lmp_date": features['lmp_date'],
+        "admission_date": request.admission_date or date.today(),
+        "sbp_admission": request.sbp_admission if request.sbp_admission is not None else features['latest_sbp'],
+        "dbp_admission": request.dbp_admission if request.dbp_admission is not None else features['latest_dbp'],
+        "cr2": request.cr2 if request.cr2 is not None else features['cr']
+    }
+    _require(values)
+    return NeonatalCOXPredictionRequest(
+        gda_group=request.gda_group, cox2_time=request.cox2_time, nst=request.nst, **values
+    )
+
+def describe_features(patient_id: int, admission_date: Optional[date] = None) -> Dict[str, Any]:
+    """返回用于预测的患者特征及孕天数，附加在预测结果中便于核对"""
+    features = get_patient_features(patient_id)
+    described = dict(features)
+    if features['lmp_date']:
+        described['gestational_days'] = calculate_gestational_days(
+            features['lmp_date'], admission_date or date.today()
+        )
+    return described
\ No newline at end of file
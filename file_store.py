@@ -0,0 +1,459 @@
+"""
+上传文件存储模块
+家庭监测的胎心监护（CTG）和尿检文件不再整体读入内存写入 BLOB 列：按 UPLOAD_CHUNK_SIZE 分块读取 UploadFile，
+边读边计算 SHA-256 并写入临时文件，完成后按内容哈希移入存储目录（UPLOAD_DIR/哈希前两位/哈希，
+相同内容只保存一份），数据库只记录哈希（stored_files 表记录大小和类型）。
+
+写入时按内容选择压缩方式（UPLOAD_COMPRESSION=auto 时优先 zstd，未安装 zstandard 时使用 gzip）：
+已压缩的格式（图片、压缩包等，按文件头识别）和试压缩第一个分块后节省不到 10% 的内容原样保存。
+stored_files 记录原始大小、保存大小和压缩方式；读取时客户端支持该压缩方式则原样发送并带 Content-Encoding，
+否则边读边解压。
+
+单个文件超过 UPLOAD_MAX_FILE_MB 或整个请求超过 UPLOAD_MAX_REQUEST_MB 时返回 413；两者都在接收请求体时
+检查（UploadLimitMiddleware 按 multipart 分隔行统计每个部分的大小），超限的请求不会被完整接收，
+也不会先缓存到临时文件。
+
+stored_files.pending 为正在使用该内容、尚未保存监测记录的请求数：上传时加一（与移入存储目录在同一事务中），
+记录保存后减一（release_uploads）；保存失败时减一，没有其它请求使用、也没有监测记录引用时删除文件
+（discard_uploads）。登记和删除都在持有 stored_files 行（SQLite 为写锁）的事务中进行，
+并发上传相同内容的请求不会在另一个请求失败时失去文件。迁移前写入 BLOB 列的记录保持不变
+"""
+
+import hashlib
+import os
+import tempfile
+import zlib
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse, StreamingResponse
+from config import UPLOAD_CONFIG
+from response_compression import accepts, encoded_etag
+from database import errors, get_db_connection, close_db_connection, is_duplicate_key
+from utils import to_thread
+
+try:
+    import zstandard
+except ImportError:  # 未安装 zstandard 时使用 gzip
+    zstandard = None
+
+MB = 1024 * 1024
+
+# 压缩方式 -> (压缩器工厂, 解压器工厂)，压缩器有 compress/flush，解压器有 decompress
+CODECS: Dict[str, Tuple[Callable[[], Any], Callable[[], Any]]] = {
+    'gzip': (lambda: zlib.compressobj(6, zlib.DEFLATED, 31), lambda: zlib.decompressobj(31))
+}
+if zstandard is not None:
+    CODECS['zstd'] = (
+        lambda: zstandard.ZstdCompressor(level=3).compressobj(),
+        lambda: zstandard.ZstdDecompressor().decompressobj()
+    )
+
+# 已压缩格式的文件头：gzip、zstd、zip（含 docx/xlsx）、7z、bzip2、xz、PNG、JPEG、GIF、RIFF（WebP 等）
+COMPRESSED_SIGNATURES = (
+    b'\x1f\x8b', b'\x28\xb5\x2f\xfd', b'PK\x03\x04', b"7z\xbc\xaf'\x1c", b'BZh', b'\xfd7zXZ\x00',
+    b'\x89PNG', b'\xff\xd8\xff', b'GIF8', b'RIFF'
+)
+# 试压缩文件开头的字节数；试压缩后大小超过原始大小的 MAX_COMPRESSED_RATIO 时不压缩
+SNIFF_BYTES = 64 * 1024
+MAX_COMPRESSED_RATIO = 0.9
+# 读取文件时每块的大小
+READ_CHUNK_SIZE = 64 * 1024
+# 接收请求体时统计的 multipart 部分大小包含该部分的头部（字段名、文件名、类型），按此余量放宽单文件上限，
+# 精确的大小在 store_upload 中检查
+PART_HEADER_ALLOWANCE = 16 * 1024
+
+def preferred_codec() -> Optional[str]:
+    """UPLOAD_COMPRESSION 指定的压缩方式（auto 优先 zstd），none 时返回 None"""
+    setting = UPLOAD_CONFIG['compression']
+    if setting == 'none':
+        return None
+    if setting == 'auto':
+        return 'zstd' if 'zstd' in CODECS else 'gzip'
+    if setting not in CODECS:
+        raise ValueError(f"不支持的压缩方式: {setting}（可选 {', '.join(['auto', 'none', *CODECS])}）")
+    return setting
+
+def choose_encoding(first_chunk: bytes) -> Tuple[str, Optional[Any]]:
+    """
+    按第一个分块选择压缩方式，返回 (encoding, 压缩器)；不压缩时为 ('identity', None)。
+    可压缩性用快速的 deflate 试压缩开头 SNIFF_BYTES 字节估算
+    """
+    codec = preferred_codec()
+    if codec is None or not first_chunk or first_chunk.startswith(COMPRESSED_SIGNATURES):
+        return 'identity', None
+    sample = first_chunk[:SNIFF_BYTES]
+    if len(zlib.compress(sample, 1)) > len(sample) * MAX_COMPRESSED_RATIO:
+        return 'identity', None
+    return codec, CODECS[codec][0]()
+
+class StoredFile:
+    """已保存的上传文件"""
+
+    def __init__(self, sha256: str, size: int, content_type: Optional[str],
+                 stored_size: Optional[int] = None, encoding: str = 'identity', created: bool = False):
+        self.sha256 = sha256
+        self.size = size
+        self.content_type = content_type
+        self.stored_size = size if stored_size is None else stored_size
+        self.encoding = encoding
+        # 本次上传新登记了该内容（而不是与已有的相同内容合并）
+        self.created = created
+
+    @property
+    def ratio(self) -> float:
+        """压缩比（原始大小 / 保存大小）"""
+        return self.size / self.stored_size if self.stored_size else 1.0
+
+class _FileWriter:
+    """把分块写入临时文件：计算原始内容的哈希，按第一个分块选择的方式压缩（在线程中执行）"""
+
+    def __init__(self, f):
+        self._f = f
+        self._digest = hashlib.sha256()
+        self._compressor = None
+        self.encoding: Optional[str] = None
+        self.size = 0
+        self.stored_size = 0
+
+    def _emit(self, data: bytes) -> None:
+        if data:
+            self._f.write(data)
+            self.stored_size += len(data)
+
+    def write(self, chunk: bytes) -> None:
+        self._digest.update(chunk)
+        self.size += len(chunk)
+        if self.encoding is None:
+            self.encoding, self._compressor = choose_encoding(chunk)
+        self._emit(self._compressor.compress(chunk) if self._compressor else chunk)
+
+    def finish(self) -> str:
+        """结束写入，返回原始内容的 SHA-256"""
+        if self._compressor is not None:
+            self._emit(self._compressor.flush())
+        if self.encoding is None:
+            self.encoding = 'identity'
+        return self._digest.hexdigest()
+
+def stored_path(sha256: str) -> str:
+    return os.path.join(UPLOAD_CONFIG['dir'], sha256[:2], sha256)
+
+def _temp_dir() -> str:
+    # 与存储目录在同一文件系统，完成后可直接重命名
+    path = os.path.join(UPLOAD_CONFIG['dir'], 'tmp')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def _commit(stored: StoredFile, temp_path: str) -> bool:
+    """
+    登记文件（大小、类型和压缩方式，相同内容只登记一次）并将 pending 加一，在同一事务中把临时文件移入存储目录
+    （已登记的内容丢弃临时文件）；返回是否新登记了该内容
+    """
+    path = stored_path(stored.sha256)
+    connection = get_db_connection()
+    if not connection:
+        raise HTTPException(status_code=500, detail="数据库连接失败")
+    moved = False
+    try:
+        cursor = connection.cursor()
+        created = None
+        for _ in range(2):
+            cursor.execute("UPDATE stored_files SET pending = pending + 1 WHERE sha256 = %s", (stored.sha256,))
+            if cursor.rowcount:
+                created = False
+                break
+            try:
+                cursor.execute("""
+                INSERT INTO stored_files (sha256, size, content_type, stored_size, encoding, pending)
+                VALUES (%s, %s, %s, %s, %s, 1)
+                """, (stored.sha256, stored.size, stored.content_type, stored.stored_size, stored.encoding))
+                created = True
+                break
+            except errors() as e:
+                # 并发上传的相同内容先登记：重新按已登记处理
+                if not is_duplicate_key(e):
+                    raise
+        if created is None:
+            raise HTTPException(status_code=500, detail="文件登记失败")
+
+        if created:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
+            moved = True
+        else:
+            os.remove(temp_path)
+        connection.commit()
+        cursor.close()
+        return created
+    except BaseException as e:
+        connection.rollback()
+        if moved and os.path.exists(path):
+            os.remove(path)
+        if isinstance(e, errors()):
+            raise HTTPException(status_code=500, detail=f"数据库操作失败: {str(e)}")
+        raise
+    finally:
+        close_db_connection(connection)
+
+async def store_upload(upload: UploadFile, field: str) -> StoredFile:
+    """分块读取上传文件，压缩后保存，内存中最多保留一个分块；超过单文件上限时返回 413"""
+    limit = UPLOAD_CONFIG['max_file_bytes']
+    fd, temp_path = tempfile.mkstemp(dir=await to_thread(_temp_dir))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            writer = _FileWriter(f)
+            while True:
+                chunk = await upload.read(UPLOAD_CONFIG['chunk_size'])
+                if not chunk:
+                    break
+                if writer.size + len(chunk) > limit:
+                    raise HTTPException(status_code=413, detail=f"{field} 超过 {limit / MB:g} MB")
+                # 哈希和压缩在线程中执行，不阻塞事件循环
+                await to_thread(writer.write, chunk)
+            sha256 = await to_thread(writer.finish)
+        stored = StoredFile(sha256, writer.size, upload.content_type, writer.stored_size, writer.encoding)
+        stored.created = await to_thread(_commit, stored, temp_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return stored
+
+def _unpin(connection, sha256: str) -> None:
+    cursor = connection.cursor()
+    cursor.execute("UPDATE stored_files SET pending = pending - 1 WHERE sha256 = %s AND pending > 0", (sha256,))
+    cursor.close()
+
+def _release(stored: StoredFile) -> None:
+    connection = get_db_connection()
+    if not connection:
+        raise HTTPException(status_code=500, detail="数据库连接失败")
+    try:
+        _unpin(connection, stored.sha256)
+        connection.commit()
+    finally:
+        close_db_connection(connection)
+
+def _discard(stored: StoredFile) -> None:
+    """pending 减一；没有其它请求使用、也没有监测记录引用时，在同一事务中删除 stored_files 记录和文件"""
+    connection = get_db_connection()
+    if not connection:
+        raise HTTPException(status_code=500, detail="数据库连接失败")
+    try:
+        _unpin(connection, stored.sha256)
+        cursor = connection.cursor()
+        cursor.execute("""
+        DELETE FROM stored_files
+        WHERE sha256 = %s AND pending = 0 AND NOT EXISTS (
+            SELECT 1 FROM patient_home_monitoring
+            WHERE fetal_monitoring_file_sha256 = %s OR urine_test_file_sha256 = %s
+        )
+        """, (stored.sha256, stored.sha256, stored.sha256))
+        if cursor.rowcount:
+            path = stored_path(stored.sha256)
+            if os.path.exists(path):
+                os.remove(path)
+        connection.commit()
+        cursor.close()
+    except BaseException:
+        connection.rollback()
+        raise
+    finally:
+        close_db_connection(connection)
+
+async def release_uploads(stored_files: Iterable[StoredFile]) -> None:
+    """监测记录保存后 pending 减一（记录已引用文件，不再需要保留）"""
+    for stored in stored_files:
+        try:
+            await to_thread(_release, stored)
+        except Exception as e:
+            print(f"释放上传文件失败 {stored.sha256}: {e}")
+
+async def discard_uploads(stored_files: Iterable[StoredFile]) -> None:
+    """保存记录失败时 pending 减一，删除不再被使用或引用的文件（并发上传的相同内容保留）"""
+    for stored in stored_files:
+        try:
+            await to_thread(_discard, stored)
+        except Exception as e:
+            print(f"删除未保存记录的上传文件失败 {stored.sha256}: {e}")
+
+def _read_chunks(path: str, encoding: str) -> Iterator[bytes]:
+    """按块读取保存的文件，encoding 不为 identity 时边读边解压"""
+    decompressor = CODECS[encoding][1]() if encoding != 'identity' else None
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            data = decompressor.decompress(chunk) if decompressor else chunk
+            if data:
+                yield data
+        if decompressor is not None and hasattr(decompressor, 'flush'):
+            rest = decompressor.flush()
+            if rest:
+                yield rest
+
+def file_response(stored: StoredFile, accept_encoding: str, filename: str) -> StreamingResponse:
+    """
+    下载保存的文件：客户端支持保存时的压缩方式则原样发送（Content-Encoding），否则边读边解压。
+    ETag 按发送的表示区分（原始内容为 "sha256"，压缩内容为 "sha256-zstd" 等），响应带 Vary: Accept-Encoding；
+    X-Stored-Size 和 X-Compression-Ratio 为该文件的保存大小和压缩比
+    """
+    path = stored_path(stored.sha256)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="文件不存在")
+
+    headers = {
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "X-Stored-Size": str(stored.stored_size),
+        "X-Compression-Ratio": f"{stored.ratio:.2f}",
+        "Vary": "Accept-Encoding"
+    }
+    if stored.encoding == 'identity' or accepts(accept_encoding, stored.encoding):
+        # 原样发送保存的内容
+        decode = 'identity'
+        headers["Content-Length"] = str(stored.stored_size)
+        if stored.encoding != 'identity':
+            headers["Content-Encoding"] = stored.encoding
+        headers["ETag"] = encoded_etag(f'"{stored.sha256}"', stored.encoding)
+    else:
+        decode = stored.encoding
+        headers["Content-Length"] = str(stored.size)
+        headers["ETag"] = f'"{stored.sha256}"'
+    return StreamingResponse(
+        _read_chunks(path, decode), media_type=stored.content_type or 'application/octet-stream', headers=headers
+    )
+
+def compression_stats() -> Dict[str, Dict[str, Any]]:
+    """各压缩方式的文件数、原始大小、保存大小和压缩比"""
+    connection = get_db_connection()
+    if not connection:
+        raise HTTPException(status_code=500, detail="数据库连接失败")
+    try:
+        cursor = connection.cursor()
+        cursor.execute("""
+        SELECT encoding, COUNT(*), SUM(size), SUM(stored_size), MIN(size * 1.0 / stored_size), MAX(size * 1.0 / stored_size)
+        FROM (SELECT encoding, size, COALESCE(stored_size, size) AS stored_size FROM stored_files) f
+        WHERE stored_size > 0
+        GROUP BY encoding
+        """)
+        rows = cursor.fetchall()
+        cursor.close()
+    finally:
+        close_db_connection(connection)
+
+    return {
+        encoding: {
+            "files": count,
+            "size": int(size),
+            "stored_size": int(stored_size),
+            "ratio": round(float(size) / float(stored_size), 2),
+            "min_ratio": round(float(min_ratio), 2),
+            "max_ratio": round(float(max_ratio), 2)
+        }
+        for encoding, count, size, stored_size, min_ratio, max_ratio in rows
+    }
+
+class RequestTooLarge(HTTPException):
+    """请求体超过 UPLOAD_MAX_REQUEST_MB（在路由中由 FastAPI 返回 413）"""
+
+    def __init__(self, limit: int):
+        super().__init__(status_code=413, detail=f"请求体超过 {limit / MB:g} MB")
+
+class FileTooLarge(HTTPException):
+    """multipart 请求中单个部分超过 UPLOAD_MAX_FILE_MB"""
+
+    def __init__(self, limit: int):
+        super().__init__(status_code=413, detail=f"上传的文件超过 {limit / MB:g} MB")
+
+def multipart_boundary(content_type: bytes) -> Optional[bytes]:
+    """multipart/form-data 请求的分隔符，其它类型返回 None"""
+    media_type, _, params = content_type.partition(b';')
+    if media_type.strip().lower() != b'multipart/form-data':
+        return None
+    for param in params.split(b';'):
+        name, _, value = param.strip().partition(b'=')
+        if name.lower() == b'boundary' and value:
+            return value.strip(b'"')
+    return None
+
+class PartSizeCounter:
+    """
+    边接收 multipart 请求体边统计当前部分的字节数（从上一个分隔行之后算起，包含部分头部）。
+    只查找分隔行，不解析内容；跨分块的分隔行由保留的上一分块末尾字节拼接识别
+    """
+
+    def __init__(self, boundary: bytes, limit: int):
+        self._delimiter = b'\r\n--' + boundary
+        self._limit = limit
+        # 请求体以 --boundary 开头（前面没有 CRLF）
+        self._tail = b'\r\n'
+        self.part_size = 0
+
+    def feed(self, data: bytes) -> None:
+        buffer = self._tail + data
+        end = buffer.rfind(self._delimiter)
+        if end >= 0:
+            self.part_size = len(buffer) - end - len(self._delimiter)
+        else:
+            self.part_size += len(data)
+        self._tail = buffer[-(len(self._delimiter) - 1):]
+        if self.part_size > self._limit + PART_HEADER_ALLOWANCE:
+            raise FileTooLarge(self._limit)
+
+class UploadLimitMiddleware:
+    """
+    上传接口的请求体大小限制：Content-Length 超限时直接拒绝，否则边接收边计数；
+    multipart 请求同时统计每个部分的大小，单个文件超限时不等整个部分接收完就返回 413
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not scope['path'].startswith(UPLOAD_CONFIG['paths']):
+            await self.app(scope, receive, send)
+            return
+
+        limit = UPLOAD_CONFIG['max_request_bytes']
+        headers = dict(scope['headers'])
+        content_length = headers.get(b'content-length')
+        if content_length and content_length.isdigit() and int(content_length) > limit:
+            await _too_large(scope, receive, send, RequestTooLarge(limit))
+            return
+
+        boundary = multipart_boundary(headers.get(b'content-type', b''))
+        parts = PartSizeCounter(boundary, UPLOAD_CONFIG['max_file_bytes']) if boundary else None
+        received = 0
+        started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                body = message.get('body', b'')
+                received += len(body)
+                if received > limit:
+                    raise RequestTooLarge(limit)
+                if parts is not None and body:
+                    parts.feed(body)
+            return message
+
+        async def tracking_send(message):
+            nonlocal started
+            if message['type'] == 'http.response.start':
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except (RequestTooLarge, FileTooLarge) as e:
+            # 在路由之外（如幂等中间件读取请求体时）超限
+            if started:
+                raise
+            await _too_large(scope, receive, send, e)
+
+async def _too_large(scope, receive, send, error: HTTPException) -> None:
+    # 请求体未读完，响应后关闭连接
+    response = JSONResponse({"detail": error.detail}, status_code=413, headers={"Connection": "close"})
+    await response(scope, receive, send)
\ No newline at end of file
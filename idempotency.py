@@ -0,0 +1,315 @@
+"""
+幂等请求模块
+客户端在 /predict/* 和 /api/patient/* 的 POST 请求中携带 Idempotency-Key 请求头，
+超时重试时返回第一次请求的响应，不会重复写入预测结果和患者数据。
+
+幂等键按客户端（限流的客户端标识和请求携带的 API Key）区分，保存为 (客户端, 键) 的哈希，
+不同客户端使用相同的 UUID 互不影响。
+处理中的记录带租约（lease_id、locked_at）：请求失败、客户端断开或任务取消时释放，
+进程崩溃未能释放的记录在 IDEMPOTENCY_LEASE_SECONDS 后由重试的请求接管
+"""
+
+import asyncio
+import hashlib
+import tempfile
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+from fastapi.responses import JSONResponse
+from config import IDEMPOTENCY_CONFIG
+from database import errors, get_db_connection, close_db_connection, dict_cursor, is_duplicate_key
+from rate_limit import api_key, client_key
+from utils import to_thread
+
+# 不保存的响应状态（除 5xx 外）：超时、冲突、限流，客户端用相同的键重试应重新处理
+RETRYABLE_STATUSES = (408, 409, 429)
+
+class _StoreUnavailable(Exception):
+    """幂等键存储不可用"""
+
+class _RequestHasher:
+    """请求指纹：方法、路径、查询参数和请求体（multipart 请求去掉每次重新生成的 boundary），请求体分块计算"""
+
+    def __init__(self, scope: Dict[str, Any]):
+        self._digest = hashlib.sha256()
+        for part in (scope['method'].encode(), scope['path'].encode(), scope.get('query_string', b'')):
+            self._digest.update(part)
+            self._digest.update(b'\0')
+        content_type = dict(scope['headers']).get(b'content-type', b'')
+        self._boundary = None
+        if b'boundary=' in content_type:
+            self._boundary = content_type.split(b'boundary=', 1)[1].split(b';', 1)[0].strip(b'"') or None
+        # 可能是 boundary 开头、留到下一块再处理的尾部
+        self._pending = b''
+
+    def update(self, chunk: bytes) -> None:
+        if self._boundary is None:
+            self._digest.update(chunk)
+            return
+        data = (self._pending + chunk).replace(self._boundary, b'')
+        keep = len(self._boundary) - 1
+        self._digest.update(data[:len(data) - keep] if len(data) > keep else b'')
+        self._pending = data[-keep:] if len(data) > keep else data
+
+    def hexdigest(self) -> str:
+        self._digest.update(self._pending)
+        self._pending = b''
+        self._digest.update(b'\0')
+        return self._digest.hexdigest()
+
+def scoped_key(scope, key: str) -> str:
+    """保存的幂等键：客户端标识、API Key 与 Idempotency-Key 的 SHA-256（64 个字符）"""
+    client = f"{client_key(scope)}\0{api_key(scope) or ''}"
+    return hashlib.sha256(f"{client}\0{key}".encode('utf-8')).hexdigest()
+
+def _run(sql: str, params: Tuple, fetch: bool = False) -> Any:
+    """执行一条语句，fetch 时返回第一行，否则返回影响的行数"""
+    connection = get_db_connection()
+    if not connection:
+        raise _StoreUnavailable("数据库连接失败")
+    try:
+        cursor = dict_cursor(connection)
+        cursor.execute(sql, params)
+        row = cursor.fetchone() if fetch else cursor.rowcount
+        connection.commit()
+        cursor.close()
+        return row
+    finally:
+        close_db_connection(connection)
+
+_last_cleanup = 0.0
+
+def reserve(key: str, request_hash: str, lease_id: str) -> Optional[dict]:
+    """
+    占用幂等键（插入处理中记录，租约为 lease_id），成功返回 None；
+    键已存在时返回已有记录（已过期的记录删除后重新占用，租约已过期的处理中记录直接接管）
+    """
+    global _last_cleanup
+    now = time.monotonic()
+    if now - _last_cleanup > IDEMPOTENCY_CONFIG['cleanup_interval']:
+        _last_cleanup = now
+        _run("DELETE FROM idempotency_keys WHERE expires_at < %s", (datetime.now(),))
+
+    for _ in range(2):
+        now = datetime.now()
+        expires_at = now + timedelta(hours=IDEMPOTENCY_CONFIG['ttl_hours'])
+        try:
+            _run("""
+            INSERT INTO idempotency_keys (idempotency_key, request_hash, lease_id, locked_at, expires_at)
+            VALUES (%s, %s, %s, %s, %s)
+            """, (key, request_hash, lease_id, now, expires_at))
+            return None
+        except errors() as e:
+            if not is_duplicate_key(e):
+                raise
+
+        # 租约过期的处理中记录（占用的进程已崩溃）：条件更新保证只有一个请求接管
+        stale_before = now - timedelta(seconds=IDEMPOTENCY_CONFIG['lease_seconds'])
+        if _run("""
+        UPDATE idempotency_keys
+        SET request_hash = %s, lease_id = %s, locked_at = %s, expires_at = %s
+        WHERE idempotency_key = %s AND status_code IS NULL AND (locked_at IS NULL OR locked_at < %s)
+        """, (request_hash, lease_id, now, expires_at, key, stale_before)):
+            return None
+
+        row = _run("""
+        SELECT request_hash, status_code, content_type, response_body, response_digest, expires_at
+        FROM idempotency_keys WHERE idempotency_key = %s
+        """, (key,), fetch=True)
+        if row is None or row['expires_at'] < datetime.now():
+            _run("DELETE FROM idempotency_keys WHERE idempotency_key = %s AND expires_at < %s", (key, datetime.now()))
+            continue
+        return row
+    raise _StoreUnavailable("幂等键占用失败")
+
+def complete(key: str, lease_id: str, status_code: int, content_type: str, body: bytes) -> bool:
+    """保存第一次请求的响应；租约已被其它请求接管时不保存，返回 False"""
+    return _run("""
+    UPDATE idempotency_keys
+    SET status_code = %s, content_type = %s, response_body = %s, response_digest = %s, locked_at = NULL
+    WHERE idempotency_key = %s AND lease_id = %s AND status_code IS NULL
+    """, (status_code, content_type, body, hashlib.sha256(body).hexdigest(), key, lease_id)) == 1
+
+def release(key: str, lease_id: str) -> None:
+    """请求未保存响应（5xx、RETRYABLE_STATUSES、异常、断开或取消）时释放幂等键，允许客户端重试"""
+    _run("""
+    DELETE FROM idempotency_keys WHERE idempotency_key = %s AND lease_id = %s AND status_code IS NULL
+    """, (key, lease_id))
+
+class IdempotencyMiddleware:
+    """按 Idempotency-Key 去重写入请求：先查本进程最近响应缓存，再以数据库主键原子占用"""
+
+    def __init__(self, app):
+        self.app = app
+        # 幂等键 -> (请求指纹, 状态码, Content-Type, 响应体, 过期时间)
+        self._recent: 'OrderedDict[str, tuple]' = OrderedDict()
+
+    def _applies(self, scope) -> bool:
+        return (
+            scope['type'] == 'http'
+            and scope['method'] == 'POST'
+            and scope['path'].startswith(IDEMPOTENCY_CONFIG['path_prefixes'])
+        )
+
+    async def __call__(self, scope, receive, send):
+        key = dict(scope['headers']).get(b'idempotency-key') if self._applies(scope) else None
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+
+        key = key.decode('latin-1').strip()
+        if not key or len(key) > IDEMPOTENCY_CONFIG['max_key_length']:
+            await _error(scope, receive, send, 400,
+                         f"Idempotency-Key 长度应为 1-{IDEMPOTENCY_CONFIG['max_key_length']} 个字符")
+            return
+        key = scoped_key(scope, key)
+
+        # 读取完整请求体后交给应用重新读取；上传文件的请求体较大，超过 spool_size 的部分暂存在临时文件中
+        body = tempfile.SpooledTemporaryFile(max_size=IDEMPOTENCY_CONFIG['spool_size'])
+        try:
+            await self._handle(scope, receive, send, key, body)
+        finally:
+            body.close()
+
+    async def _handle(self, scope, receive, send, key: str, body) -> None:
+        hasher = _RequestHasher(scope)
+        more_body = True
+        while more_body:
+            message = await receive()
+            chunk = message.get('body', b'')
+            hasher.update(chunk)
+            body.write(chunk)
+            more_body = message.get('more_body', False)
+        request_hash = hasher.hexdigest()
+
+        cached = self._recent.get(key)
+        if cached and cached[4] > time.monotonic():
+            if cached[0] != request_hash:
+                await _error(scope, receive, send, 422, "Idempotency-Key 已用于不同的请求")
+            else:
+                await _replay(scope, receive, send, cached[1], cached[2], cached[3])
+            return
+
+        lease_id = uuid.uuid4().hex
+        try:
+            existing = await to_thread(reserve, key, request_hash, lease_id)
+        except Exception as e:
+            # 存储不可用时按无幂等键处理，不影响写入接口的可用性
+            print(f"幂等键存储不可用，按普通请求处理: {e}")
+            await self.app(scope, replay_spooled(body, receive), send)
+            return
+
+        if existing is not None:
+            if existing['request_hash'] != request_hash:
+                await _error(scope, receive, send, 422, "Idempotency-Key 已用于不同的请求")
+            elif existing['status_code'] is None:
+                await _error(scope, receive, send, 409, "相同 Idempotency-Key 的请求正在处理，请稍后重试",
+                             {"Retry-After": "1"})
+            else:
+                self._remember(key, request_hash, existing['status_code'],
+                               existing['content_type'], existing['response_body'])
+                await _replay(scope, receive, send, existing['status_code'],
+                              existing['content_type'], existing['response_body'])
+            return
+
+        response = {'status': 500, 'content_type': '', 'body': b''}
+
+        async def capture_send(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+                response['content_type'] = dict(message.get('headers', [])).get(b'content-type', b'').decode('latin-1')
+            elif message['type'] == 'http.response.body':
+                response['body'] += message.get('body', b'')
+            await send(message)
+
+        stored = False
+        try:
+            await self.app(scope, replay_spooled(body, receive), capture_send)
+            if response['status'] < 500 and response['status'] not in RETRYABLE_STATUSES:
+                stored = bool(await _finish(complete, key, lease_id, response['status'],
+                                            response['content_type'], response['body']))
+        except BaseException:
+            # 应用异常、客户端断开或任务取消（CancelledError）：被取消的任务中 await 会再次被取消，
+            # 释放提交到线程池执行，不等待结果
+            if not stored:
+                _release_detached(key, lease_id)
+            raise
+
+        if not stored:
+            await _finish(release, key, lease_id)
+            return
+        self._remember(key, request_hash, response['status'], response['content_type'], response['body'])
+
+    def _remember(self, key: str, request_hash: str, status_code: int, content_type: str, body: bytes) -> None:
+        expires = time.monotonic() + IDEMPOTENCY_CONFIG['cache_ttl']
+        self._recent[key] = (request_hash, status_code, content_type, body, expires)
+        self._recent.move_to_end(key)
+        while len(self._recent) > IDEMPOTENCY_CONFIG['cache_size']:
+            self._recent.popitem(last=False)
+
+async def _finish(func, *args) -> Any:
+    """响应已发送后保存或释放幂等键，返回 func 的结果；失败只记录日志，返回 None"""
+    try:
+        return await to_thread(func, *args)
+    except Exception as e:
+        print(f"幂等键保存失败: {e}")
+        return None
+
+def _release_quietly(key: str, lease_id: str) -> None:
+    try:
+        release(key, lease_id)
+    except Exception as e:
+        print(f"幂等键释放失败: {e}")
+
+def _release_detached(key: str, lease_id: str) -> None:
+    """在默认线程池中释放幂等键，不等待完成（释放失败时由租约过期兜底）"""
+    try:
+        asyncio.get_running_loop().run_in_executor(None, _release_quietly, key, lease_id)
+    except RuntimeError:
+        _release_quietly(key, lease_id)
+
+def replay_receive(body: bytes, receive):
+    """把已读取的请求体重新提供给应用，之后的消息（断开连接）仍从原连接读取"""
+    sent = False
+
+    async def replay():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        return await receive()
+
+    return replay
+
+# 重新提供暂存的请求体时每块的大小
+REPLAY_CHUNK_SIZE = 64 * 1024
+
+def replay_spooled(body, receive):
+    """把暂存在 SpooledTemporaryFile 中的请求体分块重新提供给应用，之后的消息仍从原连接读取"""
+    body.seek(0)
+    finished = False
+
+    async def replay():
+        nonlocal finished
+        if finished:
+            return await receive()
+        chunk = body.read(REPLAY_CHUNK_SIZE)
+        finished = len(chunk) < REPLAY_CHUNK_SIZE
+        return {'type': 'http.request', 'body': chunk, 'more_body': not finished}
+
+    return replay
+
+async def _replay(scope, receive, send, status_code: int, content_type: str, body: bytes) -> None:
+    headers = [
+        (b'content-type', (content_type or 'application/json').encode('latin-1')),
+        (b'content-length', str(len(body)).encode()),
+        (b'idempotent-replayed', b'true')
+    ]
+    await send({'type': 'http.response.start', 'status': status_code, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': bytes(body)})
+
+async def _error(scope, receive, send, status_code: int, detail: str, headers: Optional[dict] = None) -> None:
+    response = JSONResponse({"detail": detail}, status_code=status_code, headers=headers)
+    await response(scope, receive, send)
\ No newline at end of file
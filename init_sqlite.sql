@@ -0,0 +1,266 @@
+-- SQLite 后端（DB_BACKEND=sqlite）的表结构，与 MySQL 的 init.sql 加 migrations/ 下全部迁移后一致
+-- 首次连接时自动执行，已有的库自动补齐新增的列；日期按 ISO 文本保存，created_at 为本地时间
+
+CREATE TABLE IF NOT EXISTS patient_general_info (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    age INTEGER,
+    ethnicity TEXT,
+    education TEXT,
+    occupation TEXT,
+    economic_status TEXT,
+    height REAL,
+    pre_pregnancy_weight REAL,
+    pre_pregnancy_bmi REAL,
+    last_menstrual_period DATE,
+    gestational_weeks TEXT,
+    pre_pregnancy_systolic REAL,
+    pre_pregnancy_diastolic REAL,
+    pre_pregnancy_map REAL,
+    medical_history TEXT,
+    gravidity INTEGER,
+    parity INTEGER,
+    uterine_surgery TEXT,
+    family_history TEXT,
+    allergy_history TEXT,
+    conception_method TEXT,
+    pregnancy_type TEXT,
+    aspirin_use TEXT,
+    complications TEXT,
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    gestational_days INTEGER,
+    derived_bmi REAL,
+    derived_map REAL
+);
+CREATE INDEX IF NOT EXISTS idx_general_gestational_days ON patient_general_info (gestational_days);
+CREATE INDEX IF NOT EXISTS idx_general_derived_map ON patient_general_info (derived_map);
+CREATE INDEX IF NOT EXISTS idx_general_derived_bmi ON patient_general_info (derived_bmi);
+
+CREATE TABLE IF NOT EXISTS patient_lab_imaging (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_id INTEGER,
+    examination_date DATE,
+    ultrasound_date DATE,
+    rbc_count REAL,
+    wbc_count REAL,
+    hemoglobin REAL,
+    platelet_count REAL,
+    hematocrit REAL,
+    platelet_volume REAL,
+    urine_protein_qualitative TEXT,
+    urine_cast TEXT,
+    urine_protein_24h REAL,
+    total_bilirubin REAL,
+    total_protein REAL,
+    albumin REAL,
+    alt REAL,
+    ast REAL,
+    total_bile_acid REAL,
+    creatinine REAL,
+    urea REAL,
+    uric_acid REAL,
+    aptt REAL,
+    pt REAL,
+    inr REAL,
+    tt REAL,
+    fib REAL,
+    d_dimer REAL,
+    fasting_glucose REAL,
+    glucose_1h REAL,
+    glucose_2h REAL,
+    plgf REAL,
+    sflt1 REAL,
+    sflt1_plgf_ratio REAL,
+    nt REAL,
+    uta_pi REAL,
+    ua_sd_ratio REAL,
+    ua_pi REAL,
+    ua_ri REAL,
+    mca_sd_ratio REAL,
+    mca_pi REAL,
+    mca_ri REAL,
+    cpr REAL,
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    gestational_days INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_lab_patient_date ON patient_lab_imaging (patient_id, examination_date);
+CREATE INDEX IF NOT EXISTS idx_lab_gestational_days ON patient_lab_imaging (gestational_days, patient_id);
+
+CREATE TABLE IF NOT EXISTS patient_home_monitoring (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_id INTEGER,
+    home_monitoring_date DATE,
+    home_systolic REAL,
+    home_diastolic REAL,
+    fetal_heart_rate REAL,
+    fetal_movement REAL,
+    home_sflt1_plgf_ratio REAL,
+    fetal_monitoring_file BLOB,
+    urine_test_file BLOB,
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    gestational_days INTEGER,
+    derived_map REAL,
+    fetal_monitoring_file_sha256 TEXT,
+    urine_test_file_sha256 TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_home_patient_date ON patient_home_monitoring (patient_id, home_monitoring_date);
+CREATE INDEX IF NOT EXISTS idx_home_gestational_map ON patient_home_monitoring (gestational_days, derived_map, patient_id);
+
+CREATE TABLE IF NOT EXISTS model_fgr_params (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    preterm BOOLEAN,
+    lmp_date DATE,
+    diagnosis_date DATE,
+    hypertension BOOLEAN,
+    nst BOOLEAN,
+    weight_growth BOOLEAN,
+    umbilical_flow BOOLEAN,
+    prediction_result REAL,
+    gestational_days INTEGER,
+    logit_value REAL,
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    input_hash BLOB UNIQUE,
+    use_count INTEGER NOT NULL DEFAULT 1,
+    last_used_at DATETIME
+);
+
+CREATE TABLE IF NOT EXISTS model_fgr_neonatal_params (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    anc_visits INTEGER,
+    umbilical_flow BOOLEAN,
+    pe_gestation BOOLEAN,
+    delivery_gestation BOOLEAN,
+    fetal_growth BOOLEAN,
+    prediction_result REAL,
+    logit_value REAL,
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    input_hash BLOB UNIQUE,
+    use_count INTEGER NOT NULL DEFAULT 1,
+    last_used_at DATETIME
+);
+
+CREATE TABLE IF NOT EXISTS model_maternal_cox_params (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_id INTEGER,
+    plt REAL,
+    cr REAL,
+    up24 REAL,
+    alt REAL,
+    sbpmax REAL,
+    pdas BOOLEAN,
+    cox1_time INTEGER,
+    prediction_result REAL,
+    linear_predictor REAL,
+    baseline_hazard REAL,
+    survival_probability REAL,
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    input_hash BLOB UNIQUE,
+    use_count INTEGER NOT NULL DEFAULT 1,
+    last_used_at DATETIME,
+    source TEXT NOT NULL DEFAULT 'clinician',
+    rescore_run TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_maternal_cox_patient ON model_maternal_cox_params (patient_id, created_at);
+CREATE UNIQUE INDEX IF NOT EXISTS uk_maternal_cox_rescore ON model_maternal_cox_params (rescore_run, patient_id);
+
+CREATE TABLE IF NOT EXISTS model_neonatal_cox_params (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_id INTEGER,
+    lmp_date DATE,
+    admission_date DATE,
+    gda_group REAL,
+    cox2_time INTEGER,
+    nst BOOLEAN,
+    sbp_admission REAL,
+    dbp_admission REAL,
+    cr2 REAL,
+    prediction_result REAL,
+    gestational_days INTEGER,
+    map_value REAL,
+    gda_time REAL,
+    linear_predictor REAL,
+    baseline_hazard REAL,
+    survival_probability REAL,
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    input_hash BLOB UNIQUE,
+    use_count INTEGER NOT NULL DEFAULT 1,
+    last_used_at DATETIME,
+    source TEXT NOT NULL DEFAULT 'clinician',
+    rescore_run TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_neonatal_cox_patient ON model_neonatal_cox_params (patient_id, created_at);
+CREATE UNIQUE INDEX IF NOT EXISTS uk_neonatal_cox_rescore ON model_neonatal_cox_params (rescore_run, patient_id);
+
+CREATE TABLE IF NOT EXISTS prediction_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    model_type TEXT NOT NULL CHECK (model_type IN ('fgr', 'fgr_neonatal', 'maternal_cox', 'neonatal_cox')),
+    params_id INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+);
+CREATE INDEX IF NOT EXISTS idx_prediction_events_created ON prediction_events (model_type, created_at);
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    idempotency_key TEXT NOT NULL PRIMARY KEY,
+    request_hash TEXT NOT NULL,
+    status_code INTEGER,
+    content_type TEXT,
+    response_body BLOB,
+    response_digest TEXT,
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    expires_at DATETIME NOT NULL,
+    lease_id TEXT,
+    locked_at DATETIME
+);
+CREATE INDEX IF NOT EXISTS idx_idempotency_expires_at ON idempotency_keys (expires_at);
+
+-- 批量任务原地更新已有记录后递增的表数据版本（参与管理端读接口的 ETag）
+CREATE TABLE IF NOT EXISTS data_versions (
+    table_name TEXT NOT NULL PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+);
+
+-- 上传文件（内容保存在 UPLOAD_DIR 中，按 SHA-256 寻址）
+CREATE TABLE IF NOT EXISTS stored_files (
+    sha256 TEXT NOT NULL PRIMARY KEY,
+    size INTEGER NOT NULL,
+    content_type TEXT,
+    stored_size INTEGER,
+    encoding TEXT NOT NULL DEFAULT 'identity',
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    pending INTEGER NOT NULL DEFAULT 0
+);
+
+-- 管理端按 created_at 排序和筛选的索引
+CREATE INDEX IF NOT EXISTS idx_general_created_at ON patient_general_info (created_at);
+CREATE INDEX IF NOT EXISTS idx_lab_created_at ON patient_lab_imaging (created_at);
+CREATE INDEX IF NOT EXISTS idx_home_created_at ON patient_home_monitoring (created_at);
+CREATE INDEX IF NOT EXISTS idx_fgr_created_at ON model_fgr_params (created_at);
+CREATE INDEX IF NOT EXISTS idx_fgr_neonatal_created_at ON model_fgr_neonatal_params (created_at);
+CREATE INDEX IF NOT EXISTS idx_maternal_cox_created_at ON model_maternal_cox_params (created_at);
+CREATE INDEX IF NOT EXISTS idx_neonatal_cox_created_at ON model_neonatal_cox_params (created_at);
+-- 管理端默认只统计人工预测（source = 'clinician'），按来源和时间计数只读索引
+CREATE INDEX IF NOT EXISTS idx_maternal_cox_source_created ON model_maternal_cox_params (source, created_at);
+CREATE INDEX IF NOT EXISTS idx_neonatal_cox_source_created ON model_neonatal_cox_params (source, created_at);
+
+-- 人群筛选字段的二级索引（python cohort_query.py indexes --dialect sqlite 生成）
+DROP INDEX IF EXISTS idx_home_derived_map;
+CREATE INDEX IF NOT EXISTS idx_cohort_patient_age ON patient_general_info (age);
+CREATE INDEX IF NOT EXISTS idx_cohort_patient_parity ON patient_general_info (parity);
+CREATE INDEX IF NOT EXISTS idx_cohort_patient_pregnancy_type ON patient_general_info (pregnancy_type);
+CREATE INDEX IF NOT EXISTS idx_cohort_patient_aspirin_use ON patient_general_info (aspirin_use);
+CREATE INDEX IF NOT EXISTS idx_cohort_patient_conception_method ON patient_general_info (conception_method);
+CREATE INDEX IF NOT EXISTS idx_cohort_patient_last_menstrual_period ON patient_general_info (last_menstrual_period);
+CREATE INDEX IF NOT EXISTS idx_cohort_lab_examination_date ON patient_lab_imaging (examination_date, patient_id);
+CREATE INDEX IF NOT EXISTS idx_cohort_lab_sflt1_plgf_ratio ON patient_lab_imaging (sflt1_plgf_ratio, patient_id);
+CREATE INDEX IF NOT EXISTS idx_cohort_lab_plgf ON patient_lab_imaging (plgf, patient_id);
+CREATE INDEX IF NOT EXISTS idx_cohort_lab_platelet_count ON patient_lab_imaging (platelet_count, patient_id);
+CREATE INDEX IF NOT EXISTS idx_cohort_lab_creatinine ON patient_lab_imaging (creatinine, patient_id);
+CREATE INDEX IF NOT EXISTS idx_cohort_lab_alt ON patient_lab_imaging (alt, patient_id);
+CREATE INDEX IF NOT EXISTS idx_cohort_lab_urine_protein_24h ON patient_lab_imaging (urine_protein_24h, patient_id);
+CREATE INDEX IF NOT EXISTS idx_cohort_home_home_monitoring_date ON patient_home_monitoring (home_monitoring_date, patient_id);
+CREATE INDEX IF NOT EXISTS idx_cohort_home_derived_map ON patient_home_monitoring (derived_map, patient_id);
+CREATE INDEX IF NOT EXISTS idx_cohort_home_home_systolic ON patient_home_monitoring (home_systolic, patient_id);
+CREATE INDEX IF NOT EXISTS idx_cohort_home_home_diastolic ON patient_home_monitoring (home_diastolic, patient_id);
+CREATE INDEX IF NOT EXISTS idx_cohort_home_home_sflt1_plgf_ratio ON patient_home_monitoring (home_sflt1_plgf_ratio, patient_id);
+CREATE INDEX IF NOT EXISTS idx_cohort_maternal_cox_prediction_result ON model_maternal_cox_params (prediction_result, patient_id);
+CREATE INDEX IF NOT EXISTS idx_cohort_neonatal_cox_prediction_result ON model_neonatal_cox_params (prediction_result, patient_id);
\ No newline at end of file
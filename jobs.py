@@ -0,0 +1,231 @@
+"""
+后台任务模块
+长时间运行的导出、批量评分等任务在有界线程池中执行，状态保存在本地 SQLite 文件，结果文件保存在本地磁盘
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+from config import JOB_CONFIG
+from shared_state import is_shared
+
+# 任务状态
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATUSES = (SUCCEEDED, FAILED, CANCELLED)
+
+class JobCancelled(Exception):
+    """任务被取消"""
+
+class JobQueueFull(Exception):
+    """排队任务数已达上限"""
+
+class JobContext:
+    """传给任务处理函数的上下文：结果文件路径、进度汇报和取消检查"""
+
+    def __init__(self, job_id: str, result_path: str):
+        self.job_id = job_id
+        self.result_path = result_path
+
+    def update_progress(self, progress: float, message: Optional[str] = None) -> None:
+        """更新进度（0-1），同时检查是否已请求取消"""
+        _update_job(self.job_id, progress=round(min(max(progress, 0.0), 1.0), 4), message=message)
+        self.check_cancelled()
+
+    def check_cancelled(self) -> None:
+        if _cancel_requested(self.job_id):
+            raise JobCancelled()
+
+_handlers: Dict[str, Callable[[JobContext, Dict[str, Any]], Optional[str]]] = {}
+_futures: Dict[str, Future] = {}
+_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+
+def _connect() -> sqlite3.Connection:
+    connection = sqlite3.connect(JOB_CONFIG['db_path'], timeout=10)
+    connection.row_factory = sqlite3.Row
+    return connection
+
+def init_job_store() -> None:
+    """创建任务表，并将上次进程退出时未完成的任务标记为失败"""
+    os.makedirs(JOB_CONFIG['result_dir'], exist_ok=True)
+    with _connect() as connection:
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            job_type TEXT NOT NULL,
+            status TEXT NOT NULL,
+            progress REAL NOT NULL DEFAULT 0,
+            message TEXT,
+            params TEXT,
+            result_path TEXT,
+            error TEXT,
+            created_at TEXT NOT NULL,
+            started_at TEXT,
+            finished_at TEXT,
+            owner_pid INTEGER,
+            cancel_requested INTEGER NOT NULL DEFAULT 0
+        )
+        """)
+        columns = {row['name'] for row in connection.execute("PRAGMA table_info(jobs)")}
+        if 'owner_pid' not in columns:
+            connection.execute("ALTER TABLE jobs ADD COLUMN owner_pid INTEGER")
+            connection.execute("ALTER TABLE jobs ADD COLUMN cancel_requested INTEGER NOT NULL DEFAULT 0")
+        connection.execute("CREATE INDEX IF NOT EXISTS idx_jobs_created_at ON jobs (created_at)")
+
+        # 执行进程已退出的未完成任务标记为失败（多 worker 时其它 worker 的任务仍在运行）
+        rows = connection.execute(
+            "SELECT id, owner_pid FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)
+        ).fetchall()
+        interrupted = [row['id'] for row in rows if not _process_alive(row['owner_pid'])]
+        connection.executemany(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+            [(FAILED, "服务重启，任务中断", datetime.now().isoformat(), job_id) for job_id in interrupted]
+        )
+
+def _process_alive(pid: Optional[int]) -> bool:
+    """单 worker 模式下遗留任务一定属于已退出的进程；多 worker 模式（POSIX）检查进程是否存在"""
+    if not pid or not is_shared() or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+def _cancel_requested(job_id: str) -> bool:
+    """取消请求保存在任务表中，可由任意 worker 发起"""
+    with _connect() as connection:
+        row = connection.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return bool(row and row['cancel_requested'])
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            init_job_store()
+            _executor = ThreadPoolExecutor(
+                max_workers=JOB_CONFIG['max_workers'], thread_name_prefix="job"
+            )
+        return _executor
+
+def _update_job(job_id: str, **fields: Any) -> None:
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    with _connect() as connection:
+        connection.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+def register_job_type(job_type: str, handler: Callable[[JobContext, Dict[str, Any]], Optional[str]]) -> None:
+    """注册任务类型；处理函数将结果写入 context.result_path，可返回完成说明"""
+    _handlers[job_type] = handler
+
+def _run_job(job_id: str, job_type: str, params: Dict[str, Any], result_path: str) -> None:
+    if _cancel_requested(job_id):
+        _update_job(job_id, status=CANCELLED, finished_at=datetime.now().isoformat())
+        with _lock:
+            _futures.pop(job_id, None)
+        return
+    _update_job(job_id, status=RUNNING, started_at=datetime.now().isoformat())
+    context = JobContext(job_id, result_path)
+    try:
+        message = _handlers[job_type](context, params)
+        _update_job(job_id, status=SUCCEEDED, progress=1.0, message=message,
+                    result_path=result_path, finished_at=datetime.now().isoformat())
+    except JobCancelled:
+        _remove_file(result_path)
+        _update_job(job_id, status=CANCELLED, finished_at=datetime.now().isoformat())
+    except Exception as e:
+        _remove_file(result_path)
+        _update_job(job_id, status=FAILED, error=str(e), finished_at=datetime.now().isoformat())
+    finally:
+        with _lock:
+            _futures.pop(job_id, None)
+
+def _remove_file(path: str) -> None:
+    if os.path.exists(path):
+        os.remove(path)
+
+def submit_job(job_type: str, params: Dict[str, Any], result_suffix: str) -> Dict[str, Any]:
+    """提交任务，返回任务记录；排队任务过多时抛出 JobQueueFull"""
+    if job_type not in _handlers:
+        raise ValueError(f"未知的任务类型: {job_type}")
+
+    executor = _get_executor()
+    with _lock:
+        if len(_futures) >= JOB_CONFIG['max_workers'] + JOB_CONFIG['max_queued']:
+            raise JobQueueFull()
+
+        job_id = uuid.uuid4().hex
+        result_path = os.path.join(JOB_CONFIG['result_dir'], f"{job_id}.{result_suffix}")
+        with _connect() as connection:
+            connection.execute(
+                "INSERT INTO jobs (id, job_type, status, params, created_at, owner_pid) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, job_type, QUEUED, json.dumps(params, default=str), datetime.now().isoformat(), os.getpid())
+            )
+        _futures[job_id] = executor.submit(_run_job, job_id, job_type, params, result_path)
+
+    return get_job(job_id)
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """查询任务状态（本 worker 尚未提交过任务时先创建任务表）"""
+    _get_executor()
+    with _connect() as connection:
+        row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = dict(row)
+    job['params'] = json.loads(job['params']) if job['params'] else {}
+    return job
+
+def list_jobs(limit: int = 50) -> List[Dict[str, Any]]:
+    """最近的任务列表"""
+    _get_executor()
+    with _connect() as connection:
+        rows = connection.execute(
+            "SELECT id, job_type, status, progress, message, error, created_at, finished_at "
+            "FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+def cancel_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """取消任务：本 worker 排队中的直接取消，其余在开始执行或下一次汇报进度时停止（get_job 创建任务表）"""
+    job = get_job(job_id)
+    if job is None or job['status'] in FINISHED_STATUSES:
+        return job
+
+    with _lock:
+        future = _futures.get(job_id)
+        if future is not None and future.cancel():
+            _futures.pop(job_id, None)
+            _update_job(job_id, status=CANCELLED, finished_at=datetime.now().isoformat())
+        else:
+            _update_job(job_id, cancel_requested=1)
+
+    return get_job(job_id)
+
+def shutdown_jobs(timeout: float) -> None:
+    """停止任务线程池：排队中的任务取消，运行中的任务请求取消，最多等待 timeout 秒"""
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+        futures = dict(_futures)
+    if executor is None:
+        return
+
+    for job_id in futures:
+        cancel_job(job_id)
+    # 排队中的任务已由 cancel_job 取消
+    executor.shutdown(wait=False)
+    _, not_done = wait(list(futures.values()), timeout=timeout)
+    if not_done:
+        print(f"⚠️ {len(not_done)} 个后台任务未在停机时间内结束")
\ No newline at end of file
@@ -0,0 +1,100 @@
+"""
+服务生命周期模块
+启动时预热数据库连接池和各数据表的校验值；关闭时停止接收新请求、等待处理中的请求完成，
+再停止后台任务并关闭连接池，整个过程不超过 APP_SHUTDOWN_TIMEOUT。
+没有缓冲的写入：慢查询日志、幂等键和预测记录都在请求结束前写入，随处理中的请求一起完成
+"""
+
+import asyncio
+import time
+from typing import Callable, List, Optional
+from fastapi.responses import JSONResponse
+from config import APP_CONFIG, DB_POOL_CONFIG
+from database import pool
+from table_versions import VERSIONED_TABLES, get_versions
+import jobs
+from utils import to_thread
+
+_in_flight = 0
+_draining = False
+_drain_started: Optional[float] = None
+_drain_callbacks: List[Callable[[], None]] = []
+
+def on_drain(callback: Callable[[], None]) -> None:
+    """注册开始停机时立即执行的回调（如结束长连接）"""
+    _drain_callbacks.append(callback)
+
+def is_draining() -> bool:
+    return _draining
+
+def begin_drain() -> None:
+    """进入停机状态：新请求返回503，已注册的长连接收到结束通知（可重复调用）"""
+    global _draining, _drain_started
+    if _draining:
+        return
+    _draining = True
+    _drain_started = time.monotonic()
+    print(f"🛑 开始停机，处理中的请求: {_in_flight}")
+    for callback in _drain_callbacks:
+        try:
+            callback()
+        except Exception as e:
+            print(f"停机回调执行失败: {e}")
+
+class DrainMiddleware:
+    """统计处理中的请求数；停机后拒绝新请求，负载均衡据此摘除实例"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        global _in_flight
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        if _draining:
+            response = JSONResponse(
+                {"detail": "服务正在关闭，请稍后重试"},
+                status_code=503,
+                headers={"Retry-After": "5", "Connection": "close"}
+            )
+            await response(scope, receive, send)
+            return
+
+        _in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _in_flight -= 1
+
+async def warm_up() -> None:
+    """预热数据库连接和数据表校验值，数据库不可用时不阻止启动（首次请求时再连接）"""
+    started = time.perf_counter()
+    warmed = await to_thread(pool.warm_up, DB_POOL_CONFIG['warm_up_connections'])
+    loaded = await to_thread(get_versions, VERSIONED_TABLES) if warmed else None
+    print(f"🔥 预热完成: {warmed} 个数据库连接，"
+          f"{len(loaded) if loaded else 0} 张数据表，耗时 {time.perf_counter() - started:.2f} 秒")
+
+async def shutdown() -> None:
+    """停机：等待处理中的请求，停止后台任务，关闭连接池"""
+    begin_drain()
+    deadline = _drain_started + APP_CONFIG['shutdown_timeout']
+
+    def remaining() -> float:
+        return max(deadline - time.monotonic(), 0.0)
+
+    while _in_flight > 0 and remaining() > 0:
+        await asyncio.sleep(0.05)
+    if _in_flight > 0:
+        print(f"⚠️ 停机超时，仍有 {_in_flight} 个请求未完成")
+
+    try:
+        await asyncio.wait_for(to_thread(jobs.shutdown_jobs, remaining()), timeout=remaining() or 0.01)
+    except asyncio.TimeoutError:
+        print("⚠️ 停机超时，未完成: 后台任务")
+    except Exception as e:
+        print(f"停机步骤失败（后台任务）: {e}")
+
+    pool.close_all()
+    print(f"✅ 停机完成，耗时 {time.monotonic() - _drain_started:.2f} 秒")
\ No newline at end of file
@@ -2,9 +2,9 @@
 妊娠期高血压母婴监测及结局预测平台 - 主应用
 """
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Form, File, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
 from typing import Optional
 from datetime import date
 
@@ -12,6 +12,7 @@ from datetime import date
 from models import (
     FGRPredictionRequest, FGRNeonatalPredictionRequest,
     MaternalCOXPredictionRequest, NeonatalCOXPredictionRequest,
+    MaternalCOXPatientRequest, NeonatalCOXPatientRequest,
     PatientGeneralInfoRequest, PatientLabImagingRequest, 
     PatientHomeMonitoringRequest, PredictionResponse, SaveResponse
 )
@@ -19,18 +20,79 @@ from prediction_models import (
     predict_fgr, predict_fgr_neonatal, predict_maternal_cox, predict_neonatal_cox
 )
 from patient_service import (
-    save_patient_general_info, save_patient_lab_imaging, save_patient_home_monitoring
+    save_patient_general_info, save_patient_lab_imaging, save_patient_home_monitoring,
+    get_patient_bp_summary
 )
-from admin_api import admin_router
+from feature_service import build_maternal_cox_request, build_neonatal_cox_request, describe_features
+import event_bus
+import lifecycle
+from idempotency import IdempotencyMiddleware
+from fast_predict import FastPredictMiddleware
+from db_tracing import DBTraceMiddleware
+from file_store import UploadLimitMiddleware, discard_uploads, release_uploads, store_upload
+from response_compression import CompressionMiddleware
+from rate_limit import RateLimitMiddleware
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """启动前预热数据库连接和数据表，关闭时排空请求并停止后台任务"""
+    await lifecycle.warm_up()
+    yield
+    await lifecycle.shutdown()
+
+# 开始停机时结束所有实时推送连接
+lifecycle.on_drain(event_bus.close_all)
 
 # 创建FastAPI应用
 app = FastAPI(
     title="妊娠期高血压母婴监测及结局预测平台 API",
     description="基于机器学习的妊娠期高血压疾病预测模型 API 服务",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-# 添加 CORS 中间件，解决跨域问题
+# 后台管理API（及其响应模型、任务、人群筛选等模块）在首次访问管理端接口或接口文档时才导入并注册
+ADMIN_ROUTER_PATHS = ('/admin', '/docs', '/redoc', '/openapi.json')
+_admin_router_included = False
+
+def include_admin_router() -> None:
+    """导入并注册后台管理API（只执行一次）"""
+    global _admin_router_included
+    if not _admin_router_included:
+        from admin_api import admin_router
+        app.include_router(admin_router)
+        _admin_router_included = True
+
+class AdminRouterLoader:
+    """路由之前按路径前缀注册后台管理API，其它请求只多一次前缀判断"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and not _admin_router_included and scope['path'].startswith(ADMIN_ROUTER_PATHS):
+            include_admin_router()
+        await self.app(scope, receive, send)
+
+# 预测接口快速路径（最内层，CORS、幂等、停机处理仍然生效）
+app.add_middleware(FastPredictMiddleware)
+
+# 首次访问管理端接口时注册后台管理API
+app.add_middleware(AdminRouterLoader)
+
+# 管理端接口的响应压缩（预测接口不经过压缩）
+app.add_middleware(CompressionMiddleware)
+
+# 按 Idempotency-Key 去重写入请求
+app.add_middleware(IdempotencyMiddleware)
+
+# 按客户端限流（在幂等中间件之外，429 不会被保存为幂等键的响应）
+app.add_middleware(RateLimitMiddleware)
+
+# 上传接口的请求体大小限制（在幂等中间件读取请求体之前）
+app.add_middleware(UploadLimitMiddleware)
+
+# 添加 CORS 中间件，解决跨域问题（在限流、幂等之外，429、413 和重放的响应同样带跨域响应头）
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # 允许所有来源，生产环境建议设置具体域名
@@ -39,8 +101,11 @@ app.add_middleware(
     allow_headers=["*"],  # 允许所有请求头
 )
 
-# 包含后台管理API
-app.include_router(admin_router)
+# 记录每个请求的数据库语句数和耗时（包括幂等键的读写）
+app.add_middleware(DBTraceMiddleware)
+
+# 停机期间拒绝新请求（最外层中间件）
+app.add_middleware(lifecycle.DrainMiddleware)
 
 @app.get("/")
 async def root():
@@ -53,9 +118,12 @@ async def root():
             "/predict/fgr-neonatal": "先发胎儿生长受限的子痫前期新生儿不良结局预测",
             "/predict/maternal-cox": "子痫前期母体不良结局COX模型预测",
             "/predict/neonatal-cox": "子痫前期新生儿不良结局COX模型预测",
+            "/predict/maternal-cox/patient/{patient_id}": "按患者已保存数据进行母体COX模型预测",
+            "/predict/neonatal-cox/patient/{patient_id}": "按患者已保存数据进行新生儿COX模型预测",
             "/api/patient/general-info": "保存患者基本信息",
             "/api/patient/lab-imaging": "保存实验室检查数据",
-            "/api/patient/home-monitoring": "保存家庭监测数据"
+            "/api/patient/home-monitoring": "保存家庭监测数据",
+            "/api/patient/{patient_id}/bp-summary": "家庭血压滚动统计"
         }
     }
 
@@ -128,6 +196,37 @@ async def predict_neonatal_cox_endpoint(request: NeonatalCOXPredictionRequest):
     """
     return predict_neonatal_cox(request)
 
+@app.post("/predict/maternal-cox/patient/{patient_id}", response_model=PredictionResponse)
+async def predict_maternal_cox_patient_endpoint(patient_id: int, request: MaternalCOXPatientRequest):
+    """
+    按患者已保存数据进行母体COX模型预测
+    
+    plt、cr、up24、alt 取自最近一次实验室检查，sbpmax 取自家庭血压时间序列；
+    请求中提供的值优先。客户端只需提供:
+    - pdas: 是否有PDA
+    - cox1_time: 预测时间点(2, 7, 或 14天)
+    """
+    model_request = build_maternal_cox_request(patient_id, request)
+    result = predict_maternal_cox(model_request, patient_id)
+    result.additional_info["patient_features"] = describe_features(patient_id)
+    return result
+
+@app.post("/predict/neonatal-cox/patient/{patient_id}", response_model=PredictionResponse)
+async def predict_neonatal_cox_patient_endpoint(patient_id: int, request: NeonatalCOXPatientRequest):
+    """
+    按患者已保存数据进行新生儿COX模型预测
+    
+    lmp_date 取自患者基本信息，cr2 取自最近一次实验室检查，入院血压默认取最近一次家庭血压，
+    入院日期默认当天；请求中提供的值优先。客户端只需提供:
+    - gda_group: GDA分组
+    - cox2_time: 预测时间点(2, 7, 或 14天)
+    - nst: 是否有NST异常
+    """
+    model_request = build_neonatal_cox_request(patient_id, request)
+    result = predict_neonatal_cox(model_request, patient_id)
+    result.additional_info["patient_features"] = describe_features(patient_id, model_request.admission_date)
+    return result
+
 # 患者数据保存API端点
 @app.post("/api/patient/general-info", response_model=SaveResponse)
 async def save_patient_general_info_endpoint(request: PatientGeneralInfoRequest):
@@ -141,6 +240,7 @@ async def save_patient_lab_imaging_endpoint(request: PatientLabImagingRequest):
 
 @app.post("/api/patient/home-monitoring", response_model=SaveResponse)
 async def save_patient_home_monitoring_endpoint(
+    patient_id: Optional[int] = Form(None),
     home_monitoring_date: Optional[date] = Form(None),
     home_systolic: Optional[float] = Form(None),
     home_diastolic: Optional[float] = Form(None),
@@ -151,29 +251,46 @@ async def save_patient_home_monitoring_endpoint(
     urine_test_file: Optional[UploadFile] = File(None)
 ):
     """保存患者家庭监测数据"""
-    # 读取文件内容
-    fetal_monitoring_data = None
-    urine_test_data = None
-    
-    if fetal_monitoring_file:
-        fetal_monitoring_data = await fetal_monitoring_file.read()
+    # 文件分块写入文件存储，不整体读入内存
+    stored_files = {}
     
-    if urine_test_file:
-        urine_test_data = await urine_test_file.read()
-    
-    # 创建请求对象
-    request = PatientHomeMonitoringRequest(
-        home_monitoring_date=home_monitoring_date,
-        home_systolic=home_systolic,
-        home_diastolic=home_diastolic,
-        fetal_heart_rate=fetal_heart_rate,
-        fetal_movement=fetal_movement,
-        home_sflt1_plgf_ratio=home_sflt1_plgf_ratio,
-        fetal_monitoring_file=fetal_monitoring_data,
-        urine_test_file=urine_test_data
-    )
+    try:
+        if fetal_monitoring_file:
+            stored_files['fetal_monitoring_file'] = await store_upload(fetal_monitoring_file, 'fetal_monitoring_file')
+        
+        if urine_test_file:
+            stored_files['urine_test_file'] = await store_upload(urine_test_file, 'urine_test_file')
+        
+        # 创建请求对象
+        request = PatientHomeMonitoringRequest(
+            patient_id=patient_id,
+            home_monitoring_date=home_monitoring_date,
+            home_systolic=home_systolic,
+            home_diastolic=home_diastolic,
+            fetal_heart_rate=fetal_heart_rate,
+            fetal_movement=fetal_movement,
+            home_sflt1_plgf_ratio=home_sflt1_plgf_ratio
+        )
+        
+        result = save_patient_home_monitoring(request, stored_files)
+    except Exception:
+        # 记录未保存：删除没有其它请求使用、也没有记录引用的文件
+        await discard_uploads(stored_files.values())
+        raise
+    # 记录已引用文件，取消本次请求的固定
+    await release_uploads(stored_files.values())
+    return result
+
+@app.get("/api/patient/{patient_id}/bp-summary")
+async def get_patient_bp_summary_endpoint(patient_id: int):
+    """
+    获取患者家庭血压滚动统计
     
-    return save_patient_home_monitoring(request)
+    返回各时间窗口内收缩压、舒张压、平均动脉压的最大值、均值和斜率，
+    以及母体COX模型可直接使用的 sbpmax
+    """
+    return get_patient_bp_summary(patient_id)
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    from run import serve
+    serve() 
\ No newline at end of file
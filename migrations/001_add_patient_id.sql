@@ -0,0 +1,10 @@
+-- 为实验室检查和家庭监测记录关联患者（patient_general_info.id）
+-- 家庭血压时间序列按患者读取，依赖 (patient_id, home_monitoring_date) 索引
+
+ALTER TABLE patient_lab_imaging
+    ADD COLUMN patient_id INT NULL AFTER id,
+    ADD INDEX idx_lab_patient_date (patient_id, examination_date);
+
+ALTER TABLE patient_home_monitoring
+    ADD COLUMN patient_id INT NULL AFTER id,
+    ADD INDEX idx_home_patient_date (patient_id, home_monitoring_date);
\ No newline at end of file
@@ -0,0 +1,9 @@
+-- COX模型预测记录关联患者，按患者预测接口（/predict/*/patient/{id}）写入
+
+ALTER TABLE model_maternal_cox_params
+    ADD COLUMN patient_id INT NULL AFTER id,
+    ADD INDEX idx_maternal_cox_patient (patient_id, created_at);
+
+ALTER TABLE model_neonatal_cox_params
+    ADD COLUMN patient_id INT NULL AFTER id,
+    ADD INDEX idx_neonatal_cox_patient (patient_id, created_at);
\ No newline at end of file
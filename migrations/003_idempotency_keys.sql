@@ -0,0 +1,13 @@
+-- 幂等键：Idempotency-Key 请求头对应的第一次请求的响应，status_code 为空表示请求处理中
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    idempotency_key VARCHAR(255) NOT NULL PRIMARY KEY,
+    request_hash CHAR(64) NOT NULL,
+    status_code SMALLINT NULL,
+    content_type VARCHAR(100) NULL,
+    response_body MEDIUMBLOB NULL,
+    response_digest CHAR(64) NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at DATETIME NOT NULL,
+    INDEX idx_idempotency_expires_at (expires_at)
+);
\ No newline at end of file
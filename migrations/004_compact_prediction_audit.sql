@@ -0,0 +1,35 @@
+-- 预测记录 compact 模式（PREDICTION_AUDIT_MODE=compact）：相同输入的预测只保存一行参数记录，
+-- input_hash 为归一化字段的 SHA-256，use_count/last_used_at 为累计使用次数和最近一次使用时间；
+-- 每次预测在 prediction_events 记一条事件。旧记录 input_hash 为空，按完整记录读取，无需回填
+
+ALTER TABLE model_fgr_params
+    ADD COLUMN input_hash BINARY(32) NULL,
+    ADD COLUMN use_count INT NOT NULL DEFAULT 1,
+    ADD COLUMN last_used_at DATETIME NULL,
+    ADD UNIQUE INDEX uk_fgr_input_hash (input_hash);
+
+ALTER TABLE model_fgr_neonatal_params
+    ADD COLUMN input_hash BINARY(32) NULL,
+    ADD COLUMN use_count INT NOT NULL DEFAULT 1,
+    ADD COLUMN last_used_at DATETIME NULL,
+    ADD UNIQUE INDEX uk_fgr_neonatal_input_hash (input_hash);
+
+ALTER TABLE model_maternal_cox_params
+    ADD COLUMN input_hash BINARY(32) NULL,
+    ADD COLUMN use_count INT NOT NULL DEFAULT 1,
+    ADD COLUMN last_used_at DATETIME NULL,
+    ADD UNIQUE INDEX uk_maternal_cox_input_hash (input_hash);
+
+ALTER TABLE model_neonatal_cox_params
+    ADD COLUMN input_hash BINARY(32) NULL,
+    ADD COLUMN use_count INT NOT NULL DEFAULT 1,
+    ADD COLUMN last_used_at DATETIME NULL,
+    ADD UNIQUE INDEX uk_neonatal_cox_input_hash (input_hash);
+
+CREATE TABLE IF NOT EXISTS prediction_events (
+    id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    model_type ENUM('fgr', 'fgr_neonatal', 'maternal_cox', 'neonatal_cox') NOT NULL,
+    params_id INT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_prediction_events_created (model_type, created_at)
+);
\ No newline at end of file
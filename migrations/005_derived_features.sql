@@ -0,0 +1,23 @@
+-- 患者派生特征：写入时计算并保存，按孕周、MAP、BMI 的范围查询走索引
+-- gestational_days 为孕天数（基本信息为录入当天，检查/监测记录为检查/监测日期），
+-- derived_bmi / derived_map 由身高体重、血压计算（客户端提交的 pre_pregnancy_bmi / pre_pregnancy_map 保留不变）
+-- 执行后运行 python derived_features.py 回填已有记录
+
+ALTER TABLE patient_general_info
+    ADD COLUMN gestational_days SMALLINT NULL,
+    ADD COLUMN derived_bmi DECIMAL(5,2) NULL,
+    ADD COLUMN derived_map DECIMAL(6,2) NULL,
+    ADD INDEX idx_general_gestational_days (gestational_days),
+    ADD INDEX idx_general_derived_map (derived_map),
+    ADD INDEX idx_general_derived_bmi (derived_bmi);
+
+ALTER TABLE patient_lab_imaging
+    ADD COLUMN gestational_days SMALLINT NULL,
+    ADD INDEX idx_lab_gestational_days (gestational_days, patient_id);
+
+-- (gestational_days, derived_map) 覆盖「孕 28-34 周且 MAP > 105」这类组合范围条件
+ALTER TABLE patient_home_monitoring
+    ADD COLUMN gestational_days SMALLINT NULL,
+    ADD COLUMN derived_map DECIMAL(6,2) NULL,
+    ADD INDEX idx_home_gestational_map (gestational_days, derived_map, patient_id),
+    ADD INDEX idx_home_derived_map (derived_map);
\ No newline at end of file
@@ -0,0 +1,26 @@
+-- 人群筛选（POST /admin/cohort/query）白名单字段的二级索引，由 python cohort_query.py indexes 生成
+-- 患者表按字段建索引；其它表按 (字段, patient_id)，范围条件命中后不回表即可得到患者ID
+
+-- 被 (derived_map, patient_id) 取代
+ALTER TABLE patient_home_monitoring DROP INDEX idx_home_derived_map;
+
+CREATE INDEX idx_cohort_patient_age ON patient_general_info (age);
+CREATE INDEX idx_cohort_patient_parity ON patient_general_info (parity);
+CREATE INDEX idx_cohort_patient_pregnancy_type ON patient_general_info (pregnancy_type);
+CREATE INDEX idx_cohort_patient_aspirin_use ON patient_general_info (aspirin_use);
+CREATE INDEX idx_cohort_patient_conception_method ON patient_general_info (conception_method);
+CREATE INDEX idx_cohort_patient_last_menstrual_period ON patient_general_info (last_menstrual_period);
+CREATE INDEX idx_cohort_lab_examination_date ON patient_lab_imaging (examination_date, patient_id);
+CREATE INDEX idx_cohort_lab_sflt1_plgf_ratio ON patient_lab_imaging (sflt1_plgf_ratio, patient_id);
+CREATE INDEX idx_cohort_lab_plgf ON patient_lab_imaging (plgf, patient_id);
+CREATE INDEX idx_cohort_lab_platelet_count ON patient_lab_imaging (platelet_count, patient_id);
+CREATE INDEX idx_cohort_lab_creatinine ON patient_lab_imaging (creatinine, patient_id);
+CREATE INDEX idx_cohort_lab_alt ON patient_lab_imaging (alt, patient_id);
+CREATE INDEX idx_cohort_lab_urine_protein_24h ON patient_lab_imaging (urine_protein_24h, patient_id);
+CREATE INDEX idx_cohort_home_home_monitoring_date ON patient_home_monitoring (home_monitoring_date, patient_id);
+CREATE INDEX idx_cohort_home_derived_map ON patient_home_monitoring (derived_map, patient_id);
+CREATE INDEX idx_cohort_home_home_systolic ON patient_home_monitoring (home_systolic, patient_id);
+CREATE INDEX idx_cohort_home_home_diastolic ON patient_home_monitoring (home_diastolic, patient_id);
+CREATE INDEX idx_cohort_home_home_sflt1_plgf_ratio ON patient_home_monitoring (home_sflt1_plgf_ratio, patient_id);
+CREATE INDEX idx_cohort_maternal_cox_prediction_result ON model_maternal_cox_params (prediction_result, patient_id);
+CREATE INDEX idx_cohort_neonatal_cox_prediction_result ON model_neonatal_cox_params (prediction_result, patient_id);
\ No newline at end of file
@@ -0,0 +1,10 @@
+-- 管理端列表、统计和导出按 created_at 排序或筛选，建索引后按索引顺序读取前 N 条，
+-- 不再全表扫描后排序（python query_plans.py 检查）
+
+ALTER TABLE patient_general_info ADD INDEX idx_general_created_at (created_at);
+ALTER TABLE patient_lab_imaging ADD INDEX idx_lab_created_at (created_at);
+ALTER TABLE patient_home_monitoring ADD INDEX idx_home_created_at (created_at);
+ALTER TABLE model_fgr_params ADD INDEX idx_fgr_created_at (created_at);
+ALTER TABLE model_fgr_neonatal_params ADD INDEX idx_fgr_neonatal_created_at (created_at);
+ALTER TABLE model_maternal_cox_params ADD INDEX idx_maternal_cox_created_at (created_at);
+ALTER TABLE model_neonatal_cox_params ADD INDEX idx_neonatal_cox_created_at (created_at);
\ No newline at end of file
@@ -0,0 +1,13 @@
+-- 上传文件改为分块写入文件存储（UPLOAD_DIR，按 SHA-256 寻址），不再整体读入内存保存在 BLOB 列中
+-- stored_files 记录文件大小和类型；家庭监测记录只保存文件哈希，迁移前写入 BLOB 列的记录保持不变
+
+CREATE TABLE IF NOT EXISTS stored_files (
+    sha256 CHAR(64) NOT NULL PRIMARY KEY,
+    size BIGINT NOT NULL,
+    content_type VARCHAR(255) NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+ALTER TABLE patient_home_monitoring
+    ADD COLUMN fetal_monitoring_file_sha256 CHAR(64) NULL,
+    ADD COLUMN urine_test_file_sha256 CHAR(64) NULL;
\ No newline at end of file
@@ -0,0 +1,8 @@
+-- 上传文件按内容压缩保存（zstd 或 gzip，已压缩的格式原样保存）
+-- size 为原始大小，stored_size 为保存在 UPLOAD_DIR 中的大小，encoding 为压缩方式（identity 表示未压缩）
+
+ALTER TABLE stored_files
+    ADD COLUMN stored_size BIGINT NULL,
+    ADD COLUMN encoding VARCHAR(16) NOT NULL DEFAULT 'identity';
+
+UPDATE stored_files SET stored_size = size WHERE stored_size IS NULL;
\ No newline at end of file
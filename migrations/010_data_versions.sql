@@ -0,0 +1,8 @@
+-- 批量任务原地更新已有记录（派生特征回填等）后递增的表数据版本
+-- 管理端读接口的 ETag / Last-Modified 除行数和最新 created_at 外还包含 version 和 updated_at
+
+CREATE TABLE IF NOT EXISTS data_versions (
+    table_name VARCHAR(64) NOT NULL PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
\ No newline at end of file
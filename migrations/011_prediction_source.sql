@@ -0,0 +1,14 @@
+-- COX 模型预测记录的来源：source 为 clinician（人工预测）或 rescore（批量重新评分），
+-- rescore_run 为评分批次（人工预测为 NULL）。(rescore_run, patient_id) 唯一，
+-- 评分中断后从检查点续跑时重复写入的分块被跳过，同一批次每名患者只有一行。
+-- 迁移前批量评分写入的记录无法区分，保留为 clinician
+
+ALTER TABLE model_maternal_cox_params
+    ADD COLUMN source VARCHAR(16) NOT NULL DEFAULT 'clinician',
+    ADD COLUMN rescore_run VARCHAR(32) NULL,
+    ADD UNIQUE INDEX uk_maternal_cox_rescore (rescore_run, patient_id);
+
+ALTER TABLE model_neonatal_cox_params
+    ADD COLUMN source VARCHAR(16) NOT NULL DEFAULT 'clinician',
+    ADD COLUMN rescore_run VARCHAR(32) NULL,
+    ADD UNIQUE INDEX uk_neonatal_cox_rescore (rescore_run, patient_id);
\ No newline at end of file
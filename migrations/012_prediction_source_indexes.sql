@@ -0,0 +1,5 @@
+-- 管理端的预测列表、统计和风险分布默认只包含人工预测（source = 'clinician'，批量重新评分的记录
+-- 需指定 source=rescore），按来源和 created_at 计数、筛选时只读索引（python query_plans.py 检查）
+
+ALTER TABLE model_maternal_cox_params ADD INDEX idx_maternal_cox_source_created (source, created_at);
+ALTER TABLE model_neonatal_cox_params ADD INDEX idx_neonatal_cox_source_created (source, created_at);
\ No newline at end of file
@@ -0,0 +1,7 @@
+-- 幂等键租约：处理中的记录（status_code 为空）保存占用请求的 lease_id 和占用时间 locked_at，
+-- 超过 IDEMPOTENCY_LEASE_SECONDS 仍未完成（进程崩溃）时由重试的请求接管，不再等到 expires_at。
+-- idempotency_key 改为保存 (客户端, Idempotency-Key) 的 SHA-256，升级前保存的键不再匹配，按新请求处理
+
+ALTER TABLE idempotency_keys
+    ADD COLUMN lease_id CHAR(32) NULL,
+    ADD COLUMN locked_at DATETIME NULL;
\ No newline at end of file
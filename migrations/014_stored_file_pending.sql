@@ -0,0 +1,6 @@
+-- 上传文件的使用计数：pending 为已上传该内容、尚未保存监测记录的请求数。
+-- 保存失败的请求只在 pending 为 0 且没有监测记录引用时删除文件，并发上传了相同内容的请求不会失去文件。
+-- 进程在上传后、保存记录前退出时 pending 不会归零，该文件保留（不会误删）
+
+ALTER TABLE stored_files
+    ADD COLUMN pending INT NOT NULL DEFAULT 0;
\ No newline at end of file
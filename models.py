@@ -42,6 +42,25 @@ class NeonatalCOXPredictionRequest(BaseModel):
     dbp_admission: float
     cr2: float
 
+# 按患者预测的请求（未提供的特征从已保存的患者数据中汇总）
+class MaternalCOXPatientRequest(BaseModel):
+    pdas: bool
+    cox1_time: int
+    plt: Optional[float] = None
+    cr: Optional[float] = None
+    up24: Optional[float] = None
+    alt: Optional[float] = None
+    sbpmax: Optional[float] = None
+
+class NeonatalCOXPatientRequest(BaseModel):
+    gda_group: float
+    cox2_time: int
+    nst: bool
+    admission_date: Optional[date] = None
+    sbp_admission: Optional[float] = None
+    dbp_admission: Optional[float] = None
+    cr2: Optional[float] = None
+
 # 患者数据请求模型
 class PatientGeneralInfoRequest(BaseModel):
     age: Optional[int] = None
@@ -69,6 +88,7 @@ class PatientGeneralInfoRequest(BaseModel):
     complications: Optional[str] = None
 
 class PatientLabImagingRequest(BaseModel):
+    patient_id: Optional[int] = None
     examination_date: Optional[date] = None
     ultrasound_date: Optional[date] = None
     rbc_count: Optional[float] = None
@@ -112,6 +132,7 @@ class PatientLabImagingRequest(BaseModel):
     cpr: Optional[float] = None
 
 class PatientHomeMonitoringRequest(BaseModel):
+    patient_id: Optional[int] = None
     home_monitoring_date: Optional[date] = None
     home_systolic: Optional[float] = None
     home_diastolic: Optional[float] = None
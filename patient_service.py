@@ -2,12 +2,20 @@
 患者数据服务模块
 """
 
+from datetime import date
+from typing import Dict, Optional
 from fastapi import HTTPException
 from models import (
     PatientGeneralInfoRequest, PatientLabImagingRequest, 
     PatientHomeMonitoringRequest, SaveResponse
 )
 from database import execute_insert
+from file_store import StoredFile
+from table_versions import record_write
+from event_bus import publish
+from bp_timeseries import bp_store, maternal_cox_inputs
+from feature_service import invalidate_patient_features
+from derived_features import general_info_features, gestational_days_at, map_of, patient_lmp
 
 def save_patient_general_info(request: PatientGeneralInfoRequest) -> SaveResponse:
     """保存患者基本信息"""
@@ -18,13 +26,19 @@ def save_patient_general_info(request: PatientGeneralInfoRequest) -> SaveRespons
         gestational_weeks, pre_pregnancy_systolic, pre_pregnancy_diastolic,
         pre_pregnancy_map, medical_history, gravidity, parity, uterine_surgery,
         family_history, allergy_history, conception_method, pregnancy_type,
-        aspirin_use, complications
+        aspirin_use, complications, gestational_days, derived_bmi, derived_map
     ) VALUES (
         %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-        %s, %s, %s, %s, %s, %s
+        %s, %s, %s, %s, %s, %s, %s, %s, %s
     )
     """
     
+    # 派生特征：录入当天的孕天数、由身高体重和血压计算的 BMI、MAP
+    derived = general_info_features(
+        request.last_menstrual_period, request.gestational_weeks, date.today(), request.height,
+        request.pre_pregnancy_weight, request.pre_pregnancy_systolic, request.pre_pregnancy_diastolic
+    )
+    
     values = (
         request.age, request.ethnicity, request.education, request.occupation,
         request.economic_status, request.height, request.pre_pregnancy_weight,
@@ -34,13 +48,16 @@ def save_patient_general_info(request: PatientGeneralInfoRequest) -> SaveRespons
         request.medical_history, request.gravidity, request.parity,
         request.uterine_surgery, request.family_history, request.allergy_history,
         request.conception_method, request.pregnancy_type, request.aspirin_use,
-        request.complications
+        request.complications, *derived
     )
     
     record_id, error = execute_insert(sql, values)
     if error:
         raise HTTPException(status_code=500, detail=error)
     
+    record_write("patient_general_info")
+    publish("general_info", {"id": record_id, **request.model_dump()})
+    
     return SaveResponse(
         success=True,
         message="患者基本信息保存成功",
@@ -51,22 +68,24 @@ def save_patient_lab_imaging(request: PatientLabImagingRequest) -> SaveResponse:
     """保存患者实验室检查数据"""
     sql = """
     INSERT INTO patient_lab_imaging (
-        examination_date, ultrasound_date, rbc_count, wbc_count, hemoglobin,
+        patient_id, examination_date, ultrasound_date, rbc_count, wbc_count, hemoglobin,
         platelet_count, hematocrit, platelet_volume, urine_protein_qualitative,
         urine_cast, urine_protein_24h, total_bilirubin, total_protein, albumin,
         alt, ast, total_bile_acid, creatinine, urea, uric_acid, aptt, pt, inr,
         tt, fib, d_dimer, fasting_glucose, glucose_1h, glucose_2h, plgf, sflt1,
         sflt1_plgf_ratio, nt, uta_pi, ua_sd_ratio, ua_pi, ua_ri, mca_sd_ratio,
-        mca_pi, mca_ri, cpr
+        mca_pi, mca_ri, cpr, gestational_days
     ) VALUES (
         %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
         %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-        %s, %s, %s, %s, %s
+        %s, %s, %s, %s, %s, %s, %s
     )
     """
     
+    gestational_days = gestational_days_at(patient_lmp(request.patient_id), request.examination_date)
+    
     values = (
-        request.examination_date, request.ultrasound_date, request.rbc_count,
+        request.patient_id, request.examination_date, request.ultrasound_date, request.rbc_count,
         request.wbc_count, request.hemoglobin, request.platelet_count,
         request.hematocrit, request.platelet_volume, request.urine_protein_qualitative,
         request.urine_cast, request.urine_protein_24h, request.total_bilirubin,
@@ -77,40 +96,87 @@ def save_patient_lab_imaging(request: PatientLabImagingRequest) -> SaveResponse:
         request.glucose_2h, request.plgf, request.sflt1, request.sflt1_plgf_ratio,
         request.nt, request.uta_pi, request.ua_sd_ratio, request.ua_pi,
         request.ua_ri, request.mca_sd_ratio, request.mca_pi, request.mca_ri,
-        request.cpr
+        request.cpr, gestational_days
     )
     
     record_id, error = execute_insert(sql, values)
     if error:
         raise HTTPException(status_code=500, detail=error)
     
+    record_write("patient_lab_imaging")
+    invalidate_patient_features(request.patient_id)
+    publish("lab_imaging", {"id": record_id, **request.model_dump()})
+    
     return SaveResponse(
         success=True,
         message="实验室检查数据保存成功",
         id=record_id
     )
 
-def save_patient_home_monitoring(request: PatientHomeMonitoringRequest) -> SaveResponse:
-    """保存患者家庭监测数据"""
+def save_patient_home_monitoring(request: PatientHomeMonitoringRequest,
+                                 stored_files: Optional[Dict[str, StoredFile]] = None) -> SaveResponse:
+    """保存患者家庭监测数据，stored_files 为已写入文件存储的上传文件（字段名 -> StoredFile）"""
     sql = """
     INSERT INTO patient_home_monitoring (
-        home_monitoring_date, home_systolic, home_diastolic, fetal_heart_rate,
-        fetal_movement, home_sflt1_plgf_ratio, fetal_monitoring_file, urine_test_file
-    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        patient_id, home_monitoring_date, home_systolic, home_diastolic, fetal_heart_rate,
+        fetal_movement, home_sflt1_plgf_ratio, fetal_monitoring_file, urine_test_file,
+        fetal_monitoring_file_sha256, urine_test_file_sha256, gestational_days, derived_map
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
     """
     
+    # 监测日期缺失时按当天计算孕天数（与血压时间序列一致）
+    monitoring_date = request.home_monitoring_date or date.today()
+    stored_files = stored_files or {}
+    file_hashes = {
+        name: stored_files[name].sha256 if name in stored_files else None
+        for name in ('fetal_monitoring_file', 'urine_test_file')
+    }
+    
     values = (
-        request.home_monitoring_date, request.home_systolic, request.home_diastolic,
+        request.patient_id, request.home_monitoring_date, request.home_systolic, request.home_diastolic,
         request.fetal_heart_rate, request.fetal_movement, request.home_sflt1_plgf_ratio,
-        request.fetal_monitoring_file, request.urine_test_file
+        request.fetal_monitoring_file, request.urine_test_file,
+        file_hashes['fetal_monitoring_file'], file_hashes['urine_test_file'],
+        gestational_days_at(patient_lmp(request.patient_id), monitoring_date),
+        map_of(request.home_systolic, request.home_diastolic)
     )
     
     record_id, error = execute_insert(sql, values)
     if error:
         raise HTTPException(status_code=500, detail=error)
     
+    record_write("patient_home_monitoring")
+    invalidate_patient_features(request.patient_id)
+    if request.patient_id is not None:
+        bp_store.record(
+            request.patient_id, monitoring_date,
+            request.home_systolic, request.home_diastolic
+        )
+    publish("home_monitoring", {
+        "id": record_id,
+        **request.model_dump(exclude={'fetal_monitoring_file', 'urine_test_file'}),
+        **{
+            f"{name}_status": '有文件' if getattr(request, name) is not None or file_hashes[name] else '无文件'
+            for name in file_hashes
+        }
+    })
+    
     return SaveResponse(
         success=True,
         message="家庭监测数据保存成功",
         id=record_id
-    ) 
\ No newline at end of file
+    ) 
+
+def get_patient_bp_summary(patient_id: int) -> dict:
+    """获取患者家庭血压滚动统计及可直接填入COX模型的输入"""
+    try:
+        summary = bp_store.summary(patient_id)
+        cox_inputs = maternal_cox_inputs(patient_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"血压统计失败: {str(e)}")
+    
+    return {
+        "patient_id": patient_id,
+        "windows": summary,
+        "maternal_cox_inputs": cox_inputs
+    }
\ No newline at end of file
@@ -0,0 +1,132 @@
+"""
+预测记录存储模块
+full 模式下每次预测在 model_*_params 表保存一行完整记录；
+compact 模式下相同的输入（及结果）只保存一行参数记录，按归一化哈希去重并累计使用次数，
+每次预测在 prediction_events 表记一条事件（参数记录 id + 预测时间），读取时再关联出完整记录。
+
+COX 模型表的 source 列区分人工预测（clinician）和批量重新评分（rescore）写入的记录，
+后者的 rescore_run 为评分批次，(rescore_run, patient_id) 唯一
+"""
+
+import hashlib
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, Optional, Sequence, Tuple
+from config import AUDIT_CONFIG
+from database import errors, get_backend, get_db_connection, close_db_connection, execute_insert
+
+# 各预测表保存的字段（不含 id 和 created_at），顺序与保存时的取值顺序一致
+PREDICTION_COLUMNS: Dict[str, Tuple[str, ...]] = {
+    'model_fgr_params': (
+        'preterm', 'lmp_date', 'diagnosis_date', 'hypertension', 'nst', 'weight_growth',
+        'umbilical_flow', 'prediction_result', 'gestational_days', 'logit_value'
+    ),
+    'model_fgr_neonatal_params': (
+        'anc_visits', 'umbilical_flow', 'pe_gestation', 'delivery_gestation',
+        'fetal_growth', 'prediction_result', 'logit_value'
+    ),
+    'model_maternal_cox_params': (
+        'patient_id', 'plt', 'cr', 'up24', 'alt', 'sbpmax', 'pdas', 'cox1_time', 'prediction_result',
+        'linear_predictor', 'baseline_hazard', 'survival_probability'
+    ),
+    'model_neonatal_cox_params': (
+        'patient_id', 'lmp_date', 'admission_date', 'gda_group', 'cox2_time', 'nst', 'sbp_admission',
+        'dbp_admission', 'cr2', 'prediction_result', 'gestational_days', 'map_value',
+        'gda_time', 'linear_predictor', 'baseline_hazard', 'survival_probability'
+    )
+}
+
+# 带 source / rescore_run 列的预测表（批量重新评分写入的表）
+RESCORED_TABLES = ('model_maternal_cox_params', 'model_neonatal_cox_params')
+
+# 预测记录来源
+SOURCE_CLINICIAN = 'clinician'
+SOURCE_RESCORE = 'rescore'
+
+def is_compact() -> bool:
+    return AUDIT_CONFIG['mode'] == 'compact'
+
+def model_type_of(table: str) -> str:
+    """表名对应的模型类型，如 model_fgr_params -> fgr"""
+    return table[len('model_'):-len('_params')]
+
+def _normalize(value) -> str:
+    """把取值转换为稳定的文本：数值统一按浮点格式化（1 与 1.0 相同），日期用 ISO 格式"""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, (int, float, Decimal)):
+        return format(float(value), '.12g')
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value).strip()
+
+def input_hash(table: str, values: Sequence) -> bytes:
+    """
+    记录的归一化哈希（SHA-256，32 字节二进制）：包含全部输入和结果字段，
+    模型系数调整后结果不同的记录不会与旧记录合并
+    """
+    text = '\x1f'.join([table] + [_normalize(value) for value in values])
+    return hashlib.sha256(text.encode('utf-8')).digest()
+
+def save_prediction(table: str, values: Sequence) -> Tuple[Optional[int], Optional[str]]:
+    """保存一次预测，返回 (参数记录 id, 错误信息)"""
+    columns = PREDICTION_COLUMNS[table]
+    if not is_compact():
+        placeholders = ", ".join(["%s"] * len(columns))
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+        return execute_insert(sql, tuple(values))
+
+    connection = get_db_connection()
+    if not connection:
+        return None, "数据库连接失败"
+
+    try:
+        cursor = connection.cursor()
+        # 相同哈希已存在时累计使用次数，返回已有记录的 id
+        now = datetime.now()
+        record_id = get_backend().upsert_id(
+            cursor, table, (*columns, 'input_hash', 'last_used_at'), (*values, input_hash(table, values), now),
+            'input_hash', "use_count = use_count + 1, last_used_at = %s", (now,)
+        )
+        cursor.execute(
+            "INSERT INTO prediction_events (model_type, params_id) VALUES (%s, %s)",
+            (model_type_of(table), record_id)
+        )
+        connection.commit()
+        cursor.close()
+        return record_id, None
+    except errors() as e:
+        connection.rollback()
+        return None, f"数据库操作失败: {str(e)}"
+    finally:
+        close_db_connection(connection)
+
+def prediction_source(table: str, source: Optional[str] = SOURCE_CLINICIAN) -> str:
+    """
+    查询预测记录时 FROM 子句使用的数据源，每次预测对应一行，字段与原表相同。
+    compact 模式下为完整记录（未去重的旧记录、批量评分写入的记录）与「事件 + 参数记录」的合并，
+    created_at 取事件时间，COX 模型表另带 source 列；结果以原表名为别名，原有查询只需替换 FROM 后的表名。
+    source 默认只取人工预测（批量评分每晚为每名在孕患者新增记录，不计入统计），为 None 时取全部来源
+    """
+    if table not in RESCORED_TABLES:
+        # 其它模型只有人工预测
+        if source == SOURCE_RESCORE:
+            return f"(SELECT * FROM {table} WHERE 1 = 0) AS {table}"
+        source = None
+    if not is_compact():
+        return table if source is None else f"(SELECT * FROM {table} WHERE source = '{source}') AS {table}"
+
+    names = PREDICTION_COLUMNS[table] + (('source',) if table in RESCORED_TABLES else ())
+    columns = ", ".join(names)
+    joined = ", ".join(f"p.{column}" for column in names)
+    condition = f" AND source = '{source}'" if source is not None else ""
+    joined_condition = f" AND p.source = '{source}'" if source is not None else ""
+    return f"""(
+        SELECT id, {columns}, created_at FROM {table} WHERE input_hash IS NULL{condition}
+        UNION ALL
+        SELECT p.id, {joined}, e.created_at
+        FROM prediction_events e JOIN {table} p ON p.id = e.params_id
+        WHERE e.model_type = '{model_type_of(table)}'{joined_condition}
+    ) AS {table}"""
\ No newline at end of file
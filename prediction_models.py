@@ -4,6 +4,7 @@
 
 import math
 from datetime import date
+from typing import Optional
 from fastapi import HTTPException
 from models import (
     FGRPredictionRequest, FGRNeonatalPredictionRequest,
@@ -92,7 +93,7 @@ def predict_fgr_neonatal(request: FGRNeonatalPredictionRequest) -> PredictionRes
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"预测计算错误: {str(e)}")
 
-def predict_maternal_cox(request: MaternalCOXPredictionRequest) -> PredictionResponse:
+def predict_maternal_cox(request: MaternalCOXPredictionRequest, patient_id: Optional[int] = None) -> PredictionResponse:
     """
     子痫前期母体不良结局COX模型预测
     """
@@ -125,7 +126,7 @@ def predict_maternal_cox(request: MaternalCOXPredictionRequest) -> PredictionRes
         
         # 保存预测结果到数据库
         try:
-            save_maternal_cox_prediction(request, result)
+            save_maternal_cox_prediction(request, result, patient_id)
         except Exception as save_error:
             print(f"保存Maternal-COX预测结果失败: {save_error}")
             # 不中断预测流程，只记录错误
@@ -134,7 +135,7 @@ def predict_maternal_cox(request: MaternalCOXPredictionRequest) -> PredictionRes
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"预测计算错误: {str(e)}")
 
-def predict_neonatal_cox(request: NeonatalCOXPredictionRequest) -> PredictionResponse:
+def predict_neonatal_cox(request: NeonatalCOXPredictionRequest, patient_id: Optional[int] = None) -> PredictionResponse:
     """
     子痫前期新生儿不良结局COX模型预测
     """
@@ -178,7 +179,7 @@ def predict_neonatal_cox(request: NeonatalCOXPredictionRequest) -> PredictionRes
         
         # 保存预测结果到数据库
         try:
-            save_neonatal_cox_prediction(request, result)
+            save_neonatal_cox_prediction(request, result, patient_id)
         except Exception as save_error:
             print(f"保存Neonatal-COX预测结果失败: {save_error}")
             # 不中断预测流程，只记录错误
@@ -0,0 +1,507 @@
+#!/usr/bin/env python3
+"""
+查询计划检查脚本
+
+在空库中写入合成数据（默认使用临时 SQLite 库），检查两类查询的执行计划：
+    - 人群筛选：每个白名单字段的条件都使用对应的二级索引，不扫描任何数据表
+    - 管理端接口：逐个请求 ADMIN_VARIANTS 中的接口变体，记录实际执行的每条 SQL，
+      执行 EXPLAIN（MySQL 为 EXPLAIN FORMAT=JSON），大表上不允许全表扫描，
+      也不允许对整表（全表或全索引扫描）的结果排序；并与 query_plan_budgets.json 中记录的
+      工作量预算比较（MySQL 为读取的行数，SQLite 为执行的虚拟机指令数，单位千条）
+
+用法:
+    python query_plans.py [--backend sqlite|mysql] [--patients 20000] [--record]
+
+说明:
+    - --backend mysql 写入 DB_CONFIG 指定的库，请使用单独的空库（DB_DATABASE=...），已有数据时拒绝执行
+    - 修改查询或索引后工作量确有变化时，用 --record 重新记录当前后端的预算并提交
+    - 任一检查未通过时退出码为 1
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+SEED_BATCH_SIZE = 5000
+
+# 工作量预算文件：后端 -> {"patients": 患者数, "statements": {"接口变体 #序号": 工作量}}
+BUDGETS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'query_plan_budgets.json')
+# 实测工作量超过预算的该倍数（且至少多出 BUDGET_SLACK）时视为退化
+BUDGET_TOLERANCE = 1.5
+BUDGET_SLACK = 5
+# SQLite 每执行该数量的虚拟机指令计一个工作量单位
+SQLITE_WORK_UNIT = 1000
+
+# 合成数据写入的表（均视为大表）
+SEEDED_TABLES = (
+    'patient_general_info', 'patient_lab_imaging', 'patient_home_monitoring', 'model_fgr_params',
+    'model_fgr_neonatal_params', 'model_maternal_cox_params', 'model_neonatal_cox_params'
+)
+
+def _insert_many(connection, table: str, columns: Sequence[str], rows: List[tuple]) -> None:
+    cursor = connection.cursor()
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+    for start in range(0, len(rows), SEED_BATCH_SIZE):
+        cursor.executemany(sql, rows[start:start + SEED_BATCH_SIZE])
+        connection.commit()
+    cursor.close()
+
+def _at(rng: random.Random, day: date) -> datetime:
+    """某一天内的随机录入时间"""
+    return datetime.combine(day, datetime.min.time()) + timedelta(seconds=rng.randint(8 * 3600, 20 * 3600))
+
+def seed(connection, patients: int) -> None:
+    """
+    写入合成数据：每名患者 3 次实验室检查、10 次家庭监测、每个模型各 1 次预测，录入时间分布在近 300 天；
+    分类字段按常见比例分布（如阿司匹林使用约 15%、双胎约 5%）
+    """
+    from derived_features import gestational_days_at, map_of
+
+    rng = random.Random(42)
+    today = date.today()
+    general, lab, home, predictions = [], [], [], []
+    for patient_id in range(1, patients + 1):
+        lmp = today - timedelta(days=rng.randint(30, 300))
+        sbp, dbp = rng.gauss(125, 15), rng.gauss(80, 10)
+        height, weight = rng.gauss(160, 6), rng.gauss(60, 9)
+        entry_day = min(today, lmp + timedelta(days=rng.randint(28, 84)))
+        general.append((
+            patient_id, rng.randint(20, 45), rng.choice([0, 0, 0, 1, 1, 2, 3]),
+            '双胎' if rng.random() < 0.05 else '单胎', '是' if rng.random() < 0.15 else '否',
+            'IVF' if rng.random() < 0.15 else '自然受孕', lmp, gestational_days_at(lmp, entry_day),
+            round(weight / (height / 100) ** 2, 2), map_of(sbp, dbp), _at(rng, entry_day)
+        ))
+        for visit in range(3):
+            day = min(today, lmp + timedelta(days=rng.randint(60, 280)))
+            ratio = rng.lognormvariate(2.5, 1.0)
+            plgf = rng.lognormvariate(5.5, 0.6)
+            lab.append((
+                patient_id, day, gestational_days_at(lmp, day), round(ratio, 2), round(plgf, 1),
+                round(ratio * plgf, 1), round(rng.gauss(220, 50), 1), round(rng.gauss(60, 15), 1),
+                round(rng.lognormvariate(3, 0.5), 1), round(rng.lognormvariate(-1, 1), 2), _at(rng, day)
+            ))
+        for visit in range(10):
+            day = min(today, lmp + timedelta(days=rng.randint(60, 280)))
+            home_sbp, home_dbp = rng.gauss(130, 15), rng.gauss(85, 10)
+            home.append((
+                patient_id, day, gestational_days_at(lmp, day), map_of(home_sbp, home_dbp),
+                round(home_sbp), round(home_dbp), round(rng.lognormvariate(2.5, 1.0), 2), _at(rng, day)
+            ))
+        predicted_at = _at(rng, min(today, lmp + timedelta(days=rng.randint(140, 280))))
+        predictions.append((patient_id, round(rng.uniform(0, 100), 2), predicted_at))
+
+    _insert_many(connection, 'patient_general_info', (
+        'id', 'age', 'parity', 'pregnancy_type', 'aspirin_use', 'conception_method', 'last_menstrual_period',
+        'gestational_days', 'derived_bmi', 'derived_map', 'created_at'
+    ), general)
+    _insert_many(connection, 'patient_lab_imaging', (
+        'patient_id', 'examination_date', 'gestational_days', 'sflt1_plgf_ratio', 'plgf', 'sflt1',
+        'platelet_count', 'creatinine', 'alt', 'urine_protein_24h', 'created_at'
+    ), lab)
+    _insert_many(connection, 'patient_home_monitoring', (
+        'patient_id', 'home_monitoring_date', 'gestational_days', 'derived_map', 'home_systolic',
+        'home_diastolic', 'home_sflt1_plgf_ratio', 'created_at'
+    ), home)
+    for table in ('model_maternal_cox_params', 'model_neonatal_cox_params'):
+        _insert_many(connection, table, ('patient_id', 'prediction_result', 'created_at'), predictions)
+    # FGR 类预测不关联患者
+    for table in ('model_fgr_params', 'model_fgr_neonatal_params'):
+        _insert_many(connection, table, ('prediction_result', 'created_at'), [row[1:] for row in predictions])
+
+def analyze(connection, tables: Sequence[str]) -> None:
+    """更新优化器统计信息"""
+    from database import get_backend
+    backend = get_backend()
+
+    cursor = connection.cursor()
+    if backend.name == 'sqlite':
+        cursor.execute("ANALYZE")
+    else:
+        for table in tables:
+            cursor.execute(f"ANALYZE TABLE {table}")
+            cursor.fetchall()
+    connection.commit()
+    cursor.close()
+
+# SQLite 计划中的访问方式：SCAN 为全表（或全索引）扫描，SEARCH 为按索引查找
+_SQLITE_ACCESS = re.compile(r'^(SCAN|SEARCH) (\w+)(?: USING (?:COVERING |INTEGER PRIMARY KEY|PRIMARY KEY)?(?:INDEX (\w+))?)?')
+_SQLITE_SORT = re.compile(r'^USE TEMP B-TREE FOR (?:ORDER|GROUP) BY')
+
+def explain(connection, sql: str, params: Optional[Sequence[Any]]) -> List[Dict[str, Optional[str]]]:
+    """
+    返回查询计划中的访问方式 [{'table', 'access', 'index', 'block'}]，table 为 SQL 中的表名或别名，access 为
+    scan（全表扫描）、index_scan（全索引扫描）、search（按索引查找）或 filesort（结果排序，table 为空），
+    block 为所属查询块（同一查询块中的排序作用于该块读取的表）
+    """
+    from database import get_backend
+    backend = get_backend()
+
+    cursor = connection.cursor()
+    accesses = []
+    if backend.name == 'sqlite':
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        for row in cursor.fetchall():
+            if _SQLITE_SORT.match(row[3]):
+                accesses.append({'table': None, 'access': 'filesort', 'index': None, 'block': row[1]})
+                continue
+            match = _SQLITE_ACCESS.match(row[3])
+            if match and match.group(2) != 'CONSTANT':
+                if match.group(1) == 'SEARCH':
+                    access = 'search'
+                else:
+                    access = 'index_scan' if match.group(3) else 'scan'
+                accesses.append({'table': match.group(2), 'access': access, 'index': match.group(3), 'block': row[1]})
+    else:
+        cursor.execute(f"EXPLAIN FORMAT=JSON {sql}", params)
+        _collect_mysql_plan(json.loads(cursor.fetchone()[0]), accesses, [0], 0)
+    cursor.close()
+    return accesses
+
+_MYSQL_ACCESS = {'ALL': 'scan', 'index': 'index_scan'}
+
+def _collect_mysql_plan(node: Any, accesses: List[dict], blocks: List[int], block: int) -> None:
+    """
+    遍历 EXPLAIN FORMAT=JSON 的结果：ALL 为全表扫描，index 为全索引扫描，using_filesort 为排序；
+    每个 query_block 编一个查询块号
+    """
+    if isinstance(node, dict):
+        if node.get('using_filesort'):
+            accesses.append({'table': None, 'access': 'filesort', 'index': None, 'block': block})
+        table = node.get('table')
+        if isinstance(table, dict) and 'access_type' in table:
+            accesses.append({
+                'table': table.get('table_name'),
+                'access': _MYSQL_ACCESS.get(table['access_type'], 'search'),
+                'index': table.get('key'),
+                'block': block
+            })
+        for key, value in node.items():
+            if key == 'query_block':
+                blocks[0] += 1
+                _collect_mysql_plan(value, accesses, blocks, blocks[0])
+            else:
+                _collect_mysql_plan(value, accesses, blocks, block)
+    elif isinstance(node, list):
+        for item in node:
+            _collect_mysql_plan(item, accesses, blocks, block)
+
+def measure_work(connection, sql: str, params: Optional[Sequence[Any]]) -> int:
+    """
+    执行查询并读取全部结果，返回工作量：MySQL 为 Handler_read_* 计数之和（实际读取的行数），
+    SQLite 为执行的虚拟机指令数（千条）
+    """
+    from database import get_backend
+    backend = get_backend()
+
+    cursor = connection.cursor()
+    if backend.name == 'sqlite':
+        steps = [0]
+
+        def tick():
+            steps[0] += 1
+            return 0
+
+        connection.set_progress_handler(tick, SQLITE_WORK_UNIT)
+        try:
+            cursor.execute(sql, params)
+            cursor.fetchall()
+        finally:
+            connection.set_progress_handler(None, 0)
+        work = steps[0]
+    else:
+        def handler_reads() -> int:
+            cursor.execute("SHOW SESSION STATUS LIKE 'Handler_read%'")
+            return sum(int(value) for _, value in cursor.fetchall())
+
+        before = handler_reads()
+        cursor.execute(sql, params)
+        cursor.fetchall()
+        work = handler_reads() - before
+    cursor.close()
+    return work
+
+def _sample_value(connection, table: str, column: str) -> Any:
+    """取字段约 2% 分位的较大值，作为 gte 条件的阈值（命中少量记录）"""
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT COUNT({column}) FROM {table}")
+    count = cursor.fetchone()[0]
+    cursor.execute(
+        f"SELECT {column} FROM {table} WHERE {column} IS NOT NULL ORDER BY {column} DESC LIMIT 1 OFFSET %s",
+        (count // 50,)
+    )
+    value = cursor.fetchone()[0]
+    cursor.close()
+    return value.isoformat() if isinstance(value, date) else value
+
+def cohort_cases(connection) -> List[Tuple[str, List[tuple], str]]:
+    """人群筛选检查用例 (说明, 条件, 必须使用的索引)：每个白名单字段一个用例，另加组合条件"""
+    from cohort_query import COHORT_SOURCES, index_name
+
+    cases = []
+    for source, (table, _, columns) in COHORT_SOURCES.items():
+        for column in columns:
+            value = _sample_value(connection, table, column)
+            field = f"{source}.{column}"
+            cases.append((f"{field} >= {value}", [(field, 'gte', value)], index_name(source, column)))
+
+    cases.append((
+        "孕 28-34 周且家庭 MAP > 105",
+        [('home.gestational_days', 'between', [196, 238]), ('home.derived_map', 'gt', 105)],
+        index_name('home', 'gestational_days')
+    ))
+    cases.append((
+        "使用阿司匹林且 sFlt-1/PlGF > 85",
+        [('patient.aspirin_use', 'eq', '是'), ('lab.sflt1_plgf_ratio', 'gt', 85)],
+        index_name('lab', 'sflt1_plgf_ratio')
+    ))
+    return cases
+
+def check_cohort_plans(connection) -> bool:
+    """人群计数查询必须使用字段对应的索引，且不扫描任何数据表（包括全索引扫描）"""
+    from cohort_query import count_query
+
+    print("== 人群筛选 ==")
+    passed = True
+    for description, filters, expected_index in cohort_cases(connection):
+        sql, params = count_query(filters)
+        accesses = explain(connection, sql, params)
+        used = [access['index'] for access in accesses if access['index']]
+        scans = [access['table'] for access in accesses if access['access'] in ('scan', 'index_scan')]
+        ok = expected_index in used and not scans
+        passed = passed and ok
+        detail = f"索引: {', '.join(used) or '无'}" + (f"，全表扫描: {', '.join(scans)}" if scans else "")
+        print(f"{'✅' if ok else '❌'} {description:<45} {detail}")
+    return passed
+
+def admin_variants() -> List[Tuple[str, str, str, Dict[str, Any], Dict[str, str]]]:
+    """
+    管理端接口变体 (名称, 方法, 路径, 查询参数或请求体, 允许扫描的表 -> 原因)。
+    新增接口或查询参数时在这里补充变体，并用 --record 记录预算
+    """
+    today = date.today()
+    recent = (today - timedelta(days=30)).isoformat()
+    whole_table_aggregate = "对整表聚合，工作量由预算约束"
+    return [
+        ("患者列表", "GET", "/admin/patients/general-info", {}, {}),
+        ("患者列表 第50页", "GET", "/admin/patients/general-info", {"page": 50}, {}),
+        ("患者列表 近30天+年龄", "GET", "/admin/patients/general-info",
+         {"start_date": recent, "age_min": 30, "age_max": 35}, {}),
+        ("检查列表", "GET", "/admin/patients/lab-imaging", {"fields": "creatinine,alt"}, {}),
+        ("检查列表 检查日期", "GET", "/admin/patients/lab-imaging",
+         {"start_date": recent, "end_date": today.isoformat()}, {}),
+        ("监测列表", "GET", "/admin/patients/home-monitoring", {}, {}),
+        ("监测列表 监测日期", "GET", "/admin/patients/home-monitoring", {"start_date": recent}, {}),
+        ("预测列表 全部模型", "GET", "/admin/predictions", {}, {}),
+        ("预测列表 全部模型 第10页+日期", "GET", "/admin/predictions", {"page": 10, "start_date": recent}, {}),
+        ("预测列表 单个模型+风险", "GET", "/admin/predictions",
+         {"model_type": "maternal_cox", "min_prediction": 90}, {}),
+        ("统计", "GET", "/admin/statistics", {}, {'patient_general_info': whole_table_aggregate}),
+        ("统计 近30天", "GET", "/admin/statistics", {"start_date": recent}, {}),
+        ("风险分布", "GET", "/admin/predictions/distribution", {},
+         {table: whole_table_aggregate for table in SEEDED_TABLES if table.startswith('model_')}),
+        ("风险分布 近30天", "GET", "/admin/predictions/distribution", {"start_date": recent}, {}),
+        ("患者详情", "GET", "/admin/patients/1/detail", {}, {}),
+        ("导出 近30天", "GET", "/admin/export/patients", {"format": "json", "start_date": recent}, {}),
+        ("导出 全部", "GET", "/admin/export/patients", {"format": "json"}, {}),
+        ("人群筛选 分页", "POST", "/admin/cohort/query", {"filters": [
+            {"field": "home.gestational_days", "op": "between", "value": [196, 238]},
+            {"field": "home.derived_map", "op": "gt", "value": 105}
+        ]}, {}),
+        ("人群筛选 计数", "POST", "/admin/cohort/query", {"count_only": True, "filters": [
+            {"field": "patient.aspirin_use", "op": "eq", "value": "是"},
+            {"field": "lab.sflt1_plgf_ratio", "op": "gt", "value": 85}
+        ]}, {})
+    ]
+
+class _CapturingCursor:
+    """记录执行的 SQL 后交给原游标"""
+
+    def __init__(self, cursor, statements: list):
+        self._cursor = cursor
+        self._statements = statements
+
+    def execute(self, sql, params=None):
+        self._statements.append((sql, None if params is None else tuple(params)))
+        return self._cursor.execute(sql, params)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class _CapturingConnection:
+    def __init__(self, connection, statements: list):
+        self._connection = connection
+        self._statements = statements
+
+    def cursor(self, *args, **kwargs):
+        return _CapturingCursor(self._connection.cursor(*args, **kwargs), self._statements)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+_TABLE_ALIAS = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(?!WHERE|ORDER|GROUP|LEFT|JOIN|ON|LIMIT|UNION)(\w+))?', re.I)
+
+def _table_aliases(sql: str) -> Dict[str, str]:
+    """SQL 中的表名和别名 -> 表名"""
+    aliases = {}
+    for table, alias in _TABLE_ALIAS.findall(sql):
+        aliases[table] = table
+        if alias:
+            aliases[alias] = table
+    return aliases
+
+def plan_violations(sql: str, accesses: List[dict], allowed: Dict[str, str]) -> List[str]:
+    """大表上的全表扫描，以及同一查询块中对整表（全表或全索引扫描）结果的排序"""
+    aliases = _table_aliases(sql)
+    whole_table: Dict[Any, List[str]] = {}
+    violations = []
+    for access in accesses:
+        table = aliases.get(access['table'])
+        if table not in SEEDED_TABLES or table in allowed:
+            continue
+        if access['access'] == 'scan':
+            violations.append(f"全表扫描 {table}")
+        if access['access'] in ('scan', 'index_scan'):
+            whole_table.setdefault(access['block'], []).append(table)
+    for access in accesses:
+        if access['access'] == 'filesort' and access['block'] in whole_table:
+            violations.append(f"对整表排序 {', '.join(whole_table[access['block']])}")
+    return violations
+
+def _summary(accesses: List[dict]) -> str:
+    parts = []
+    for access in accesses:
+        if access['access'] == 'filesort':
+            parts.append("排序")
+        else:
+            parts.append(f"{access['table']}:{access['access']}" + (f"({access['index']})" if access['index'] else ""))
+    return ", ".join(parts)
+
+def check_admin_plans(connection, budgets: Dict[str, int]) -> Tuple[bool, Dict[str, int]]:
+    """逐个请求管理端接口变体，检查每条 SQL 的执行计划和工作量，返回 (是否通过, 实测工作量)"""
+    from fastapi.testclient import TestClient
+    from database import get_backend
+    backend = get_backend()
+    from main import app
+
+    statements: List[Tuple[str, Optional[tuple]]] = []
+    connect = backend.connect
+    backend.connect = lambda: _CapturingConnection(connect(), statements)
+    client = TestClient(app)
+
+    print("== 管理端接口 ==")
+    passed = True
+    measured = {}
+    try:
+        for name, method, path, payload, allowed in admin_variants():
+            statements.clear()
+            if method == "GET":
+                response = client.get(path, params=payload)
+            else:
+                response = client.request(method, path, json=payload)
+            if response.status_code >= 400:
+                print(f"❌ {name}: 请求失败 {response.status_code} {response.text[:200]}")
+                passed = False
+                continue
+
+            # 并发执行的查询顺序不固定，按 SQL 排序后编号，预算才能对应到同一条语句
+            selects = sorted(
+                {(sql, params) for sql, params in statements if sql.lstrip().upper().startswith("SELECT")},
+                key=lambda statement: (statement[0], repr(statement[1]))
+            )
+            for index, (sql, params) in enumerate(selects, 1):
+                key = f"{name} #{index}"
+                accesses = explain(connection, sql, params)
+                violations = plan_violations(sql, accesses, allowed)
+                work = measure_work(connection, sql, params)
+                measured[key] = work
+                budget = budgets.get(key)
+                if budget is not None and work > max(budget * BUDGET_TOLERANCE, budget + BUDGET_SLACK):
+                    violations.append(f"工作量 {work} 超出预算 {budget}")
+                ok = not violations
+                passed = passed and ok
+                budget_text = f"预算 {budget}" if budget is not None else "未记录预算"
+                print(f"{'✅' if ok else '❌'} {key:<32} 工作量 {work:>8}（{budget_text}） {_summary(accesses)}")
+                for violation in violations:
+                    print(f"     ↳ {violation}")
+    finally:
+        backend.connect = connect
+    return passed, measured
+
+def load_budgets(backend_name: str, patients: int) -> Dict[str, int]:
+    """读取当前后端的预算，患者数与记录时不同则不比较"""
+    if not os.path.exists(BUDGETS_PATH):
+        return {}
+    with open(BUDGETS_PATH, 'r', encoding='utf-8') as f:
+        recorded = json.load(f).get(backend_name)
+    if not recorded:
+        print(f"⚠️ 未记录 {backend_name} 的工作量预算，请用 --record 记录")
+        return {}
+    if recorded['patients'] != patients:
+        print(f"⚠️ 预算按 {recorded['patients']} 名患者记录，本次为 {patients} 名，不比较工作量")
+        return {}
+    return recorded['statements']
+
+def record_budgets(backend_name: str, patients: int, measured: Dict[str, int]) -> None:
+    budgets = {}
+    if os.path.exists(BUDGETS_PATH):
+        with open(BUDGETS_PATH, 'r', encoding='utf-8') as f:
+            budgets = json.load(f)
+    budgets[backend_name] = {
+        'patients': patients,
+        'statements': dict(measured)
+    }
+    with open(BUDGETS_PATH, 'w', encoding='utf-8') as f:
+        json.dump(budgets, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write('\n')
+    print(f"📝 已记录 {len(measured)} 条语句的工作量预算: {BUDGETS_PATH}")
+
+def main():
+    parser = argparse.ArgumentParser(description="查询计划检查")
+    parser.add_argument("--backend", choices=["sqlite", "mysql"], default="sqlite")
+    parser.add_argument("--patients", type=int, default=20000)
+    parser.add_argument("--record", action="store_true", help="记录本次实测的工作量预算")
+    args = parser.parse_args()
+
+    if args.backend == 'sqlite':
+        os.environ['DB_SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='plans_'), 'plans.sqlite3')
+    os.environ['DB_BACKEND'] = args.backend
+    # 预测记录按完整模式检查
+    os.environ['PREDICTION_AUDIT_MODE'] = 'full'
+    from database import connect
+
+    connection = connect()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM patient_general_info")
+        if cursor.fetchone()[0]:
+            raise SystemExit("❌ patient_general_info 已有数据，请使用单独的空库")
+        cursor.close()
+
+        print(f"🚀 写入合成数据: {args.patients} 名患者")
+        seed(connection, args.patients)
+        analyze(connection, SEEDED_TABLES)
+        passed = check_cohort_plans(connection)
+        admin_passed, measured = check_admin_plans(
+            connection, {} if args.record else load_budgets(args.backend, args.patients)
+        )
+        passed = passed and admin_passed
+    finally:
+        connection.close()
+
+    if args.record:
+        record_budgets(args.backend, args.patients, measured)
+    if not passed:
+        sys.exit(1)
+    print("✅ 全部查询计划检查通过")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
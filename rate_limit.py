@@ -0,0 +1,189 @@
+"""
+限流模块
+按客户端（请求头 RATE_LIMIT_KEY_HEADER 中已在 RATE_LIMIT_API_KEYS 登记的 API Key，否则按客户端 IP）对预测接口（/predict/）和
+数据录入接口（/api/patient/）限流，两组分别设置每秒速率和突发上限（RATE_LIMIT_PREDICT_RATE/BURST、
+RATE_LIMIT_INGEST_RATE/BURST）。令牌桶按 GCRA 实现，每个客户端只需保存
+一个时间点（理论到达时间 TAT）：TAT 不晚于当前时间表示令牌已满。
+
+客户端状态保存在定长的组相联表中（每组 WAYS 个槽位，每个槽位 24 字节：键哈希、TAT、最近访问时间），
+表满时淘汰同组中最久未访问的客户端，内存占用固定为 RATE_LIMIT_MAX_KEYS × 24 字节，与客户端总数无关。
+RATE_LIMIT_BACKEND=shared 且多 worker 部署时，该表放在共享内存文件中（shared_state），各 worker 共用配额；
+默认 local 时每个 worker 各自计数。
+
+超出配额返回 429，响应头 RateLimit-Limit / RateLimit-Remaining / RateLimit-Reset / RateLimit-Policy
+（IETF RateLimit 头字段草案）和 Retry-After；未超出时同样带 RateLimit-* 响应头
+"""
+
+import hashlib
+import math
+import struct
+import time
+from typing import Any, Dict, Optional, Tuple
+from fastapi.responses import JSONResponse
+from config import RATE_LIMIT_CONFIG
+from shared_state import SharedRecords
+
+# 每组槽位数；槽位为 (键哈希, TAT, 最近访问时间)，键哈希为 0 表示空槽位
+WAYS = 8
+_SLOT_FIELDS = 'qdd'
+_HASH = struct.Struct('<q')
+
+class RateLimitResult:
+    """一次限流检查的结果"""
+
+    def __init__(self, allowed: bool, limit: int, remaining: int, reset: float, retry_after: float, window: float):
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = remaining
+        # 令牌恢复满额的秒数
+        self.reset = reset
+        # 被拒绝时下一个令牌可用的秒数
+        self.retry_after = retry_after
+        # 以该速率恢复满额所需的时间窗口（秒）
+        self.window = window
+
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(math.ceil(self.reset)),
+            "RateLimit-Policy": f"{self.limit};w={math.ceil(self.window)}"
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+class TokenBuckets:
+    """按键哈希定位的令牌桶表（组相联，组内按最近访问时间淘汰）"""
+
+    def __init__(self, capacity: int, shared: bool = False, name: str = 'rate_limit'):
+        self._records = SharedRecords(name, max(1, capacity // WAYS), _SLOT_FIELDS * WAYS, shared)
+        # 本进程淘汰的仍在限流中的客户端数（表容量不足的信号）
+        self.evictions = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self._records.nbytes
+
+    @staticmethod
+    def _fingerprint(key: str) -> int:
+        fingerprint = _HASH.unpack(hashlib.blake2b(key.encode(), digest_size=8).digest())[0]
+        return fingerprint or 1
+
+    def take(self, key: str, rate: float, burst: int, now: Optional[float] = None) -> RateLimitResult:
+        """取一个令牌：速率 rate 个/秒，最多累积 burst 个"""
+        now = time.time() if now is None else now
+        fingerprint = self._fingerprint(key)
+        interval = 1.0 / rate
+        tolerance = interval * burst
+        outcome = {}
+
+        def update(slots: Tuple) -> Tuple:
+            way = victim = None
+            oldest = math.inf
+            for i in range(WAYS):
+                if slots[i * 3] == fingerprint:
+                    way = i
+                    break
+                if slots[i * 3 + 2] < oldest:
+                    oldest, victim = slots[i * 3 + 2], i
+            if way is None:
+                way = victim
+                if slots[way * 3] and slots[way * 3 + 1] > now:
+                    self.evictions += 1
+                tat = now
+            else:
+                tat = max(slots[way * 3 + 1], now)
+
+            allowed = tat + interval - now <= tolerance + 1e-9
+            if allowed:
+                tat += interval
+            outcome.update(allowed=allowed, tat=tat)
+            values = list(slots)
+            values[way * 3:way * 3 + 3] = (fingerprint, tat, now)
+            return tuple(values)
+
+        self._records.update(fingerprint % self._records.count, update)
+        tat = outcome['tat']
+        return RateLimitResult(
+            allowed=outcome['allowed'],
+            limit=burst,
+            remaining=max(0, int((now + tolerance - tat) / interval + 1e-9)),
+            reset=max(0.0, tat - now),
+            retry_after=max(0.0, tat + interval - now - tolerance),
+            window=tolerance
+        )
+
+def route_group(path: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """请求路径所属的限流接口组，不限流的路径返回 None"""
+    for name, group in RATE_LIMIT_CONFIG['groups'].items():
+        if path.startswith(group['paths']):
+            return name, group
+    return None
+
+def api_key(scope) -> Optional[str]:
+    """请求携带的 API Key（未校验）"""
+    header = RATE_LIMIT_CONFIG['key_header']
+    value = dict(scope['headers']).get(header) if header else None
+    if not value:
+        return None
+    return value.decode('latin-1').strip() or None
+
+def client_key(scope) -> str:
+    """
+    客户端标识：已登记的 API Key 优先，否则为客户端 IP（RATE_LIMIT_TRUST_FORWARDED 时取 X-Forwarded-For 的第一个地址）；
+    未登记的 Key 不参与标识，否则每个请求换一个随机 Key 就能得到新的令牌桶
+    """
+    headers = dict(scope['headers'])
+    key = api_key(scope)
+    if key is not None and key in RATE_LIMIT_CONFIG['api_keys']:
+        return 'key:' + key
+    if RATE_LIMIT_CONFIG['trust_forwarded']:
+        forwarded = headers.get(b'x-forwarded-for')
+        if forwarded:
+            return 'ip:' + forwarded.decode('latin-1').split(',')[0].strip()
+    client = scope.get('client')
+    return 'ip:' + (client[0] if client else 'unknown')
+
+_buckets: Optional[TokenBuckets] = None
+
+def get_buckets() -> TokenBuckets:
+    """本进程的令牌桶表（首次请求时创建，共享模式下映射共享内存文件）"""
+    global _buckets
+    if _buckets is None:
+        _buckets = TokenBuckets(RATE_LIMIT_CONFIG['max_keys'], shared=RATE_LIMIT_CONFIG['backend'] == 'shared')
+    return _buckets
+
+class RateLimitMiddleware:
+    """按客户端和接口组限流，超出配额返回 429"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not RATE_LIMIT_CONFIG['enabled'] or scope['method'] == 'OPTIONS':
+            await self.app(scope, receive, send)
+            return
+        matched = route_group(scope['path'])
+        if matched is None:
+            await self.app(scope, receive, send)
+            return
+
+        name, group = matched
+        result = get_buckets().take(f"{name}\0{client_key(scope)}", group['rate'], group['burst'])
+        headers = result.headers()
+        if not result.allowed:
+            response = JSONResponse(
+                {"detail": f"请求过于频繁，请 {headers['Retry-After']} 秒后重试"}, status_code=429, headers=headers
+            )
+            await response(scope, receive, send)
+            return
+
+        extra = [(header.lower().encode(), value.encode()) for header, value in headers.items()]
+
+        async def send_with_headers(message):
+            if message['type'] == 'http.response.start':
+                message = {**message, 'headers': [*message.get('headers', []), *extra]}
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
\ No newline at end of file
@@ -0,0 +1,752 @@
+#!/usr/bin/env python3
+"""
+回归检查脚本
+
+在临时 SQLite 库和临时目录中直接调用 ASGI 应用（不含网络和服务器），逐项检查曾经出现过的问题：
+    - idempotency-rate-limit: 限流返回的 429 不会保存为幂等键的响应，等待后用相同的键重试可以成功
+    - rate-limit-api-key: 每个请求换一个未登记的 API Key 不能绕过限流，登记的 Key 单独计数
+    - idempotency-lease: 请求被取消、保存响应失败时释放幂等键，进程崩溃留下的处理中记录在租约过期后可接管；
+      不同客户端使用相同的幂等键互不影响
+    - prediction-etag-compact: 预测记录 compact 模式下重复的预测（只新增事件）改变预测列表的 ETag，
+      重新从数据库加载表版本后也不会对旧 ETag 返回 304
+    - backfill-etag: 派生特征回填原地更新记录后，患者列表的旧 ETag 不再返回 304（包括其它进程
+      从数据库重新加载表版本的情况）
+    - fan-out-timeout: 管理端并发查询超时后在数据库端中断，返回时连接已归还连接池；
+      连接池已满时依次执行
+    - admin-pooled-connections: 管理端列表、导出接口和后台导出任务从连接池取连接，查询出错时也归还连接
+    - bp-window-anchor: 血压时间窗口以查询当天为终点，几周前的监测不计入 7 天最大值；
+      加载序列期间写入的样本不会因缓存了加载结果而丢失
+    - event-resume: 实时推送的事件ID带进程启动ID，来自其它 worker、重启前的进程或超出补发范围的
+      Last-Event-ID 不按序号补发（需要重新加载），而不是跳过或重复事件
+    - upload-file-limit: multipart 请求中单个文件超过上限时，在接收该文件的过程中返回 413
+    - upload-orphan-files: 家庭监测记录保存失败时删除本次新写入的文件，已有的相同内容保留
+    - upload-concurrent-discard: 两个请求上传相同内容，先上传的请求保存失败时，另一个请求的文件不被删除
+    - file-etag-encoding: 文件下载的压缩和未压缩表示 ETag 不同，且都带 Vary: Accept-Encoding
+    - jobs-fresh-store: 尚未提交过任务的 worker 查询或取消不存在的任务返回 404，而不是任务表不存在的 500
+    - distribution-percentile-bounds: 风险分布的百分位数不超出实际的最小值和最大值
+    - rescore-resume: 批量重新评分写回后、保存检查点前中断，续跑不产生重复记录；
+      评分写入的记录 source 为 rescore，管理端统计和风险分布默认不计入，source=rescore 时才返回
+
+用法:
+    python regression_checks.py [检查名 ...]
+
+说明:
+    - 不指定检查名时执行全部检查
+    - 任一检查未通过时退出码为 1
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+class CheckFailed(Exception):
+    """检查未通过"""
+
+def expect(condition: bool, message: str) -> None:
+    if not condition:
+        raise CheckFailed(message)
+
+def call(method: str, path: str, body: bytes = b'', headers: Optional[Dict[str, str]] = None,
+         query: str = '', chunk_size: int = 0, received: Optional[List[int]] = None,
+         app=None) -> Tuple[int, Dict[str, str], bytes]:
+    """
+    直接调用 ASGI 应用（默认为 main.app），返回 (状态码, 响应头, 响应体)。
+    chunk_size 大于 0 时请求体分块发送，received 中记录应用读取的请求体字节数
+    """
+    if app is None:
+        from main import app
+
+    raw_headers = [(b'host', b'check'), (b'content-length', str(len(body)).encode())]
+    raw_headers += [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'root_path': '',
+        'query_string': query.encode(), 'headers': raw_headers,
+        'client': ('127.0.0.1', 50000), 'server': ('check', 80)
+    }
+    messages = []
+    size = chunk_size or len(body)
+    offset = 0
+    sent = False
+
+    async def run():
+        finished = asyncio.Event()
+
+        async def receive():
+            nonlocal offset, sent
+            if sent:
+                # 请求体已发送完：响应结束后才断开（流式响应会等待断开消息）
+                await finished.wait()
+                return {'type': 'http.disconnect'}
+            chunk = body[offset:offset + size]
+            offset += len(chunk)
+            sent = offset >= len(body)
+            if received is not None:
+                received.append(offset)
+            return {'type': 'http.request', 'body': chunk, 'more_body': not sent}
+
+        async def send(message):
+            messages.append(message)
+            if message['type'] == 'http.response.body' and not message.get('more_body', False):
+                finished.set()
+
+        await app(scope, receive, send)
+
+    asyncio.run(run())
+    response_headers = {name.decode(): value.decode() for name, value in messages[0].get('headers', [])}
+    return messages[0]['status'], response_headers, b''.join(m.get('body', b'') for m in messages[1:])
+
+def post_json(path: str, payload: dict, headers: Optional[Dict[str, str]] = None) -> Tuple[int, Dict[str, str], bytes]:
+    return call('POST', path, json.dumps(payload).encode(), {'content-type': 'application/json', **(headers or {})})
+
+def check_idempotency_rate_limit() -> None:
+    """限流的 429 在幂等中间件之外返回，且 429 不保存为幂等键的响应"""
+    from benchmarks import PREDICT_PAYLOADS
+    from config import RATE_LIMIT_CONFIG
+    import rate_limit
+
+    group = RATE_LIMIT_CONFIG['groups']['predict']
+    saved = dict(group)
+    group.update(rate=5.0, burst=2)
+    RATE_LIMIT_CONFIG['enabled'] = True
+    rate_limit._buckets = None
+    try:
+        payload = PREDICT_PAYLOADS['/predict/maternal-cox']
+        for _ in range(2):
+            status, _, _ = post_json('/predict/maternal-cox', payload)
+            expect(status == 200, f"突发上限内的请求返回 {status}")
+        status, _, body = post_json('/predict/maternal-cox', payload, {'Idempotency-Key': 'check-rate-limit'})
+        expect(status == 429, f"超出突发上限的请求返回 {status}，应为 429")
+
+        time.sleep(1.0 / group['rate'] + 0.05)
+        status, headers, body = post_json('/predict/maternal-cox', payload, {'Idempotency-Key': 'check-rate-limit'})
+        expect(status == 200, f"令牌恢复后用相同的幂等键重试返回 {status}: {body[:200].decode(errors='replace')}")
+        expect('idempotent-replayed' not in headers, "令牌恢复后的重试返回了保存的响应")
+    finally:
+        group.clear()
+        group.update(saved)
+        RATE_LIMIT_CONFIG['enabled'] = False
+        rate_limit._buckets = None
+
+def check_rate_limit_api_key() -> None:
+    """限流按客户端 IP 计数，只有 RATE_LIMIT_API_KEYS 中登记的 Key 有自己的令牌桶"""
+    import uuid
+    from benchmarks import PREDICT_PAYLOADS
+    from config import RATE_LIMIT_CONFIG
+    import rate_limit
+
+    group = RATE_LIMIT_CONFIG['groups']['predict']
+    saved, api_keys = dict(group), RATE_LIMIT_CONFIG['api_keys']
+    group.update(rate=0.5, burst=2)
+    RATE_LIMIT_CONFIG.update(enabled=True, api_keys=frozenset({'registered-key'}))
+    rate_limit._buckets = None
+    try:
+        payload = PREDICT_PAYLOADS['/predict/maternal-cox']
+        statuses = [post_json('/predict/maternal-cox', payload, {'X-API-Key': uuid.uuid4().hex})[0] for _ in range(3)]
+        expect(statuses == [200, 200, 429], f"每次更换未登记的 API Key: {statuses}")
+        status, _, _ = post_json('/predict/maternal-cox', payload, {'X-API-Key': 'registered-key'})
+        expect(status == 200, f"登记的 API Key 返回 {status}，应有单独的令牌桶")
+    finally:
+        group.clear()
+        group.update(saved)
+        RATE_LIMIT_CONFIG.update(enabled=False, api_keys=api_keys)
+        rate_limit._buckets = None
+
+def check_idempotency_lease() -> None:
+    """处理中的幂等键在各种失败路径上都会释放或过期，重试不会一直返回 409"""
+    from datetime import datetime, timedelta
+    from benchmarks import PREDICT_PAYLOADS
+    from config import IDEMPOTENCY_CONFIG
+    from database import connect
+    import idempotency
+
+    payload = json.dumps(PREDICT_PAYLOADS['/predict/maternal-cox']).encode()
+    headers = {'content-type': 'application/json'}
+
+    def stored(key: str) -> Optional[tuple]:
+        scope = {'headers': [], 'client': ('127.0.0.1', 50000)}
+        connection = connect()
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT status_code, lease_id FROM idempotency_keys WHERE idempotency_key = %s",
+                           (idempotency.scoped_key(scope, key),))
+            row = cursor.fetchone()
+            cursor.close()
+            return row
+        finally:
+            connection.close()
+
+    # 应用处理中任务被取消（客户端断开）：CancelledError 不是 Exception
+    async def cancelled_app(scope, receive, send):
+        raise asyncio.CancelledError()
+
+    try:
+        call('POST', '/predict/maternal-cox', payload, {**headers, 'Idempotency-Key': 'check-cancelled'},
+             app=idempotency.IdempotencyMiddleware(cancelled_app))
+        raise CheckFailed("模拟的取消没有传出")
+    except asyncio.CancelledError:
+        pass
+    expect(stored('check-cancelled') is None, f"请求取消后幂等键未释放: {stored('check-cancelled')}")
+
+    # 保存响应失败：响应已发送，幂等键释放，重试重新处理
+    complete = idempotency.complete
+    idempotency.complete = lambda *args: 1 / 0
+    try:
+        status, _, _ = call('POST', '/predict/maternal-cox', payload, {**headers, 'Idempotency-Key': 'check-complete'})
+    finally:
+        idempotency.complete = complete
+    expect(status == 200, f"保存响应失败的请求返回 {status}")
+    expect(stored('check-complete') is None, f"保存响应失败后幂等键未释放: {stored('check-complete')}")
+
+    # 进程崩溃留下的处理中记录：租约内返回 409，过期后由重试接管
+    key = idempotency.scoped_key({'headers': [], 'client': ('127.0.0.1', 50000)}, 'check-crashed')
+    request_hash = idempotency._RequestHasher({'method': 'POST', 'path': '/predict/maternal-cox', 'headers': []})
+    request_hash.update(payload)
+    digest = request_hash.hexdigest()
+    for age, expected in ((0, 409), (IDEMPOTENCY_CONFIG['lease_seconds'] + 1, 200)):
+        connection = connect()
+        try:
+            cursor = connection.cursor()
+            cursor.execute("DELETE FROM idempotency_keys WHERE idempotency_key = %s", (key,))
+            cursor.execute("""
+            INSERT INTO idempotency_keys (idempotency_key, request_hash, lease_id, locked_at, expires_at)
+            VALUES (%s, %s, 'crashed', %s, %s)
+            """, (key, digest,
+                  datetime.now() - timedelta(seconds=age), datetime.now() + timedelta(hours=1)))
+            connection.commit()
+            cursor.close()
+        finally:
+            connection.close()
+        status, _, body = call('POST', '/predict/maternal-cox', payload, {**headers, 'Idempotency-Key': 'check-crashed'})
+        expect(status == expected, f"占用 {age} 秒的处理中记录，重试返回 {status}（应为 {expected}）: {body[:200]}")
+
+    # 不同客户端使用相同的键
+    other = json.dumps({**PREDICT_PAYLOADS['/predict/maternal-cox'], 'cox1_time': 14}).encode()
+    for api_key, body in (('client-a', payload), ('client-b', other)):
+        status, _, _ = call('POST', '/predict/maternal-cox', body,
+                            {**headers, 'Idempotency-Key': 'check-shared-uuid', 'X-API-Key': api_key})
+        expect(status == 200, f"客户端 {api_key} 使用相同的幂等键返回 {status}")
+
+def check_prediction_etag_compact() -> None:
+    """compact 模式下重复的预测只新增 prediction_events，预测列表的 ETag 仍然改变"""
+    from benchmarks import PREDICT_PAYLOADS
+    from config import AUDIT_CONFIG
+    import table_versions
+
+    mode = AUDIT_CONFIG['mode']
+    AUDIT_CONFIG['mode'] = 'compact'
+    try:
+        payload = PREDICT_PAYLOADS['/predict/neonatal-cox']
+        status, _, _ = post_json('/predict/neonatal-cox', payload)
+        expect(status == 200, f"预测请求返回 {status}")
+        status, headers, _ = call('GET', '/admin/predictions', query='model_type=neonatal_cox')
+        expect(status == 200 and 'etag' in headers, f"预测列表返回 {status}，ETag: {headers.get('etag')}")
+        etag = headers['etag']
+
+        status, _, _ = post_json('/predict/neonatal-cox', payload)
+        expect(status == 200, f"重复的预测请求返回 {status}")
+        for reload in (False, True):
+            if reload:
+                # 相当于超过 CACHE_VALIDATOR_TTL 后从数据库重新加载
+                table_versions._load_versions(['model_neonatal_cox_params'])
+            status, headers, body = call('GET', '/admin/predictions', query='model_type=neonatal_cox',
+                                         headers={'If-None-Match': etag})
+            stage = "重新加载表版本后" if reload else "写入后"
+            expect(status == 200, f"{stage}旧 ETag 返回 {status}，预测列表已新增一次预测")
+            expect(len(json.loads(body)) == 2, f"{stage}预测列表应有 2 条记录")
+    finally:
+        AUDIT_CONFIG['mode'] = mode
+
+def check_backfill_etag() -> None:
+    """回填只执行 UPDATE（行数和 created_at 不变），完成后递增数据版本使 ETag 失效"""
+    from database import connect
+    import derived_features
+    import table_versions
+
+    status, _, _ = post_json('/api/patient/general-info', {'age': 30, 'height': 160, 'pre_pregnancy_weight': 64})
+    expect(status == 200, f"录入基本信息返回 {status}")
+    status, headers, _ = call('GET', '/admin/patients/general-info')
+    expect(status == 200 and 'etag' in headers, f"患者列表返回 {status}，ETag: {headers.get('etag')}")
+    etag = headers['etag']
+
+    # 模拟执行迁移后尚未回填的记录
+    connection = connect()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("UPDATE patient_general_info SET derived_bmi = NULL")
+        connection.commit()
+        derived_features.backfill(batch_size=100)
+        cursor.execute("SELECT derived_bmi FROM patient_general_info")
+        expect([row[0] for row in cursor.fetchall()] == [25.0], "回填后的派生 BMI 不正确")
+        cursor.close()
+    finally:
+        connection.close()
+
+    for reload in (False, True):
+        if reload:
+            # 相当于回填在独立进程中执行，服务进程超过 CACHE_VALIDATOR_TTL 后从数据库重新加载
+            table_versions._load_versions(['patient_general_info'])
+        status, _, _ = call('GET', '/admin/patients/general-info', headers={'If-None-Match': etag})
+        stage = "重新加载表版本后" if reload else "回填后"
+        expect(status == 200, f"{stage}旧 ETag 返回 {status}，记录已被回填更新")
+
+def check_fan_out_timeout() -> None:
+    """超时的查询被中断并归还连接，而不是在后台线程中继续占用连接"""
+    from config import FANOUT_CONFIG
+    import database
+    import fan_out
+
+    # 执行数十秒的查询
+    slow_sql = ("WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 1000000000) "
+                "SELECT COUNT(*) as count FROM c")
+    queries = {'fast': ("SELECT 1 as one", (), False), 'slow': (slow_sql, (), False)}
+    timeout = FANOUT_CONFIG['timeout']
+    FANOUT_CONFIG['timeout'] = 0.3
+    try:
+        available = database.pool.available()
+        started = time.perf_counter()
+        results, missing = asyncio.run(fan_out.fan_out(queries))
+        elapsed = time.perf_counter() - started
+        expect(missing == ['slow'] and results['fast'] == {'one': 1}, f"结果 {results}，缺失 {missing}")
+        expect(elapsed < 0.3 + fan_out.INTERRUPT_GRACE, f"超时后 {elapsed:.1f} 秒才返回")
+        expect(database.pool.available() == available,
+               f"返回后空闲连接数为 {database.pool.available()}，超时的查询仍占用连接（之前 {available}）")
+    finally:
+        FANOUT_CONFIG['timeout'] = timeout
+
+    connections = [database.pool.acquire() for _ in range(database.pool.available())]
+    try:
+        expect(fan_out.parallelism(len(queries)) == 1, "连接池已满时应依次执行")
+    finally:
+        for connection in connections:
+            database.pool.release(connection)
+    expect(fan_out.parallelism(len(queries)) == min(len(queries), FANOUT_CONFIG['max_parallel']),
+           "连接池有空闲连接时应并发执行")
+
+def check_admin_pooled_connections() -> None:
+    """管理端接口不再每个请求单独建立连接，超出按 worker 分配的连接数"""
+    import admin_api
+    import database
+    import jobs
+
+    opened = []
+    connect = database.connect
+    database.connect = lambda: opened.append(1) or connect()
+    try:
+        in_use = database.pool.stats()['in_use']
+        for path, query in [('/admin/patients/general-info', ''), ('/admin/patients/lab-imaging', ''),
+                            ('/admin/patients/home-monitoring', ''), ('/admin/predictions', ''),
+                            ('/admin/predictions', 'model_type=unknown'), ('/admin/export/patients', ''),
+                            ('/admin/predictions/distribution', '')]:
+            status, _, body = call('GET', path, query=query)
+            expect(status in (200, 400, 500), f"{path}?{query} 返回 {status}: {body[:200].decode(errors='replace')}")
+            expect(database.pool.stats()['in_use'] == in_use, f"{path}?{query} 返回后连接未归还连接池")
+        result_path = os.path.join(os.path.dirname(os.environ['DB_SQLITE_PATH']), 'export.csv')
+        admin_api._run_export_job(jobs.JobContext('check', result_path), {'format': 'csv'})
+        expect(database.pool.stats()['in_use'] == in_use, "导出任务结束后连接未归还连接池")
+        expect(not opened, f"管理端建立了 {len(opened)} 个不经过连接池的连接")
+    finally:
+        database.connect = connect
+
+def check_bp_window_anchor() -> None:
+    """窗口曾以患者最后一次监测为终点；序列在锁外加载时，同时写入的样本被丢弃且旧序列留在缓存中"""
+    from datetime import date, timedelta
+    import bp_timeseries
+
+    today = date.today()
+    store = bp_timeseries.BPTimeSeriesStore([7, 28], 10)
+    loads = []
+
+    def load(patient_id):
+        series = bp_timeseries.PatientSeries(store.windows)
+        series.append(today - timedelta(days=22), 150, 95)
+        series.append(today - timedelta(days=21), 160, 100)
+        if not loads:
+            # 加载期间另一个请求写入了新样本（数据库查询已执行，结果中没有该样本）
+            store.record(patient_id, today, 120, 80)
+        loads.append(patient_id)
+        return series
+
+    store._load = load
+    expect(store.sbp_max(1, 7) is None, f"三周前的监测计入了 7 天最大值: {store.sbp_max(1, 7)}")
+    expect(store.sbp_max(1, 28) == 160, f"28 天最大值为 {store.sbp_max(1, 28)}")
+    expect(len(loads) >= 2, "加载期间有写入时仍缓存了不含该写入的序列")
+    loaded = len(loads)
+    store.record(1, today, 120, 80)
+    expect(store.sbp_max(1, 7) == 120 and len(loads) == loaded, "缓存的序列未包含后续写入")
+
+def check_event_resume() -> None:
+    """事件ID曾是进程内计数器，重连到其它 worker 或重启后按无关的序号补发"""
+    from config import EVENT_CONFIG
+    import event_bus
+
+    first = event_bus.current_id()
+    for index in range(3):
+        event_bus.publish('general_info', {'id': index})
+    replay = event_bus.recent_events(first)
+    expect(replay is not None and [event['data']['id'] for event in replay] == [0, 1, 2],
+           f"同一进程内重连补发的事件: {replay}")
+    latest = event_bus.current_id()
+    expect(latest.startswith(event_bus.BOOT_ID + '-'), f"事件ID {latest} 不含进程启动ID")
+    expect(event_bus.recent_events(latest) == [], "没有错过事件时不应补发")
+    seq = latest.rpartition('-')[2]
+    for foreign in (f"0123456789ab-{seq}", seq, f"{event_bus.BOOT_ID}-{int(seq) + 5}"):
+        expect(event_bus.recent_events(foreign) is None, f"Last-Event-ID {foreign} 应要求重新加载")
+
+    for index in range(EVENT_CONFIG['replay_size'] + 1):
+        event_bus.publish('general_info', {'id': index})
+    expect(event_bus.recent_events(latest) is None, "错过的事件超出补发缓冲区时应要求重新加载")
+
+BOUNDARY = 'checkboundary'
+
+def multipart(fields: Dict[str, str], files: Dict[str, bytes], content_type: str = 'application/octet-stream') -> bytes:
+    parts = [f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+             for name, value in fields.items()]
+    for name, content in files.items():
+        parts.append(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"; filename="{name}.bin"\r\n'
+                     f'Content-Type: {content_type}\r\n\r\n'.encode() + content + b'\r\n')
+    return b''.join(parts) + f'--{BOUNDARY}--\r\n'.encode()
+
+def post_home_monitoring(files: Dict[str, bytes], content_type: str = 'application/octet-stream',
+                         **kwargs) -> Tuple[int, Dict[str, str], bytes]:
+    body = multipart({'patient_id': '1', 'home_systolic': '120', 'home_diastolic': '80'}, files, content_type)
+    headers = {'content-type': f'multipart/form-data; boundary={BOUNDARY}'}
+    return call('POST', '/api/patient/home-monitoring', body, headers, **kwargs)
+
+def check_upload_file_limit() -> None:
+    """单文件上限在接收请求体时检查，超限的文件不会先完整缓存再拒绝"""
+    from config import UPLOAD_CONFIG
+
+    limit = UPLOAD_CONFIG['max_file_bytes']
+    UPLOAD_CONFIG['max_file_bytes'] = 64 * 1024
+    try:
+        content = os.urandom(4 * 1024 * 1024)
+        received: List[int] = []
+        status, _, body = post_home_monitoring({'fetal_monitoring_file': content}, chunk_size=16 * 1024,
+                                               received=received)
+        expect(status == 413, f"超过单文件上限的上传返回 {status}: {body[:200].decode(errors='replace')}")
+        expect(received[-1] < 256 * 1024, f"返回 413 前已接收 {received[-1]} 字节（文件 {len(content)} 字节）")
+
+        status, _, body = post_home_monitoring({'fetal_monitoring_file': os.urandom(32 * 1024)}, chunk_size=16 * 1024)
+        expect(status == 200, f"上限以内的上传返回 {status}: {body[:200].decode(errors='replace')}")
+    finally:
+        UPLOAD_CONFIG['max_file_bytes'] = limit
+
+def check_upload_orphan_files() -> None:
+    """保存记录失败时新写入的文件被删除，与已有内容合并的文件保留"""
+    from fastapi import HTTPException
+    from database import connect
+    from file_store import stored_path
+    import hashlib
+    import main
+
+    existing = os.urandom(8 * 1024)
+    status, _, _ = post_home_monitoring({'fetal_monitoring_file': existing})
+    expect(status == 200, f"上传文件返回 {status}")
+
+    def failing_save(request, stored_files=None):
+        raise HTTPException(status_code=500, detail="模拟保存失败")
+
+    fresh = os.urandom(8 * 1024)
+    save = main.save_patient_home_monitoring
+    main.save_patient_home_monitoring = failing_save
+    try:
+        status, _, _ = post_home_monitoring({'fetal_monitoring_file': existing, 'urine_test_file': fresh})
+    finally:
+        main.save_patient_home_monitoring = save
+    expect(status == 500, f"保存失败的请求返回 {status}")
+
+    connection = connect()
+    try:
+        cursor = connection.cursor()
+        for content, kept in ((existing, True), (fresh, False)):
+            sha256 = hashlib.sha256(content).hexdigest()
+            cursor.execute("SELECT COUNT(*) FROM stored_files WHERE sha256 = %s", (sha256,))
+            registered = cursor.fetchone()[0] == 1
+            stage = "已有记录引用的文件" if kept else "新写入的文件"
+            expect(os.path.exists(stored_path(sha256)) == kept, f"{stage}{'被删除' if kept else '未删除'}")
+            expect(registered == kept, f"{stage}的 stored_files 记录{'被删除' if kept else '未删除'}")
+        cursor.close()
+    finally:
+        connection.close()
+
+def check_upload_concurrent_discard() -> None:
+    """A 新写入文件，B 上传相同内容（合并），A 保存失败删除文件时 B 尚未保存记录：文件必须保留"""
+    import hashlib
+    import io
+    from fastapi import UploadFile
+    from database import connect
+    from file_store import discard_uploads, release_uploads, store_upload, stored_path
+    from models import PatientHomeMonitoringRequest
+    from patient_service import save_patient_home_monitoring
+
+    def upload(content: bytes):
+        return asyncio.run(store_upload(UploadFile(io.BytesIO(content), filename='ctg.bin'), 'fetal_monitoring_file'))
+
+    def state(sha256: str) -> Tuple[bool, Optional[int]]:
+        connection = connect()
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT pending FROM stored_files WHERE sha256 = %s", (sha256,))
+            row = cursor.fetchone()
+            cursor.close()
+        finally:
+            connection.close()
+        return os.path.exists(stored_path(sha256)), row[0] if row else None
+
+    content = os.urandom(8 * 1024)
+    sha256 = hashlib.sha256(content).hexdigest()
+    first, second = upload(content), upload(content)
+    expect(first.created and not second.created, "两次上传相同内容应只登记一次")
+    asyncio.run(discard_uploads([first]))
+    expect(state(sha256) == (True, 1), f"另一个请求仍在使用时文件被删除: (文件存在, pending) = {state(sha256)}")
+
+    save_patient_home_monitoring(PatientHomeMonitoringRequest(home_systolic=120, home_diastolic=80),
+                                 {'fetal_monitoring_file': second})
+    asyncio.run(release_uploads([second]))
+    expect(state(sha256) == (True, 0), f"记录保存后: (文件存在, pending) = {state(sha256)}")
+
+    # 两个请求都失败时，最后一个释放的请求删除文件
+    content = os.urandom(8 * 1024)
+    sha256 = hashlib.sha256(content).hexdigest()
+    first, second = upload(content), upload(content)
+    asyncio.run(discard_uploads([first]))
+    asyncio.run(discard_uploads([second]))
+    expect(state(sha256) == (False, None), f"都保存失败后: (文件存在, pending) = {state(sha256)}")
+
+def check_file_etag_encoding() -> None:
+    """同一文件的不同编码表示使用不同的强 ETag（压缩保存的原样发送、响应压缩中间件压缩的都加后缀）"""
+    from config import UPLOAD_CONFIG
+    from file_store import preferred_codec
+
+    ctg = b''.join(f"{i * 0.25:.2f},{140 + i % 7},{10 + i % 5}\n".encode() for i in range(20000))
+    compression = UPLOAD_CONFIG['compression']
+    try:
+        for setting in ('auto', 'none'):
+            UPLOAD_CONFIG['compression'] = setting
+            content = ctg + setting.encode()
+            status, _, body = post_home_monitoring({'fetal_monitoring_file': content}, content_type='text/csv')
+            expect(status == 200, f"上传文件返回 {status}")
+            path = f"/admin/patients/home-monitoring/{json.loads(body)['id']}/files/fetal_monitoring_file"
+            # 压缩保存的文件原样发送保存时的压缩方式；未压缩保存的文件由响应压缩中间件 gzip 压缩
+            encoding = preferred_codec() if setting == 'auto' else 'gzip'
+            UPLOAD_CONFIG['compression'] = compression
+
+            etags = {}
+            for accept in (encoding, 'identity'):
+                status, headers, _ = call('GET', path, headers={'Accept-Encoding': accept})
+                expect(status == 200, f"下载文件返回 {status}")
+                expect(headers.get('content-encoding', 'identity') == accept,
+                       f"Accept-Encoding: {accept} 时 Content-Encoding 为 {headers.get('content-encoding')}")
+                expect('accept-encoding' in headers.get('vary', '').lower(), f"Accept-Encoding: {accept} 时缺少 Vary")
+                etags[accept] = headers.get('etag')
+            expect(etags[encoding] != etags['identity'],
+                   f"UPLOAD_COMPRESSION={setting} 时 {encoding} 与未压缩的表示 ETag 相同: {etags}")
+    finally:
+        UPLOAD_CONFIG['compression'] = compression
+
+def prediction_counts(source: str) -> Dict[str, int]:
+    """统计接口和风险分布接口中两个 COX 模型的预测数"""
+    status, _, body = call('GET', '/admin/statistics', query=f'source={source}')
+    expect(status == 200, f"统计接口返回 {status}")
+    statistics = json.loads(body)['prediction_distribution']
+    counts = {}
+    for model_type in ('maternal_cox', 'neonatal_cox'):
+        counts[f'statistics.{model_type}'] = statistics[model_type]
+        status, _, body = call('GET', '/admin/predictions/distribution', query=f'model_type={model_type}&source={source}')
+        expect(status == 200, f"风险分布接口返回 {status}")
+        counts[f'distribution.{model_type}'] = json.loads(body)[0]['total']
+    return counts
+
+def check_rescore_resume() -> None:
+    """中断点在写回之后、检查点之前：续跑重新处理该分块，按 (rescore_run, patient_id) 跳过已写入的患者"""
+    from datetime import date, timedelta
+    from config import AUDIT_CONFIG
+    from database import connect
+    import rescore
+
+    today = date.today()
+    checkpoint_path = os.path.join(os.path.dirname(os.environ['DB_SQLITE_PATH']), 'rescore_checkpoint.json')
+    mode = AUDIT_CONFIG['mode']
+    save_checkpoint = rescore.save_checkpoint
+    try:
+        for AUDIT_CONFIG['mode'] in ('full', 'compact'):
+            connection = connect()
+            try:
+                cursor = connection.cursor()
+                patient_ids = []
+                for _ in range(3):
+                    cursor.execute("INSERT INTO patient_general_info (age, last_menstrual_period) VALUES (%s, %s)",
+                                   (30, today - timedelta(days=200)))
+                    patient_ids.append(cursor.lastrowid)
+                    cursor.execute("""
+                    INSERT INTO patient_lab_imaging (patient_id, examination_date, platelet_count, creatinine, alt,
+                                                     urine_protein_24h)
+                    VALUES (%s, %s, 180, 60, 25, 0.5)
+                    """, (patient_ids[-1], today))
+                    cursor.execute("""
+                    INSERT INTO patient_home_monitoring (patient_id, home_monitoring_date, home_systolic, home_diastolic)
+                    VALUES (%s, %s, 150, 95)
+                    """, (patient_ids[-1], today))
+                connection.commit()
+                cursor.close()
+            finally:
+                connection.close()
+
+            for patient_id in patient_ids:
+                for path, payload in (('maternal-cox', {'pdas': False, 'cox1_time': 7}),
+                                      ('neonatal-cox', {'gda_group': 1, 'cox2_time': 7, 'nst': False})):
+                    status, _, body = post_json(f'/predict/{path}/patient/{patient_id}', payload)
+                    expect(status == 200, f"{path} 预测返回 {status}: {body[:200].decode(errors='replace')}")
+            before = prediction_counts('clinician')
+
+            # 第一个分块的检查点正常保存，第二个分块写回后、保存检查点前中断
+            saved = []
+
+            def crash_on_second(path: str, checkpoint: dict) -> None:
+                if saved:
+                    raise RuntimeError("模拟中断")
+                saved.append(checkpoint['last_patient_id'])
+                save_checkpoint(path, checkpoint)
+
+            rescore.save_checkpoint = crash_on_second
+            try:
+                rescore.run(2, 1, False, checkpoint_path)
+                raise CheckFailed("模拟的中断没有发生")
+            except RuntimeError:
+                pass
+            finally:
+                rescore.save_checkpoint = save_checkpoint
+            summary = rescore.run(2, 1, True, checkpoint_path)
+
+            connection = connect()
+            try:
+                cursor = connection.cursor()
+                for table in ('model_maternal_cox_params', 'model_neonatal_cox_params'):
+                    cursor.execute(f"""
+                    SELECT patient_id, source, rescore_run, COUNT(*) FROM {table}
+                    WHERE patient_id IN (%s, %s, %s)
+                    GROUP BY patient_id, source, rescore_run
+                    """, patient_ids)
+                    counts = {(row[0], row[1], row[2]): row[3] for row in cursor.fetchall()}
+                    expected = {(patient_id, source, run): 1 for patient_id in patient_ids
+                                for source, run in (('clinician', None), ('rescore', summary.get('run_id')))}
+                    expect(counts == expected,
+                           f"{AUDIT_CONFIG['mode']} 模式下 {table} 的记录（患者, 来源, 批次）-> 行数: {counts}")
+                cursor.close()
+            finally:
+                connection.close()
+
+            status, _, body = call('GET', '/admin/predictions',
+                                   query='model_type=maternal_cox&fields=source&page_size=100&source=all')
+            sources = {row['data'].get('source') for row in json.loads(body)} if status == 200 else set()
+            expect({'clinician', 'rescore'} <= sources, f"预测列表返回 {status}，来源: {sources}")
+
+            # 统计和风险分布默认只包含人工预测
+            after = prediction_counts('clinician')
+            expect(after == before, f"{AUDIT_CONFIG['mode']} 模式下批量评分后人工预测的统计 {before} 变为 {after}")
+            rescored = prediction_counts('rescore')
+            expect(all(count > 0 for count in rescored.values()), f"source=rescore 的统计: {rescored}")
+    finally:
+        AUDIT_CONFIG['mode'] = mode
+        rescore.save_checkpoint = save_checkpoint
+
+def check_jobs_fresh_store() -> None:
+    """任务表只在首次提交任务时创建，查询和取消接口也要先创建"""
+    from config import JOB_CONFIG
+    import jobs
+
+    db_path, executor = JOB_CONFIG['db_path'], jobs._executor
+    JOB_CONFIG['db_path'] = os.path.join(os.path.dirname(db_path), 'fresh_jobs.sqlite3')
+    jobs._executor = None
+    try:
+        for method in ('GET', 'DELETE'):
+            status, _, body = call(method, '/admin/jobs/abc')
+            expect(status == 404, f"{method} 不存在的任务返回 {status}: {body[:200].decode(errors='replace')}")
+    finally:
+        if jobs._executor is not None:
+            jobs._executor.shutdown(wait=False)
+        JOB_CONFIG['db_path'], jobs._executor = db_path, executor
+
+def check_distribution_percentile_bounds() -> None:
+    """百分位数按细分桶内均匀分布插值，取值集中在桶内一点时曾低于最小值"""
+    from database import connect
+
+    connection = connect()
+    try:
+        cursor = connection.cursor()
+        cursor.executemany("INSERT INTO model_fgr_params (prediction_result) VALUES (%s)", [(99.7977,), (99.7977,)])
+        connection.commit()
+        cursor.close()
+    finally:
+        connection.close()
+
+    status, _, body = call('GET', '/admin/predictions/distribution', query='model_type=fgr')
+    expect(status == 200, f"风险分布返回 {status}: {body[:200].decode(errors='replace')}")
+    distribution = json.loads(body)[0]
+    outside = {name: value for name, value in distribution['percentiles'].items()
+               if not distribution['min'] <= value <= distribution['max']}
+    expect(not outside, f"百分位数超出 [{distribution['min']}, {distribution['max']}]: {outside}")
+
+CHECKS: Dict[str, Callable[[], None]] = {
+    'idempotency-rate-limit': check_idempotency_rate_limit,
+    'rate-limit-api-key': check_rate_limit_api_key,
+    'idempotency-lease': check_idempotency_lease,
+    'prediction-etag-compact': check_prediction_etag_compact,
+    'backfill-etag': check_backfill_etag,
+    'fan-out-timeout': check_fan_out_timeout,
+    'admin-pooled-connections': check_admin_pooled_connections,
+    'bp-window-anchor': check_bp_window_anchor,
+    'event-resume': check_event_resume,
+    'upload-file-limit': check_upload_file_limit,
+    'upload-orphan-files': check_upload_orphan_files,
+    'upload-concurrent-discard': check_upload_concurrent_discard,
+    'file-etag-encoding': check_file_etag_encoding,
+    'jobs-fresh-store': check_jobs_fresh_store,
+    'distribution-percentile-bounds': check_distribution_percentile_bounds,
+    'rescore-resume': check_rescore_resume
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="回归检查")
+    parser.add_argument("checks", nargs="*", help=f"检查名（{', '.join(CHECKS)}），默认全部")
+    args = parser.parse_args()
+    unknown = [name for name in args.checks if name not in CHECKS]
+    if unknown:
+        parser.error(f"未知的检查: {', '.join(unknown)}")
+
+    workdir = tempfile.mkdtemp(prefix='regression_')
+    os.environ['DB_BACKEND'] = 'sqlite'
+    os.environ['DB_SQLITE_PATH'] = os.path.join(workdir, 'check.sqlite3')
+    os.environ['UPLOAD_DIR'] = os.path.join(workdir, 'uploads')
+    os.environ['JOB_DB_PATH'] = os.path.join(workdir, 'jobs.sqlite3')
+    os.environ['JOB_RESULT_DIR'] = os.path.join(workdir, 'job_results')
+    os.environ['DB_SLOW_QUERY_LOG'] = os.path.join(workdir, 'slow_queries.jsonl')
+    # 检查之间互不占用限流配额，需要限流的检查自行开启
+    os.environ['RATE_LIMIT'] = 'false'
+
+    failed: List[str] = []
+    try:
+        for name in args.checks or CHECKS:
+            try:
+                CHECKS[name]()
+                print(f"✅ {name}")
+            except CheckFailed as e:
+                failed.append(name)
+                print(f"❌ {name}: {e}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if failed:
+        print(f"❌ {len(failed)} 项检查未通过: {', '.join(failed)}")
+        sys.exit(1)
+    print("✅ 全部回归检查通过")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
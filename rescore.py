@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+人群批量重新评分脚本
+
+按患者ID分块流式读取在孕患者，批量汇总特征，用 NumPy 向量化计算 COX 模型风险，
+多进程并行评分后批量写回 model_*_params 表。支持断点续跑。
+
+用法:
+    python rescore.py [--chunk-size 5000] [--workers 4] [--resume]
+
+说明:
+    - Maternal-COX: 检验值取最近一次实验室检查，sbpmax 取家庭血压时间序列窗口最大值，
+      pdas / cox1_time 沿用该患者最近一次人工预测的取值
+    - Neonatal-COX: 入院日期按当天计算孕天数，入院血压取最近一次家庭血压，cr2 取最近一次肌酐，
+      gda_group / cox2_time / nst 沿用该患者最近一次人工预测的取值
+    - FGR 与 FGR-Neonatal 模型的输入（早产、NST、脐血流等）未保存在患者数据中，不参与重新评分
+    - 写入的记录 source 为 rescore，rescore_run 为本次评分的批次号（保存在检查点中）；
+      (rescore_run, patient_id) 唯一，写回后、保存检查点前中断时，续跑重新写入的分块被跳过，不会重复
+"""
+
+import argparse
+import json
+import os
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from config import (
+    RESCORE_CONFIG, TIMESERIES_CONFIG,
+    cox1_model_coefficients, cox2_model_coefficients,
+    H0_vec_cox1, H0_vec_cox2
+)
+from database import connect, dict_cursor, get_backend
+from prediction_audit import SOURCE_RESCORE, prediction_source
+
+# 在孕判断：末次月经距今不超过该天数
+ACTIVE_PREGNANCY_DAYS = 44 * 7
+
+def _placeholders(count: int) -> str:
+    return ", ".join(["%s"] * count)
+
+def fetch_patient_chunk(cursor, after_id: int, chunk_size: int, lmp_since: date) -> List[dict]:
+    """按主键分页读取下一批在孕患者（可从任意ID续跑）"""
+    cursor.execute("""
+    SELECT id, last_menstrual_period
+    FROM patient_general_info
+    WHERE id > %s AND last_menstrual_period >= %s
+    ORDER BY id
+    LIMIT %s
+    """, (after_id, lmp_since, chunk_size))
+    return cursor.fetchall()
+
+def _latest_by_patient(cursor, sql: str, patient_ids: List[int]) -> Dict[int, dict]:
+    """执行按 patient_id, 时间 升序排列的查询，保留每个患者的最后一行"""
+    cursor.execute(sql.format(ids=_placeholders(len(patient_ids))), patient_ids)
+    latest = {}
+    for row in cursor.fetchall():
+        latest[row['patient_id']] = row
+    return latest
+
+def assemble_chunk(cursor, patients: List[dict], today: date) -> Dict[str, Dict[str, np.ndarray]]:
+    """为一批患者汇总两个COX模型的输入特征（每类数据一条批量查询）"""
+    patient_ids = [p['id'] for p in patients]
+
+    labs = _latest_by_patient(cursor, """
+    SELECT patient_id, platelet_count, creatinine, alt, urine_protein_24h
+    FROM patient_lab_imaging
+    WHERE patient_id IN ({ids})
+    ORDER BY patient_id, examination_date, id
+    """, patient_ids)
+
+    maternal_flags = _latest_by_patient(cursor, f"""
+    SELECT patient_id, pdas, cox1_time
+    FROM {prediction_source('model_maternal_cox_params')}
+    WHERE patient_id IN ({{ids}})
+    ORDER BY patient_id, created_at, id
+    """, patient_ids)
+
+    neonatal_flags = _latest_by_patient(cursor, f"""
+    SELECT patient_id, gda_group, cox2_time, nst
+    FROM {prediction_source('model_neonatal_cox_params')}
+    WHERE patient_id IN ({{ids}})
+    ORDER BY patient_id, created_at, id
+    """, patient_ids)
+
+    # 家庭血压 sbpmax：与血压时间序列一致，取截至评分当天窗口内的最大收缩压
+    cursor.execute(f"""
+    SELECT patient_id, MAX(home_systolic) as sbpmax
+    FROM patient_home_monitoring
+    WHERE patient_id IN ({_placeholders(len(patient_ids))})
+      AND COALESCE(home_monitoring_date, DATE(created_at)) > %s
+    GROUP BY patient_id
+    """, patient_ids + [today - timedelta(days=TIMESERIES_CONFIG['cox_sbpmax_window'])])
+    sbpmax = {row['patient_id']: row['sbpmax'] for row in cursor.fetchall()}
+
+    # 最近一次完整的家庭血压
+    latest_bp = _latest_by_patient(cursor, """
+    SELECT h.patient_id, h.home_systolic, h.home_diastolic
+    FROM patient_home_monitoring h
+    JOIN (
+        SELECT patient_id, MAX(home_monitoring_date) as last_date
+        FROM patient_home_monitoring
+        WHERE patient_id IN ({ids}) AND home_systolic IS NOT NULL AND home_diastolic IS NOT NULL
+        GROUP BY patient_id
+    ) t ON t.patient_id = h.patient_id AND h.home_monitoring_date = t.last_date
+    WHERE h.home_systolic IS NOT NULL AND h.home_diastolic IS NOT NULL
+    ORDER BY h.patient_id, h.id
+    """, patient_ids)
+
+    maternal = {key: [] for key in ('patient_id', 'plt', 'cr', 'up24', 'alt', 'sbpmax', 'pdas', 'time')}
+    neonatal = {key: [] for key in ('patient_id', 'lmp_days', 'gda_group', 'time', 'nst', 'sbp', 'dbp', 'cr2')}
+
+    for patient in patients:
+        patient_id = patient['id']
+        lab = labs.get(patient_id)
+
+        flags = maternal_flags.get(patient_id)
+        if lab and flags:
+            values = (lab['platelet_count'], lab['creatinine'], lab['urine_protein_24h'], lab['alt'],
+                      sbpmax.get(patient_id))
+            if all(v is not None for v in values):
+                maternal['patient_id'].append(patient_id)
+                for key, value in zip(('plt', 'cr', 'up24', 'alt', 'sbpmax'), values):
+                    maternal[key].append(float(value))
+                maternal['pdas'].append(int(flags['pdas']))
+                maternal['time'].append(int(flags['cox1_time']))
+
+        flags = neonatal_flags.get(patient_id)
+        if lab and flags and patient_id in latest_bp and lab['creatinine'] is not None:
+            sbp = float(latest_bp[patient_id]['home_systolic'])
+            dbp = float(latest_bp[patient_id]['home_diastolic'])
+            neonatal['patient_id'].append(patient_id)
+            neonatal['lmp_days'].append((today - patient['last_menstrual_period']).days)
+            neonatal['gda_group'].append(float(flags['gda_group']))
+            neonatal['time'].append(int(flags['cox2_time']))
+            neonatal['nst'].append(int(flags['nst']))
+            neonatal['sbp'].append(sbp)
+            neonatal['dbp'].append(dbp)
+            neonatal['cr2'].append(float(lab['creatinine']))
+
+    return {
+        'maternal_cox': {key: np.asarray(values) for key, values in maternal.items()},
+        'neonatal_cox': {key: np.asarray(values) for key, values in neonatal.items()}
+    }
+
+def _baseline_hazard(times: np.ndarray, table: Dict[str, float]) -> np.ndarray:
+    """按预测时间点查基线风险，不支持的时间点为 NaN"""
+    hazard = np.full(times.shape, np.nan)
+    for key, value in table.items():
+        hazard[times == int(key)] = value
+    return hazard
+
+def score_chunk(features: Dict[str, Dict[str, np.ndarray]]) -> Dict[str, Dict[str, np.ndarray]]:
+    """向量化计算两个COX模型（在进程池中执行，公式与 prediction_models 一致）"""
+    results = {}
+
+    m = features['maternal_cox']
+    lp = (cox1_model_coefficients['PLT'] * m['plt'] +
+          cox1_model_coefficients['Cr'] * m['cr'] +
+          cox1_model_coefficients['UP24'] * m['up24'] +
+          cox1_model_coefficients['ALT'] * m['alt'] +
+          cox1_model_coefficients['SBPMax'] * m['sbpmax'] +
+          cox1_model_coefficients['PDAs'] * m['pdas'])
+    h0 = _baseline_hazard(m['time'], H0_vec_cox1)
+    survival = np.exp(-h0 * np.exp(lp))
+    results['maternal_cox'] = {
+        'linear_predictor': lp,
+        'baseline_hazard': h0,
+        'survival_probability': survival,
+        'prediction': (1 - survival) * 100
+    }
+
+    n = features['neonatal_cox']
+    gestational_days = n['lmp_days'] + 14
+    map_value = n['dbp'] + (n['sbp'] - n['dbp']) / 3
+    gda_time = n['gda_group'] * np.log10(n['time'] + 20)
+    lp = (cox2_model_coefficients['GDA.time'] * gda_time +
+          cox2_model_coefficients['PDA'] * gestational_days +
+          cox2_model_coefficients['NST'] * n['nst'] +
+          cox2_model_coefficients['MAP'] * map_value +
+          cox2_model_coefficients['Cr'] * n['cr2'])
+    h0 = _baseline_hazard(n['time'], H0_vec_cox2)
+    survival = np.exp(-h0 * np.exp(lp))
+    results['neonatal_cox'] = {
+        'gestational_days': gestational_days,
+        'map_value': map_value,
+        'gda_time': gda_time,
+        'linear_predictor': lp,
+        'baseline_hazard': h0,
+        'survival_probability': survival,
+        'prediction': (1 - survival) * 100
+    }
+
+    return results
+
+def _values(row: tuple) -> tuple:
+    return tuple(v.item() if isinstance(v, np.generic) else v for v in row)
+
+def write_results(connection, features: dict, results: dict, today: date, run_id: str) -> Dict[str, int]:
+    """
+    批量写回预测结果表（跳过基线风险无效的行），返回实际写入的行数；
+    本批次已写入的患者（续跑时重新处理的分块）按唯一键跳过
+    """
+    cursor = connection.cursor()
+    written = {}
+
+    m, r = features['maternal_cox'], results['maternal_cox']
+    valid = ~np.isnan(r['baseline_hazard'])
+    rows = [
+        (int(m['patient_id'][i]), m['plt'][i], m['cr'][i], m['up24'][i], m['alt'][i], m['sbpmax'][i],
+         bool(m['pdas'][i]), int(m['time'][i]), r['prediction'][i], r['linear_predictor'][i],
+         r['baseline_hazard'][i], r['survival_probability'][i], SOURCE_RESCORE, run_id)
+        for i in np.flatnonzero(valid)
+    ]
+    written['maternal_cox'] = get_backend().insert_ignore(cursor, 'model_maternal_cox_params', (
+        'patient_id', 'plt', 'cr', 'up24', 'alt', 'sbpmax', 'pdas', 'cox1_time', 'prediction_result',
+        'linear_predictor', 'baseline_hazard', 'survival_probability', 'source', 'rescore_run'
+    ), [_values(row) for row in rows]) if rows else 0
+
+    n, r = features['neonatal_cox'], results['neonatal_cox']
+    valid = ~np.isnan(r['baseline_hazard'])
+    rows = [
+        (int(n['patient_id'][i]), today - timedelta(days=int(n['lmp_days'][i])), today, n['gda_group'][i],
+         int(n['time'][i]), bool(n['nst'][i]), n['sbp'][i], n['dbp'][i], n['cr2'][i], r['prediction'][i],
+         int(r['gestational_days'][i]), r['map_value'][i], r['gda_time'][i], r['linear_predictor'][i],
+         r['baseline_hazard'][i], r['survival_probability'][i], SOURCE_RESCORE, run_id)
+        for i in np.flatnonzero(valid)
+    ]
+    written['neonatal_cox'] = get_backend().insert_ignore(cursor, 'model_neonatal_cox_params', (
+        'patient_id', 'lmp_date', 'admission_date', 'gda_group', 'cox2_time', 'nst', 'sbp_admission',
+        'dbp_admission', 'cr2', 'prediction_result', 'gestational_days', 'map_value',
+        'gda_time', 'linear_predictor', 'baseline_hazard', 'survival_probability', 'source', 'rescore_run'
+    ), [_values(row) for row in rows]) if rows else 0
+
+    connection.commit()
+    cursor.close()
+    return written
+
+def load_checkpoint(path: str, today: date) -> Optional[dict]:
+    """读取同一天的检查点"""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('run_date') != today.isoformat():
+        print(f"⚠️ 检查点属于 {checkpoint.get('run_date')}，忽略并重新开始")
+        return None
+    return checkpoint
+
+def new_run_id(today: date) -> str:
+    """评分批次号：日期 + 随机后缀（同一天可多次评分）"""
+    return f"{today:%Y%m%d}-{uuid.uuid4().hex[:8]}"
+
+def save_checkpoint(path: str, checkpoint: dict) -> None:
+    """原子写入检查点"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+def run(
+    chunk_size: int,
+    workers: int,
+    resume: bool,
+    checkpoint_path: str,
+    progress: Optional[Callable[[int, int], None]] = None
+) -> dict:
+    """执行一次全量重新评分；progress(已处理, 总数) 在每个分块写回后调用，抛出异常可中止（检查点保留）"""
+    today = date.today()
+    lmp_since = today - timedelta(days=ACTIVE_PREGNANCY_DAYS)
+
+    checkpoint = load_checkpoint(checkpoint_path, today) if resume else None
+    if checkpoint is None:
+        checkpoint = {'run_date': today.isoformat(), 'run_id': new_run_id(today), 'last_patient_id': 0,
+                      'patients': 0, 'written': {'maternal_cox': 0, 'neonatal_cox': 0}}
+    else:
+        # 旧版本的检查点没有批次号，续跑部分使用新的批次号
+        checkpoint.setdefault('run_id', new_run_id(today))
+        print(f"↩️ 从患者ID {checkpoint['last_patient_id']} 之后继续（批次 {checkpoint['run_id']}）")
+
+    read_connection = connect()
+    write_connection = connect()
+    read_cursor = dict_cursor(read_connection)
+
+    read_cursor.execute("""
+    SELECT COUNT(*) as count FROM patient_general_info
+    WHERE id > %s AND last_menstrual_period >= %s
+    """, (checkpoint['last_patient_id'], lmp_since))
+    remaining = read_cursor.fetchone()['count']
+    print(f"🚀 待评分在孕患者: {remaining}，分块大小: {chunk_size}，进程数: {workers}")
+
+    started = time.perf_counter()
+    processed = 0
+    pending = deque()  # (最后一个患者ID, 患者数, 特征, Future)，按提交顺序写回以保证检查点连续
+
+    def drain_one():
+        nonlocal processed
+        last_id, count, features, future = pending.popleft()
+        written = write_results(write_connection, features, future.result(), today, checkpoint['run_id'])
+        processed += count
+        checkpoint['last_patient_id'] = last_id
+        checkpoint['patients'] += count
+        for model_type, value in written.items():
+            checkpoint['written'][model_type] += value
+        save_checkpoint(checkpoint_path, checkpoint)
+
+        elapsed = time.perf_counter() - started
+        rate = processed / elapsed if elapsed else 0
+        eta = (remaining - processed) / rate if rate else 0
+        print(f"  进度 {processed}/{remaining} ({processed * 100 / max(remaining, 1):.1f}%) "
+              f"{rate:.0f} 人/秒，预计剩余 {eta:.0f} 秒")
+        if progress is not None:
+            progress(processed, remaining)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            after_id = checkpoint['last_patient_id']
+            while True:
+                patients = fetch_patient_chunk(read_cursor, after_id, chunk_size, lmp_since)
+                if not patients:
+                    break
+                after_id = patients[-1]['id']
+                features = assemble_chunk(read_cursor, patients, today)
+                pending.append((after_id, len(patients), features, executor.submit(score_chunk, features)))
+
+                # 限制在途分块数量，控制内存
+                while len(pending) >= workers * 2:
+                    drain_one()
+
+            while pending:
+                drain_one()
+    finally:
+        read_cursor.close()
+        read_connection.close()
+        write_connection.close()
+
+    # 全部完成后删除检查点
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    elapsed = time.perf_counter() - started
+    print(f"✅ 完成: {checkpoint['patients']} 名患者，写入 {checkpoint['written']}，耗时 {elapsed:.1f} 秒")
+    return checkpoint
+
+def main():
+    parser = argparse.ArgumentParser(description="人群批量重新评分")
+    parser.add_argument("--chunk-size", type=int, default=RESCORE_CONFIG['chunk_size'])
+    parser.add_argument("--workers", type=int, default=RESCORE_CONFIG['workers'])
+    parser.add_argument("--checkpoint", default=RESCORE_CONFIG['checkpoint_path'])
+    parser.add_argument("--resume", action="store_true", help="从当天的检查点继续")
+    args = parser.parse_args()
+
+    run(args.chunk_size, args.workers, args.resume, args.checkpoint)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
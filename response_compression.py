@@ -0,0 +1,199 @@
+"""
+响应压缩模块
+管理端列表、详情和导出接口返回的 JSON/CSV 重复度高（每行 40 多个检查字段名），按请求头 Accept-Encoding
+协商压缩（安装 brotli 时优先 br，否则 gzip）：
+    - 只压缩 RESPONSE_COMPRESSION_PATHS 前缀下的接口（默认 /admin/），预测接口只做一次路径前缀判断即原样返回
+    - 小于 RESPONSE_COMPRESSION_MIN_BYTES 的响应不压缩；已带 Content-Encoding 的响应（压缩保存的文件）、
+      SSE 事件流、图片和压缩包等不压缩
+    - 超过 RESPONSE_COMPRESSION_THREAD_BYTES 的响应体（或流式响应的分块）在独立线程池中压缩，
+      线程数为 RESPONSE_COMPRESSION_WORKERS，压缩占用的 CPU 有上限，也不阻塞事件循环
+
+可压缩的接口都带 Vary: Accept-Encoding；ETag 为弱校验值（table_versions）时压缩前后仍然有效，
+强校验值（文件下载）在压缩后的响应中加上压缩方式后缀（encoded_etag），不同编码的表示不会互相匹配
+"""
+
+import asyncio
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from config import COMPRESSION_CONFIG
+
+try:
+    import brotli
+except ImportError:  # 未安装 brotli 时只使用 gzip
+    brotli = None
+
+# 服务端支持的压缩方式，客户端权重相同时按此顺序选择
+SUPPORTED_ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+# 不压缩的响应类型（已压缩或需要逐条推送）
+SKIPPED_CONTENT_TYPES = (
+    'text/event-stream', 'image/', 'video/', 'audio/', 'application/zip', 'application/gzip',
+    'application/zstd', 'application/octet-stream'
+)
+
+def accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    """解析 Accept-Encoding，返回 压缩方式 -> 权重（q 值）"""
+    accepted = {}
+    for item in accept_encoding.lower().split(','):
+        name, _, params = item.strip().partition(';')
+        name = name.strip()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name] = q
+    return accepted
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """按压缩方式区分的 ETag：强校验值 "x" 变为 "x-gzip"，弱校验值（W/）按语义等价不变"""
+    if encoding == 'identity' or etag.startswith('W/') or not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+def accepts(accept_encoding: str, encoding: str) -> bool:
+    """客户端是否接受该压缩方式（q=0 视为不接受，* 匹配未列出的方式）"""
+    accepted = accepted_encodings(accept_encoding)
+    return accepted.get(encoding, accepted.get('*', 0.0)) > 0
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """选择客户端接受且权重最高的压缩方式，都不接受时返回 None"""
+    accepted = accepted_encodings(accept_encoding)
+    best, best_q = None, 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        q = accepted.get(encoding, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+class _BrotliCompressor:
+    """brotli 压缩器，接口与 zlib 压缩器相同（compress/flush）"""
+
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=COMPRESSION_CONFIG['brotli_quality'])
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.finish()
+
+def new_compressor(encoding: str):
+    if encoding == 'br':
+        return _BrotliCompressor()
+    return zlib.compressobj(COMPRESSION_CONFIG['gzip_level'], zlib.DEFLATED, 31)
+
+def compress(encoding: str, body: bytes) -> bytes:
+    compressor = new_compressor(encoding)
+    return compressor.compress(body) + compressor.flush()
+
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=COMPRESSION_CONFIG['workers'], thread_name_prefix="compress"
+            )
+        return _executor
+
+async def _run(func, *args) -> bytes:
+    """大块数据在压缩线程池中执行，小块直接执行（切换线程的开销比压缩本身大）"""
+    if len(args[-1]) < COMPRESSION_CONFIG['thread_threshold']:
+        return func(*args)
+    return await asyncio.get_running_loop().run_in_executor(_get_executor(), func, *args)
+
+def _compressible(message) -> bool:
+    if message['status'] in (204, 206, 304):
+        return False
+    for name, value in message.get('headers', []):
+        name = name.lower()
+        if name == b'content-encoding':
+            return False
+        if name == b'content-type' and value.decode('latin-1').lower().startswith(SKIPPED_CONTENT_TYPES):
+            return False
+    return True
+
+def _with_headers(message, headers: List[tuple], drop: tuple = (), encoding: Optional[str] = None):
+    kept = [(name, value) for name, value in message.get('headers', []) if name.lower() not in drop]
+    if encoding is not None:
+        kept = [
+            (name, encoded_etag(value.decode('latin-1'), encoding).encode('latin-1') if name.lower() == b'etag' else value)
+            for name, value in kept
+        ]
+    if any(name.lower() == b'vary' and b'accept-encoding' in value.lower() for name, value in kept):
+        headers = [(name, value) for name, value in headers if name != b'vary']
+    return {**message, 'headers': kept + headers}
+
+class CompressionMiddleware:
+    """按 Accept-Encoding 压缩管理端接口的响应"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (scope['type'] != 'http' or not COMPRESSION_CONFIG['enabled']
+                or not scope['path'].startswith(COMPRESSION_CONFIG['path_prefixes'])):
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = dict(scope['headers']).get(b'accept-encoding', b'').decode('latin-1')
+        encoding = negotiate(accept_encoding) if accept_encoding else None
+        vary = [(b'vary', b'Accept-Encoding')]
+        start = None
+        compressor = None
+        passthrough = False
+
+        async def compressing_send(message):
+            nonlocal start, compressor, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message['type'] == 'http.response.start':
+                if encoding is None or not _compressible(message):
+                    passthrough = True
+                    await send(_with_headers(message, vary))
+                else:
+                    # 等到第一个响应体分块再决定是否压缩
+                    start = message
+                return
+            if message['type'] != 'http.response.body':
+                await send(message)
+                return
+
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+            if compressor is None:
+                if not more_body and len(body) < COMPRESSION_CONFIG['min_size']:
+                    passthrough = True
+                    await send(_with_headers(start, vary))
+                    await send(message)
+                    return
+                headers = vary + [(b'content-encoding', encoding.encode())]
+                compressor = new_compressor(encoding)
+                if not more_body:
+                    # 完整响应体一次压缩，给出压缩后的 Content-Length
+                    compressed = await _run(compress, encoding, body)
+                    headers.append((b'content-length', str(len(compressed)).encode()))
+                    await send(_with_headers(start, headers, drop=(b'content-length',), encoding=encoding))
+                    await send({'type': 'http.response.body', 'body': compressed})
+                    return
+                # 流式响应（导出文件等）逐块压缩，长度未知
+                await send(_with_headers(start, headers, drop=(b'content-length',), encoding=encoding))
+
+            data = await _run(compressor.compress, body) if body else b''
+            if not more_body:
+                data += compressor.flush()
+            if data or not more_body:
+                await send({'type': 'http.response.body', 'body': data, 'more_body': more_body})
+
+        await self.app(scope, receive, compressing_send)
\ No newline at end of file
@@ -4,17 +4,43 @@
 """
 
 import uvicorn
-from main import app
+from uvicorn.supervisors import Multiprocess
+from config import APP_CONFIG
+from shared_state import reset_shared_state
+
+class DrainingServer(uvicorn.Server):
+    """收到退出信号时先进入停机状态（新请求返回503、结束推送连接），再由 uvicorn 等待连接关闭"""
+
+    def handle_exit(self, sig, frame):
+        import lifecycle
+        lifecycle.begin_drain()
+        super().handle_exit(sig, frame)
+
+def serve():
+    """启动服务，worker 数大于 1 时以多进程方式运行"""
+    config = uvicorn.Config(
+        "main:app",
+        host=APP_CONFIG['host'],
+        port=APP_CONFIG['port'],
+        workers=APP_CONFIG['workers'],
+        log_level="info",
+        timeout_graceful_shutdown=int(APP_CONFIG['shutdown_timeout'])
+    )
+    server = DrainingServer(config)
+
+    # 清除上次运行遗留的共享状态，再启动 worker
+    reset_shared_state()
+    if config.workers > 1:
+        Multiprocess(config, target=server.run, sockets=[config.bind_socket()]).run()
+    else:
+        server.run()
 
 if __name__ == "__main__":
+    port = APP_CONFIG['port']
     print("🚀 启动妊娠期高血压母婴监测及结局预测平台 API...")
-    print("📖 API 文档地址: http://localhost:8000/docs")
-    print("🔍 健康检查: http://localhost:8000/health")
-    print("🌐 根路径: http://localhost:8000/")
+    print(f"📖 API 文档地址: http://localhost:{port}/docs")
+    print(f"🔍 健康检查: http://localhost:{port}/health")
+    print(f"🌐 根路径: http://localhost:{port}/")
+    print(f"⚙️ worker 进程数: {APP_CONFIG['workers']}")
     
-    uvicorn.run(
-        app,
-        host="0.0.0.0",
-        port=8000,
-        log_level="info"
-    ) 
\ No newline at end of file
+    serve() 
\ No newline at end of file
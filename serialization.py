@@ -0,0 +1,51 @@
+"""
+JSON序列化模块
+提供直接将数据库行写为JSON字节的快速序列化路径
+"""
+
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Optional
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # 未安装 orjson 时回退到标准库
+    orjson = None
+
+def _default(obj: Any) -> Any:
+    """处理JSON原生不支持的类型，输出格式与 Pydantic 的 JSON 模式一致"""
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, (bytes, bytearray)):
+        return obj.decode('utf-8', errors='replace')
+    raise TypeError(f"无法序列化类型: {type(obj).__name__}")
+
+def dumps(obj: Any) -> bytes:
+    """序列化为紧凑的UTF-8 JSON字节"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(
+        obj, default=_default, ensure_ascii=False, separators=(",", ":")
+    ).encode('utf-8')
+
+class FastJSONResponse(Response):
+    """跳过 response_model 校验、直接输出JSON字节的响应"""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
+
+def patient_rows_response(
+    rows: Iterable[Dict[str, Any]], headers: Optional[Dict[str, str]] = None
+) -> FastJSONResponse:
+    """将数据库行按 PatientDataResponse 的格式直接编码，不逐行构造模型"""
+    return FastJSONResponse(dumps([
+        {"id": row['id'], "created_at": row['created_at'], "data": row}
+        for row in rows
+    ]), headers=headers)
\ No newline at end of file
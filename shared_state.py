@@ -0,0 +1,184 @@
+"""
+多进程共享状态模块
+多 worker 部署时，同一主机上的 worker 通过共享内存文件（mmap + 文件锁）汇总计数器、同步缓存失效；
+单 worker 或不支持 fcntl 的平台使用进程内内存，行为与单进程部署一致
+"""
+
+import mmap
+import os
+import shutil
+import struct
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+from config import APP_CONFIG
+
+try:
+    import fcntl
+except ImportError:  # Windows 不支持文件锁，退回进程内模式
+    fcntl = None
+
+def is_shared() -> bool:
+    """是否启用跨 worker 共享"""
+    return APP_CONFIG['workers'] > 1 and fcntl is not None
+
+def reset_shared_state() -> None:
+    """清空共享状态目录，由启动脚本在创建 worker 之前调用"""
+    shutil.rmtree(APP_CONFIG['shared_state_dir'], ignore_errors=True)
+
+class _Region:
+    """定长内存区域：共享模式下映射到共享文件，否则（或 shared=False）为进程内 bytearray"""
+
+    def __init__(self, name: str, size: int, shared: bool = True):
+        self._thread_lock = threading.RLock()
+        self._fd = None
+        if not shared or not is_shared():
+            self.buffer = bytearray(size)
+            return
+
+        os.makedirs(APP_CONFIG['shared_state_dir'], exist_ok=True)
+        path = os.path.join(APP_CONFIG['shared_state_dir'], f"{name}.shm")
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            # 第一个打开的 worker 负责扩展文件（新扩展部分为零）
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self.buffer = mmap.mmap(self._fd, size)
+
+    @contextmanager
+    def locked(self):
+        """进程内线程锁 + 跨进程文件锁"""
+        with self._thread_lock:
+            if self._fd is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield self.buffer
+            finally:
+                if self._fd is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+class SharedCounters:
+    """按键分配固定槽位的数值记录，各 worker 读写同一份数据（字段格式同 struct，如 'qdd'）"""
+
+    def __init__(self, name: str, keys: List[str], fields: str):
+        self._struct = struct.Struct('<' + fields)
+        self._offsets = {key: i * self._struct.size for i, key in enumerate(keys)}
+        self._region = _Region(name, self._struct.size * len(keys))
+
+    def read(self, key: str) -> Tuple:
+        with self._region.locked() as buffer:
+            return self._struct.unpack_from(buffer, self._offsets[key])
+
+    def read_all(self) -> Dict[str, Tuple]:
+        with self._region.locked() as buffer:
+            return {key: self._struct.unpack_from(buffer, offset) for key, offset in self._offsets.items()}
+
+    def write(self, key: str, values: Tuple) -> None:
+        with self._region.locked() as buffer:
+            self._struct.pack_into(buffer, self._offsets[key], *values)
+
+    def update(self, key: str, fn: Callable[[Tuple], Optional[Tuple]]) -> None:
+        """原子地读取-修改-写回，fn 返回 None 表示不修改"""
+        offset = self._offsets[key]
+        with self._region.locked() as buffer:
+            values = fn(self._struct.unpack_from(buffer, offset))
+            if values is not None:
+                self._struct.pack_into(buffer, offset, *values)
+
+    def add(self, key: str, *deltas: float) -> None:
+        """各字段累加"""
+        self.update(key, lambda values: tuple(v + d for v, d in zip(values, deltas)))
+
+class SharedRecords:
+    """
+    定长记录数组（字段格式同 struct），按序号原子地读取-修改-写回，用于键数量很大、按哈希定位的状态表。
+    shared=False 时即使多 worker 部署也只使用进程内内存
+    """
+
+    def __init__(self, name: str, count: int, fields: str, shared: bool = True):
+        self._struct = struct.Struct('<' + fields)
+        self.count = count
+        self.nbytes = self._struct.size * count
+        self._region = _Region(name, self.nbytes, shared)
+
+    def update(self, index: int, fn: Callable[[Tuple], Optional[Tuple]]) -> None:
+        """fn 返回 None 表示不修改"""
+        offset = index * self._struct.size
+        with self._region.locked() as buffer:
+            values = fn(self._struct.unpack_from(buffer, offset))
+            if values is not None:
+                self._struct.pack_into(buffer, offset, *values)
+
+class InvalidationLog:
+    """
+    跨 worker 的缓存失效日志
+
+    环形缓冲区保存最近的 (序号, 键, 写入进程)，各 worker 读取缓存前调用 poll() 回放其它 worker 写入的失效；
+    落后超过缓冲区容量时通知订阅者清空整个缓存。单 worker 模式下 publish/poll 均为空操作。
+    """
+    _HEADER = struct.Struct('<q')
+    _ENTRY = struct.Struct('<qqi')
+    # 日志中表示「清空全部」的键
+    _ALL = -1
+
+    def __init__(self, name: str, capacity: int):
+        self._capacity = capacity
+        self._callbacks: List[Callable[[Optional[int]], None]] = []
+        self._poll_lock = threading.Lock()
+        self._region = _Region(name, self._HEADER.size + self._ENTRY.size * capacity) if is_shared() else None
+        # 只关心本 worker 启动之后的失效
+        self._seen = self._head() if self._region is not None else 0
+
+    def _head(self) -> int:
+        return self._HEADER.unpack_from(self._region.buffer, 0)[0]
+
+    def subscribe(self, callback: Callable[[Optional[int]], None]) -> None:
+        """注册失效回调，参数为键，None 表示清空全部"""
+        self._callbacks.append(callback)
+
+    def publish(self, key: Optional[int]) -> None:
+        """通知其它 worker 该键已失效，None 表示清空全部（本 worker 的缓存由调用方自行处理）"""
+        if self._region is None:
+            return
+        with self._region.locked() as buffer:
+            seq = self._HEADER.unpack_from(buffer, 0)[0] + 1
+            offset = self._HEADER.size + (seq % self._capacity) * self._ENTRY.size
+            self._ENTRY.pack_into(buffer, offset, seq, self._ALL if key is None else key, os.getpid())
+            self._HEADER.pack_into(buffer, 0, seq)
+
+    def invalidate_all(self) -> None:
+        """清空本进程订阅者的全部缓存，并通知其它 worker 清空（批量更新已有记录之后）"""
+        for callback in self._callbacks:
+            callback(None)
+        self.publish(None)
+
+    def poll(self) -> None:
+        """回放自上次调用以来其它 worker 发布的失效"""
+        if self._region is None or self._head() == self._seen:
+            return
+
+        with self._poll_lock:
+            with self._region.locked() as buffer:
+                head = self._HEADER.unpack_from(buffer, 0)[0]
+                overflow = head - self._seen > self._capacity
+                keys = []
+                if not overflow:
+                    for seq in range(self._seen + 1, head + 1):
+                        offset = self._HEADER.size + (seq % self._capacity) * self._ENTRY.size
+                        _, key, pid = self._ENTRY.unpack_from(buffer, offset)
+                        if pid != os.getpid():
+                            keys.append(None if key == self._ALL else key)
+            self._seen = head
+
+        for callback in self._callbacks:
+            if overflow:
+                callback(None)
+            else:
+                for key in keys:
+                    callback(key)
+
+# 患者数据写入后的缓存失效（特征缓存、血压时间序列）
+patient_invalidations = InvalidationLog('patient_invalidations', APP_CONFIG['invalidation_log_size'])
\ No newline at end of file
@@ -0,0 +1,293 @@
+"""
+存储后端模块
+MySQL（PyMySQL）与嵌入式 SQLite（WAL 模式）两种后端提供相同的连接接口：
+SQL 统一使用 %s 占位符，游标可按字典返回行，日期字段统一返回 date/datetime。
+SQLite 后端适合单机部署、开发和基准测试，不需要单独的数据库服务
+"""
+
+import math
+import os
+import re
+import sqlite3
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Optional, Sequence
+from config import DB_CONFIG, STORAGE_CONFIG
+
+# SQLite 表结构文件，首次连接时执行
+SQLITE_SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'init_sqlite.sql')
+
+# MySQL 主键/唯一键冲突错误码
+MYSQL_DUPLICATE_ENTRY = 1062
+
+# 语句开头的 SELECT（MAX_EXECUTION_TIME 提示只能写在最外层 SELECT 之后）
+_LEADING_SELECT = re.compile(r'^\s*SELECT\b', re.IGNORECASE)
+
+class MySQLBackend:
+    """MySQL 后端，连接参数取自 DB_CONFIG"""
+    name = 'mysql'
+
+    def __init__(self):
+        # 只有 MySQL 后端导入 PyMySQL，SQLite 部署启动时不导入
+        import pymysql.cursors
+        self._pymysql = pymysql
+        self.errors = (pymysql.Error,)
+
+    def connect(self):
+        return self._pymysql.connect(**DB_CONFIG)
+
+    def cursor(self, connection, as_dict: bool = False, stream: bool = False):
+        """as_dict 按字典返回行；stream 为无缓冲游标，逐行从服务端读取"""
+        cursors = self._pymysql.cursors
+        if stream:
+            cursor_class = cursors.SSDictCursor if as_dict else cursors.SSCursor
+        else:
+            cursor_class = cursors.DictCursor if as_dict else cursors.Cursor
+        return connection.cursor(cursor_class)
+
+    def max_connections(self) -> Optional[int]:
+        """服务端连接数上限，用于计算连接池大小"""
+        connection = self.connect()
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SHOW VARIABLES LIKE 'max_connections'")
+            row = cursor.fetchone()
+            cursor.close()
+            return int(row[1]) if row else None
+        finally:
+            connection.close()
+
+    def is_duplicate_key(self, error: Exception) -> bool:
+        return isinstance(error, self._pymysql.err.IntegrityError) and error.args[0] == MYSQL_DUPLICATE_ENTRY
+
+    def with_statement_timeout(self, sql: str, seconds: float) -> str:
+        """为只读查询加上服务端执行时间上限（MAX_EXECUTION_TIME 优化器提示，超时后服务端终止语句）"""
+        milliseconds = max(1, int(seconds * 1000))
+        return _LEADING_SELECT.sub(f"SELECT /*+ MAX_EXECUTION_TIME({milliseconds}) */", sql, count=1)
+
+    def interrupt(self, connection) -> None:
+        """由 MAX_EXECUTION_TIME 在服务端终止，无需从客户端中断"""
+
+    def upsert_id(self, cursor, table: str, columns: Sequence[str], values: Sequence,
+                  key_column: str, update: str, update_params: Sequence = ()) -> int:
+        """按唯一键插入或更新（update 为 SET 子句），返回记录 id"""
+        placeholders = ", ".join(["%s"] * len(columns))
+        # LAST_INSERT_ID(id) 让 lastrowid 在更新时返回已有记录的 id
+        cursor.execute(f"""
+        INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})
+        ON DUPLICATE KEY UPDATE {update}, id = LAST_INSERT_ID(id)
+        """, (*values, *update_params))
+        return cursor.lastrowid
+
+    def insert_ignore(self, cursor, table: str, columns: Sequence[str], rows: Sequence[Sequence]) -> int:
+        """批量插入，与已有记录唯一键冲突的行跳过（不报错），返回实际插入的行数"""
+        placeholders = ", ".join(["%s"] * len(columns))
+        # 只忽略唯一键冲突（INSERT IGNORE 还会忽略数据截断等错误）
+        cursor.executemany(f"""
+        INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})
+        ON DUPLICATE KEY UPDATE id = id
+        """, rows)
+        return max(cursor.rowcount, 0)
+
+# SQLite 对日期表达式（DATE()、MAX(created_at) 等）只返回文本，按 MySQL 的习惯转换为 date/datetime
+_DATE_TEXT = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+_DATETIME_TEXT = re.compile(r'^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}(\.\d{1,6})?$')
+
+def _from_sqlite(value):
+    if isinstance(value, str) and 10 <= len(value) <= 26:
+        if _DATE_TEXT.match(value):
+            return date.fromisoformat(value)
+        if _DATETIME_TEXT.match(value):
+            return datetime.fromisoformat(value)
+    return value
+
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(sep=' '))
+sqlite3.register_adapter(Decimal, float)
+
+def _to_sqlite_sql(sql: str) -> str:
+    """%s 占位符转换为 ?，%% 转换为 %"""
+    return sql.replace('%s', '?').replace('%%', '%')
+
+class SQLiteCursor:
+    """与 PyMySQL 游标相同用法的 SQLite 游标"""
+
+    def __init__(self, cursor: sqlite3.Cursor, as_dict: bool):
+        self._cursor = cursor
+        self._as_dict = as_dict
+
+    @property
+    def lastrowid(self) -> Optional[int]:
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self) -> int:
+        return self._cursor.rowcount
+
+    def execute(self, sql: str, params: Optional[Sequence] = None):
+        if params is None:
+            self._cursor.execute(sql)
+        else:
+            self._cursor.execute(_to_sqlite_sql(sql), tuple(params))
+        return self._cursor.rowcount
+
+    def executemany(self, sql: str, seq_of_params):
+        self._cursor.executemany(_to_sqlite_sql(sql), [tuple(params) for params in seq_of_params])
+        return self._cursor.rowcount
+
+    def _convert(self, row):
+        if row is None:
+            return None
+        values = [_from_sqlite(value) for value in row]
+        if self._as_dict:
+            return {column[0]: value for column, value in zip(self._cursor.description, values)}
+        return tuple(values)
+
+    def fetchone(self):
+        return self._convert(self._cursor.fetchone())
+
+    def fetchmany(self, size: int = 1):
+        return [self._convert(row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._convert(row) for row in self._cursor.fetchall()]
+
+    def __iter__(self):
+        for row in self._cursor:
+            yield self._convert(row)
+
+    def close(self) -> None:
+        self._cursor.close()
+
+class SQLiteConnection:
+    """与 PyMySQL 连接相同用法的 SQLite 连接（连接池按 open/ping/rollback 管理）"""
+
+    def __init__(self, connection: sqlite3.Connection):
+        self._connection = connection
+        self.open = True
+
+    def cursor(self, as_dict: bool = False) -> SQLiteCursor:
+        return SQLiteCursor(self._connection.cursor(), as_dict)
+
+    def commit(self) -> None:
+        self._connection.commit()
+
+    def rollback(self) -> None:
+        self._connection.rollback()
+
+    def ping(self, reconnect: bool = True) -> None:
+        """嵌入式数据库无需检查连接"""
+
+    def interrupt(self) -> None:
+        """中断该连接上正在执行的语句（可在其它线程调用，语句抛出 OperationalError）"""
+        self._connection.interrupt()
+
+    def set_progress_handler(self, handler, n: int) -> None:
+        """每执行 n 条虚拟机指令调用一次 handler（查询计划检查用来统计查询的工作量）"""
+        self._connection.set_progress_handler(handler, n)
+
+    def close(self) -> None:
+        self.open = False
+        self._connection.close()
+
+class SQLiteBackend:
+    """嵌入式 SQLite 后端：WAL 模式下读写互不阻塞，写入按库级写锁串行"""
+    name = 'sqlite'
+    errors = (sqlite3.Error,)
+
+    def __init__(self, path: str):
+        self.path = path
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def connect(self) -> SQLiteConnection:
+        connection = sqlite3.connect(
+            self.path, timeout=STORAGE_CONFIG['sqlite_busy_timeout'], check_same_thread=False
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        # 未启用数学函数编译选项的 SQLite 没有 FLOOR
+        try:
+            connection.execute("SELECT FLOOR(1.5)")
+        except sqlite3.OperationalError:
+            connection.create_function("FLOOR", 1, lambda x: None if x is None else math.floor(x), deterministic=True)
+        self._ensure_schema(connection)
+        return SQLiteConnection(connection)
+
+    def _ensure_schema(self, connection: sqlite3.Connection) -> None:
+        if self._schema_ready:
+            return
+        with self._schema_lock:
+            if not self._schema_ready:
+                with open(SQLITE_SCHEMA_PATH, encoding='utf-8') as f:
+                    schema = f.read()
+                _add_missing_columns(connection, schema)
+                connection.executescript(schema)
+                self._schema_ready = True
+
+    def cursor(self, connection: SQLiteConnection, as_dict: bool = False, stream: bool = False) -> SQLiteCursor:
+        # SQLite 游标本身按需逐行读取
+        return connection.cursor(as_dict)
+
+    def max_connections(self) -> Optional[int]:
+        """没有服务端连接上限"""
+        return None
+
+    def is_duplicate_key(self, error: Exception) -> bool:
+        return isinstance(error, sqlite3.IntegrityError) and 'UNIQUE' in str(error)
+
+    def with_statement_timeout(self, sql: str, seconds: float) -> str:
+        """SQLite 没有语句超时设置，超时后由调用方 interrupt()"""
+        return sql
+
+    def interrupt(self, connection) -> None:
+        connection.interrupt()
+
+    def upsert_id(self, cursor, table: str, columns: Sequence[str], values: Sequence,
+                  key_column: str, update: str, update_params: Sequence = ()) -> int:
+        placeholders = ", ".join(["%s"] * len(columns))
+        cursor.execute(f"""
+        INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})
+        ON CONFLICT ({key_column}) DO UPDATE SET {update}
+        RETURNING id
+        """, (*values, *update_params))
+        return cursor.fetchone()[0]
+
+    def insert_ignore(self, cursor, table: str, columns: Sequence[str], rows: Sequence[Sequence]) -> int:
+        placeholders = ", ".join(["%s"] * len(columns))
+        cursor.executemany(f"""
+        INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})
+        ON CONFLICT DO NOTHING
+        """, rows)
+        return max(cursor.rowcount, 0)
+
+def _add_missing_columns(connection: sqlite3.Connection, schema: str) -> None:
+    """已有的库缺少 schema 中新增的列时补齐（对应 MySQL 迁移中的 ADD COLUMN），之后再建索引"""
+    reference = sqlite3.connect(':memory:')
+    try:
+        reference.executescript(schema)
+        tables = [row[0] for row in reference.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        for table in tables:
+            existing = {row[1] for row in connection.execute(f"PRAGMA table_info({table})")}
+            if not existing:
+                continue
+            for _, name, column_type, not_null, default, _ in reference.execute(f"PRAGMA table_info({table})"):
+                if name not in existing:
+                    definition = f"{name} {column_type}"
+                    if default is not None:
+                        definition += f" DEFAULT {default}"
+                    if not_null:
+                        definition += " NOT NULL"
+                    connection.execute(f"ALTER TABLE {table} ADD COLUMN {definition}")
+        connection.commit()
+    finally:
+        reference.close()
+
+def create_backend():
+    """按 DB_BACKEND 创建存储后端"""
+    if STORAGE_CONFIG['backend'] == 'mysql':
+        return MySQLBackend()
+    if STORAGE_CONFIG['backend'] == 'sqlite':
+        return SQLiteBackend(STORAGE_CONFIG['sqlite_path'])
+    raise ValueError(f"不支持的存储后端: {STORAGE_CONFIG['backend']}（可选 mysql、sqlite）")
\ No newline at end of file
@@ -0,0 +1,178 @@
+"""
+数据表版本模块
+在写入时维护各表的版本号（行数 + 最新写入时间），为管理端读接口提供 ETag / Last-Modified 校验。
+原地更新已有记录的批量任务（派生特征回填等）不改变行数和 created_at，完成后调用 bump_data_version
+在 data_versions 中递增该表的数据版本、更新修改时间，各进程在下次从数据库加载表版本时生效。
+预测记录 compact 模式下重复的预测只更新参数记录的使用次数、在 prediction_events 记一条事件，
+预测表的版本按读取时的数据源（完整记录 + 事件）计算，与 prediction_source 返回的行一致
+"""
+
+import hashlib
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, List, Optional, Tuple
+from fastapi import Request, Response
+from config import CACHE_CONFIG
+from database import get_db_connection, close_db_connection
+from prediction_audit import PREDICTION_COLUMNS, is_compact, model_type_of
+from shared_state import SharedCounters
+
+# 维护版本的数据表
+VERSIONED_TABLES = [
+    'patient_general_info',
+    'patient_lab_imaging',
+    'patient_home_monitoring',
+    'model_fgr_params',
+    'model_fgr_neonatal_params',
+    'model_maternal_cox_params',
+    'model_neonatal_cox_params'
+]
+
+# 表名 -> (行数, 最新写入时间戳, 从数据库加载的时间戳, 数据版本)，时间戳为 0 表示无值/未加载；多 worker 时各进程共享
+_table_versions = SharedCounters('table_versions', VERSIONED_TABLES, 'qddq')
+
+def record_write(table: str) -> None:
+    """插入成功后更新表版本（O(1)，不访问数据库）"""
+    def bump(version: Tuple) -> Optional[Tuple]:
+        count, _, loaded_at, data_version = version
+        if not loaded_at:
+            # 尚未加载过的表在下次读取时从数据库初始化
+            return None
+        return count + 1, time.time(), loaded_at, data_version
+
+    _table_versions.update(table, bump)
+
+def bump_data_version(connection, table: str) -> None:
+    """原地更新表中已有记录后递增该表的数据版本（写入 data_versions，调用方的连接上提交）"""
+    cursor = connection.cursor()
+    now = datetime.now().replace(microsecond=0)
+    cursor.execute(
+        "UPDATE data_versions SET version = version + 1, updated_at = %s WHERE table_name = %s", (now, table)
+    )
+    if cursor.rowcount == 0:
+        cursor.execute("INSERT INTO data_versions (table_name, version, updated_at) VALUES (%s, 1, %s)", (table, now))
+    connection.commit()
+    cursor.close()
+    # 本进程下次读取时重新加载；其它进程在 validator_ttl 到期后重新加载
+    _table_versions.update(table, lambda version: (*version[:2], 0.0, version[3]))
+
+def _version_query(table: str) -> str:
+    """
+    表的行数、最新写入时间和数据版本；compact 模式下预测表按完整记录和该模型的预测事件分别统计，
+    data_versions 中的一行计入数据版本和修改时间
+    """
+    if table not in PREDICTION_COLUMNS or not is_compact():
+        query = f"SELECT '{table}', COUNT(*), MAX(created_at), 0 FROM {table}"
+    else:
+        query = (
+            f"SELECT '{table}', COUNT(*), MAX(created_at), 0 FROM {table} WHERE input_hash IS NULL"
+            f" UNION ALL SELECT '{table}', COUNT(*), MAX(created_at), 0 FROM prediction_events"
+            f" WHERE model_type = '{model_type_of(table)}'"
+        )
+    return query + f" UNION ALL SELECT '{table}', 0, updated_at, version FROM data_versions WHERE table_name = '{table}'"
+
+def _load_versions(tables: List[str]) -> bool:
+    """从数据库加载表的行数、最新写入时间和数据版本（每张表一条聚合语句）"""
+    connection = get_db_connection()
+    if not connection:
+        return False
+
+    try:
+        cursor = connection.cursor()
+        cursor.execute(" UNION ALL ".join(_version_query(table) for table in tables))
+        loaded_at = time.time()
+        # 每张表有多行（记录、compact 模式下的事件、data_versions），合并为一个版本
+        versions: Dict[str, Tuple[int, float, int]] = {}
+        for table, count, last_modified, data_version in cursor.fetchall():
+            timestamp = last_modified.timestamp() if last_modified else 0.0
+            previous_count, previous_timestamp, previous_version = versions.get(table, (0, 0.0, 0))
+            versions[table] = (
+                previous_count + count, max(previous_timestamp, timestamp), previous_version + data_version
+            )
+        for table, (count, timestamp, data_version) in versions.items():
+            _table_versions.write(table, (count, timestamp, loaded_at, data_version))
+        cursor.close()
+        return True
+    except Exception as e:
+        print(f"加载表版本失败: {e}")
+        return False
+    finally:
+        close_db_connection(connection)
+
+def get_versions(tables: List[str]) -> Optional[Dict[str, dict]]:
+    """获取表版本，未加载或超过 validator_ttl 的表会重新从数据库加载"""
+    ttl = CACHE_CONFIG['validator_ttl']
+    now = time.time()
+    stale = []
+    for table in tables:
+        _, _, loaded_at, _ = _table_versions.read(table)
+        if not loaded_at or (ttl > 0 and now - loaded_at > ttl):
+            stale.append(table)
+
+    if stale and not _load_versions(stale):
+        return None
+
+    versions = {}
+    for table in tables:
+        count, last_modified, loaded_at, data_version = _table_versions.read(table)
+        versions[table] = {
+            'count': count,
+            'last_modified': datetime.fromtimestamp(last_modified) if last_modified else None,
+            'loaded_at': loaded_at,
+            'data_version': data_version
+        }
+    return versions
+
+def _http_date(value: datetime) -> str:
+    """转换为 HTTP 日期格式（无时区的时间按本地时间处理）"""
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """弱比较 If-None-Match 与当前 ETag"""
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    return any((tag[2:] if tag.startswith("W/") else tag) == opaque for tag in candidates)
+
+def check_conditional(request: Request, tables: List[str]) -> Tuple[Optional[Response], Dict[str, str]]:
+    """
+    计算请求的校验值并处理条件请求
+
+    返回 (304响应或None, 需要附加到正常响应上的缓存头)
+    """
+    versions = get_versions(tables)
+    if versions is None:
+        return None, {}
+
+    # ETag 由请求路径、查询参数和相关表版本共同决定
+    digest = hashlib.sha1(request.url.path.encode('utf-8'))
+    digest.update(str(sorted(request.query_params.multi_items())).encode('utf-8'))
+    for table in sorted(versions):
+        version = versions[table]
+        digest.update(f"{table}:{version['count']}:{version['last_modified']}:{version['data_version']}".encode('utf-8'))
+    etag = f'W/"{digest.hexdigest()[:20]}"'
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    modified_times = [v['last_modified'] for v in versions.values() if v['last_modified']]
+    last_modified = max(modified_times) if modified_times else None
+    if last_modified:
+        headers["Last-Modified"] = _http_date(last_modified)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers), headers
+        return None, headers
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+            if last_modified.astimezone(timezone.utc).replace(microsecond=0) <= since:
+                return Response(status_code=304, headers=headers), headers
+        except (TypeError, ValueError):
+            pass
+
+    return None, headers
\ No newline at end of file
@@ -3,7 +3,12 @@
 """
 
 from datetime import date
+from typing import Any, Callable, Optional
+import asyncio
+import contextvars
+import functools
 import math
+import re
 
 def calculate_gestational_days(lmp_date: date, current_date: date) -> int:
     """计算孕天数"""
@@ -11,4 +16,26 @@ def calculate_gestational_days(lmp_date: date, current_date: date) -> int:
 
 def calculate_map(sbp: float, dbp: float) -> float:
     """计算平均动脉压"""
-    return dbp + (sbp - dbp) / 3 
\ No newline at end of file
+    return dbp + (sbp - dbp) / 3 
+
+def calculate_bmi(weight: float, height: float) -> float:
+    """计算BMI（体重 kg，身高 cm）"""
+    return weight / (height / 100) ** 2
+
+# 孕周文本："32"、"32+3"、"32周"、"32周3天"、"32周+3天"、"32w3d"
+_GESTATIONAL_WEEKS = re.compile(r'^\s*(\d{1,2})\s*(?:周|w|W)?\s*(?:\+?\s*([0-6])\s*(?:天|d|D)?)?\s*$')
+
+def parse_gestational_weeks(text: Optional[str]) -> Optional[int]:
+    """把孕周文本解析为孕天数，无法识别时返回 None"""
+    if not text:
+        return None
+    match = _GESTATIONAL_WEEKS.match(text)
+    if not match:
+        return None
+    return int(match.group(1)) * 7 + int(match.group(2) or 0)
+
+async def to_thread(func: Callable[..., Any], *args) -> Any:
+    """在事件循环的默认线程池中执行同步函数并保留当前的 contextvars（同 Python 3.9 的 asyncio.to_thread）"""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(None, functools.partial(context.run, func, *args))
\ No newline at end of file